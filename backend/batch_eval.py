@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+批量评测（不推送事件）
+
+离线评测不需要逐 token 推送：每场比赛由 run_match_headless 执行（发言和裁判使用非流式调用，不构造事件），
+按并发上限同时进行多场；ELO 按比赛结束顺序串行更新，比赛结果只在结束时登记一次，经写缓冲批量落库
+
+输入为 JSONL，每行一个比赛请求（字段同 MatchRequest）；输出每场比赛的摘要（JSONL）和吞吐统计。
+服务进程中通过 POST /api/batch/matches 提交，GET /api/batch/{batch_id} 查询进度
+
+使用方法:
+    python batch_eval.py --input matches.jsonl --output results.jsonl --concurrency 16
+    python batch_eval.py --input matches.jsonl --repeat 5    # 每个比赛请求重复 5 场
+    python batch_eval.py --auto 200 --rounds 2                # 由配对器（matchmaker）安排 200 场
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Iterable, Iterator, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import BATCH_EVAL_CONFIG
+from backend.elo import update_elo_ratings
+from backend.log import logger
+from backend.matchmaker import load_matchmaker, record_match_outcome, release_match
+from backend.models import MatchRequest
+from backend.persistence import get_write_buffer
+from backend.provider_router import ModelUnavailableError, get_provider_router
+from backend.tournament import run_match_headless
+from backend.utils import generate_id
+
+
+class BatchRun:
+    """一批比赛的执行状态和结果摘要"""
+
+    def __init__(self, requests: Iterable[MatchRequest], concurrency: int, batch_id: Optional[str] = None,
+                 total: Optional[int] = None):
+        """
+        requests: 比赛请求列表，或按需生成请求的迭代器（例如配对器，需同时给出 total）
+        """
+        self.batch_id = batch_id or generate_id()
+        self.requests = requests
+        self.total = len(requests) if total is None else total
+        self.concurrency = max(1, concurrency)
+        self.status = "PENDING"
+        self.results: List[dict] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._elo_lock: Optional[asyncio.Lock] = None
+
+    async def run(self, on_result: Optional[Callable[[dict], None]] = None) -> "BatchRun":
+        """运行全部比赛，每场结束时回调 on_result(摘要)"""
+        self.status = "RUNNING"
+        self.started_at = time.time()
+        # 并发比赛可能涉及同一模型，ELO 的读取-计算-写入串行执行
+        self._elo_lock = asyncio.Lock()
+        pending = iter(enumerate(self.requests))
+
+        async def worker():
+            for index, request in pending:
+                summary = await self._run_one(index, request)
+                self.results.append(summary)
+                if on_result is not None:
+                    on_result(summary)
+
+        try:
+            await asyncio.gather(*[worker() for _ in range(min(self.concurrency, self.total))])
+            self.status = "FINISHED"
+        except asyncio.CancelledError:
+            self.status = "CANCELLED"
+            raise
+        finally:
+            self.finished_at = time.time()
+            await get_write_buffer().flush()
+        logger.info(f"批量评测完成: {self.batch_id}, {self.get_stats()}")
+        return self
+
+    async def _run_one(self, index: int, request: MatchRequest) -> dict:
+        started = time.perf_counter()
+        summary = {
+            "index": index,
+            "match_id": None,
+            "topic": request.topic,
+            "proponent": request.proponent_model,
+            "opponent": request.opponent_model,
+            "status": None,
+            "winner": None,
+            "final_scores": None,
+            "elo": None,
+            "errors": [],
+        }
+        try:
+            match, errors = await run_match_headless(
+                topic=request.topic,
+                topic_difficulty=request.topic_difficulty,
+                prop_model_id=request.proponent_model,
+                opp_model_id=request.opponent_model,
+                prop_personality=request.proponent_personality,
+                opp_personality=request.opponent_personality,
+                rounds=request.rounds,
+                judges=request.judges,
+                enabled_tools=request.enabled_tools,
+                user_id=request.user_id,
+                parallel_openings=request.parallel_openings
+            )
+        except ModelUnavailableError as e:
+            release_match(request.proponent_model, request.opponent_model)
+            summary.update(status="SKIPPED", errors=[str(e)])
+        except Exception as e:
+            logger.error(f"批量评测比赛失败 (#{index}): {type(e).__name__} - {e}", exc_info=True)
+            release_match(request.proponent_model, request.opponent_model)
+            summary.update(status="FAILED", errors=[f"{type(e).__name__}: {e}"])
+        else:
+            elo_changes = None
+            async with self._elo_lock:
+                if match.result is not None and request.proponent_model != request.opponent_model:
+                    try:
+                        elo_changes = await update_elo_ratings(match)
+                    except Exception as e:
+                        logger.error(f"ELO 更新失败: {type(e).__name__} - {e}", exc_info=True)
+                        errors.append(f"ELO更新失败: {e}")
+                # 配对器按 ELO 更新的顺序同步评分
+                await record_match_outcome(match, elo_changes)
+            get_write_buffer().record(match, elo_changes=elo_changes)
+            summary.update(
+                match_id=match.match_id,
+                status=match.status,
+                winner=match.result.winner if match.result else None,
+                final_scores=match.result.final_scores if match.result else None,
+                errors=errors,
+            )
+            if elo_changes and not elo_changes["proponent"].get("skipped"):
+                summary["elo"] = [elo_changes["proponent"]["change"], elo_changes["opponent"]["change"]]
+        summary["elapsed"] = round(time.perf_counter() - started, 3)
+        return summary
+
+    def get_stats(self) -> dict:
+        elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0.0
+        completed = len(self.results)
+        return {
+            "batch_id": self.batch_id,
+            "status": self.status,
+            "total": self.total,
+            "completed": completed,
+            "concurrency": self.concurrency,
+            "by_status": dict(Counter(r["status"] for r in self.results)),
+            "elapsed": round(elapsed, 1),
+            "matches_per_hour": round(completed / elapsed * 3600, 1) if elapsed > 0 else 0.0,
+        }
+
+
+# 服务进程中提交的批次（保留最近结束的 max_retained 个供查询）
+_batches: "OrderedDict[str, BatchRun]" = OrderedDict()
+
+
+def start_batch(requests: List[MatchRequest], concurrency: Optional[int] = None) -> BatchRun:
+    """在后台任务中运行一批比赛"""
+    batch = BatchRun(requests, concurrency or BATCH_EVAL_CONFIG["concurrency"])
+    batch.task = asyncio.create_task(batch.run())
+    _batches[batch.batch_id] = batch
+    finished = [b for b in _batches.values() if b.task.done()]
+    for old in finished[:max(0, len(finished) - BATCH_EVAL_CONFIG["max_retained"])]:
+        _batches.pop(old.batch_id, None)
+    logger.info(f"批量评测已提交: {batch.batch_id}, {len(requests)} 场, 并发 {batch.concurrency}")
+    return batch
+
+
+def get_batch(batch_id: str) -> Optional[BatchRun]:
+    return _batches.get(batch_id)
+
+
+async def cancel_batches():
+    """取消进行中的批次（服务关闭时调用），已结束的比赛结果已登记到写缓冲"""
+    tasks = [b.task for b in _batches.values() if b.task is not None and not b.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def load_requests(lines: Iterable[str], repeat: int = 1) -> List[MatchRequest]:
+    """解析 JSONL 比赛请求（跳过空行和 # 注释行）"""
+    requests = []
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            requests.append(MatchRequest.model_validate(json.loads(line)))
+    return [request for request in requests for _ in range(repeat)]
+
+
+def matchmaker_requests(matchmaker, count: int, **request_fields) -> Iterator[MatchRequest]:
+    """
+    由配对器按需安排比赛：worker 空闲时才选择下一场，已结束比赛的 ELO 变化会影响后续选择
+    
+    熔断中的模型不参与配对；没有可用配对时提前结束
+    """
+    router = get_provider_router()
+    for _ in range(count):
+        picked = matchmaker.next_match(available=router.model_available, **request_fields)
+        if picked is None:
+            logger.warning("没有可用的配对，提前结束")
+            return
+        yield picked[0]
+
+
+async def main(args):
+    from backend.database import init_db
+    from backend.llm_client import close_clients
+
+    if args.auto:
+        await init_db()
+        request_fields = {"rounds": args.rounds}
+        if args.judges:
+            request_fields["judges"] = args.judges.split(",")
+        requests = matchmaker_requests(await load_matchmaker(), args.auto, **request_fields)
+        total = args.auto
+    else:
+        with open(args.input, encoding="utf-8") as f:
+            requests = load_requests(f, args.repeat)
+        if not requests:
+            print(f"❌ 没有比赛请求: {args.input}")
+            return
+        await init_db()
+        total = len(requests)
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else None
+    batch = BatchRun(requests, args.concurrency, total=total)
+    print(f"批量评测: {total} 场, 并发 {batch.concurrency}" + (" (配对器安排)" if args.auto else ""))
+
+    def on_result(summary: dict):
+        done = len(batch.results)
+        scores = summary["final_scores"] or {}
+        print(f"[{done}/{total}] {summary['proponent']} vs {summary['opponent']}: "
+              f"{summary['status']}, 胜者 {summary['winner']}, 比分 {scores.get('proponent')}:{scores.get('opponent')}, "
+              f"ELO {summary['elo']}, {summary['elapsed']:.1f}s"
+              + (f", 错误 {len(summary['errors'])} 个" if summary["errors"] else ""))
+        if output is not None:
+            output.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            output.flush()
+
+    try:
+        await batch.run(on_result)
+    finally:
+        if output is not None:
+            output.close()
+        await get_write_buffer().close()
+        await close_clients()
+
+    stats = batch.get_stats()
+    print(f"\n完成 {stats['completed']}/{stats['total']} 场, 耗时 {stats['elapsed']}s, "
+          f"吞吐 {stats['matches_per_hour']} 场/小时, 状态 {stats['by_status']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量评测（不推送事件）")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="比赛请求 JSONL（每行字段同 MatchRequest）")
+    source.add_argument("--auto", type=int, default=0, help="由配对器按信息增益安排的场数")
+    parser.add_argument("--output", default="", help="比赛摘要输出 JSONL（追加写入）")
+    parser.add_argument("--concurrency", type=int, default=BATCH_EVAL_CONFIG["concurrency"], help="同时进行的比赛数")
+    parser.add_argument("--repeat", type=int, default=1, help="每个比赛请求重复的场数")
+    parser.add_argument("--rounds", type=int, default=3, help="配对器安排的比赛轮数")
+    parser.add_argument("--judges", default="", help="配对器安排的比赛使用的裁判（逗号分隔，默认同 MatchRequest）")
+    asyncio.run(main(parser.parse_args()))
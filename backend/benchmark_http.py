@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型服务连接池基准
+
+对模拟模型服务（mock_provider.py）分多轮发起并发流式请求，对比 SDK 默认连接池与
+HTTP_TRANSPORT_CONFIG 连接池的总耗时、首 token 延迟（TTFT）和新建连接数。
+轮与轮之间的间隔大于 SDK 默认的 5 秒保活时间，默认连接池每轮都会重新建连（含 DNS 解析和握手）。
+
+使用方法:
+    python mock_provider.py --port 9100 &
+    python benchmark_http.py --base-url http://127.0.0.1:9100/v1 --concurrency 200 --waves 3 --gap 6
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.config import LLM_CONFIG
+from backend.llm_client import get_transport_config, _build_http_client
+
+
+def _percentile(values: list, pct: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))]
+
+
+async def _stream_once(client, model: str) -> float:
+    """发起一次流式请求，返回首 token 延迟（秒）"""
+    start = time.perf_counter()
+    ttft = None
+    stream = await client.chat.completions.create(
+        model=model, messages=[{"role": "user", "content": "请陈述你的论点"}], stream=True
+    )
+    async for chunk in stream:
+        if ttft is None and chunk.choices and chunk.choices[0].delta.content:
+            ttft = time.perf_counter() - start
+    return ttft if ttft is not None else time.perf_counter() - start
+
+
+async def run_case(name: str, client, http, base_url: str, args) -> dict:
+    stats_url = base_url.rsplit("/v1", 1)[0] + "/stats"
+    await http.post(stats_url + "/reset")
+    ttfts = []
+    start = time.perf_counter()
+    for wave in range(args.waves):
+        if wave:
+            await asyncio.sleep(args.gap)
+        results = await asyncio.gather(
+            *[_stream_once(client, args.model) for _ in range(args.concurrency)], return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        if errors:
+            print(f"  [{name}] 第 {wave + 1} 轮失败 {len(errors)} 个: {errors[0]!r}")
+        ttfts.extend(r for r in results if not isinstance(r, Exception))
+    # 总耗时不含轮间等待
+    elapsed = time.perf_counter() - start - args.gap * (args.waves - 1)
+    server = (await http.get(stats_url)).json()
+    return {
+        "name": name,
+        "elapsed": elapsed,
+        "ttft_p50": statistics.median(ttfts) * 1000 if ttfts else 0,
+        "ttft_p95": _percentile(ttfts, 0.95) * 1000 if ttfts else 0,
+        "ok": len(ttfts),
+        "connections": server["connections"],
+    }
+
+
+async def main(args):
+    import httpx
+    from openai import AsyncOpenAI
+
+    base_url = args.base_url
+    api_key = LLM_CONFIG["api_key"] or "benchmark"
+    cases = [
+        ("SDK 默认连接池", AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=60.0)),
+        ("共享连接池", AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=60.0,
+                                 http_client=_build_http_client(base_url)[0])),
+    ]
+    print(f"连接池配置: {get_transport_config(base_url)}")
+    print(f"并发 {args.concurrency} 个流 × {args.waves} 轮，轮间隔 {args.gap}s\n")
+
+    reports = []
+    async with httpx.AsyncClient() as http:
+        for name, client in cases:
+            reports.append(await run_case(name, client, http, base_url, args))
+            await client.close()
+
+    print(f"{'方案':<16}{'成功':>8}{'总耗时':>10}{'TTFT p50':>12}{'TTFT p95':>12}{'新建连接':>10}")
+    for r in reports:
+        print(f"{r['name']:<14}{r['ok']:>8}{r['elapsed']:>9.2f}s{r['ttft_p50']:>10.0f}ms"
+              f"{r['ttft_p95']:>10.0f}ms{r['connections']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模型服务连接池基准")
+    parser.add_argument("--base-url", default="http://127.0.0.1:9100/v1", help="模拟模型服务地址")
+    parser.add_argument("--model", default="mock")
+    parser.add_argument("--concurrency", type=int, default=200, help="每轮并发流数")
+    parser.add_argument("--waves", type=int, default=3, help="轮数")
+    parser.add_argument("--gap", type=float, default=6.0, help="轮间隔（秒），大于默认保活时间 5 秒")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SSE 序列化微基准
+
+用典型的比赛事件组合（大量内容增量 + 少量完整发言/比赛信息）测量单核每秒可编码的事件数，
+对比旧的 json.dumps + f-string 方式与 backend.sse 的编码器
+
+使用方法:
+    python benchmark_sse.py --events 200000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def _build_events(match, turn):
+    """一场比赛中各类事件的大致比例"""
+    events = [{"type": "match_init", "match_id": match.match_id}]
+    events.append({"type": "match_start", "data": match})
+    for i in range(200):
+        events.append({"type": "content", "speaker": "proponent", "content": "我方认为" * 3, "step": 0})
+    events.append({"type": "status", "speaker": "opponent", "content": "Round 1: 反方正在反驳..."})
+    events.append({"type": "turn_complete", "turn": turn})
+    return events
+
+
+def _legacy_frame(event: dict) -> bytes:
+    # 旧实现：先 model_dump 成 dict，再 json.dumps 并拼接 f-string
+    event = {k: v.model_dump(mode="json") if hasattr(v, "model_dump") else v for k, v in event.items()}
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _run(name: str, encode, events, total: int):
+    count = 0
+    size = 0
+    start = time.perf_counter()
+    while count < total:
+        for event in events:
+            size += len(encode(event))
+        count += len(events)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<12}{count / elapsed:>14,.0f} events/s{size / elapsed / 1024 / 1024:>10.1f} MB/s")
+
+
+def main(args):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from backend.models import DifficultyLevel, MatchSession, PersonalityType, Turn
+    from backend.sse import SSEEncoder, orjson
+
+    turn = Turn(
+        round_number=1, speaker_role="proponent", model_id="gpt-4o",
+        content="人工智能将深刻改变社会结构。" * 200,
+        tool_calls=[{"name": "web_search", "arguments": {"query": "ai"}, "result": "search result " * 300}],
+    )
+    match = MatchSession(
+        match_id="bench", topic="AI 是否会取代程序员", topic_difficulty=DifficultyLevel.MEDIUM,
+        proponent_model_id="gpt-4o", opponent_model_id="gpt-4o-mini",
+        proponent_personality=PersonalityType.RATIONAL, opponent_personality=PersonalityType.RATIONAL,
+    )
+    events = _build_events(match, turn)
+
+    print(f"orjson: {'已启用' if orjson else '未安装，使用标准库 json'}，事件组合: {len(events)} 个/轮")
+    _run("legacy", _legacy_frame, events, args.events)
+    encoder = SSEEncoder()
+    _run("sse", encoder.encode, events, args.events)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SSE 序列化微基准")
+    parser.add_argument("--events", type=int, default=200_000, help="编码的事件总数")
+    main(parser.parse_args())
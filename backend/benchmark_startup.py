@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准
+
+在独立进程中多次测量 `import backend.main` 的耗时（python -X importtime）和 init_db 耗时，
+列出最慢的顶层依赖，并检查导入预算：
+- 导入耗时中位数不超过 --budget-ms
+- 重量级依赖（openai、httpx）不在启动时导入，首次使用时才加载
+
+使用方法:
+    python benchmark_startup.py --runs 5
+    python benchmark_startup.py --budget-ms 800   # 超出预算时退出码为 1，可用于 CI
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+# 导入 backend.main 的耗时预算（毫秒）
+IMPORT_BUDGET_MS = 1000
+# 启动时不应导入的模块（延迟到首次使用）
+LAZY_MODULES = ("openai", "httpx")
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+_READY_SCRIPT = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import backend.main
+imported = time.perf_counter()
+from backend.database import init_db
+asyncio.run(init_db())
+ready = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "init_db_ms": (ready - imported) * 1000,
+    "lazy_loaded": [m for m in %r if m in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def _project_root() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENROUTER_API_KEY", "benchmark")
+    env.setdefault("DEBATE_LOG_LEVEL", "WARNING")
+    return env
+
+
+def profile_imports(top: int):
+    """python -X importtime 的结果按顶层包汇总"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        cwd=_project_root(), env=_env(), capture_output=True, text=True, check=True
+    )
+    packages = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        cumulative_us, name = int(m.group(2)), m.group(4)
+        if name == "backend.main":
+            total_us = cumulative_us
+            continue
+        if len(m.group(3)) <= 1:
+            # 解释器启动阶段的模块（site 等）
+            continue
+        root = name.split(".")[0] if not name.startswith("backend.") else name
+        packages[root] = max(packages.get(root, 0), cumulative_us)
+
+    print(f"\n导入耗时最高的模块（import backend.main 共 {total_us / 1000:.0f}ms）:")
+    for name, cumulative_us in sorted(packages.items(), key=lambda x: -x[1])[:top]:
+        print(f"  {name:<32}{cumulative_us / 1000:>8.1f}ms")
+
+
+def measure_ready(runs: int) -> list:
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", _READY_SCRIPT],
+            cwd=_project_root(), env=_env(), capture_output=True, text=True, check=True
+        )
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def main(args):
+    samples = measure_ready(args.runs)
+    import_ms = statistics.median(s["import_ms"] for s in samples)
+    init_ms = statistics.median(s["init_db_ms"] for s in samples)
+    lazy_loaded = sorted({m for s in samples for m in s["lazy_loaded"]})
+
+    print(f"启动耗时（{args.runs} 次中位数）:")
+    print(f"  import backend.main: {import_ms:.0f}ms (预算 {args.budget_ms}ms)")
+    print(f"  init_db:             {init_ms:.0f}ms")
+    print(f"  就绪总耗时:          {import_ms + init_ms:.0f}ms")
+    profile_imports(args.top)
+
+    failed = False
+    if import_ms > args.budget_ms:
+        print(f"\n✗ 导入耗时超出预算: {import_ms:.0f}ms > {args.budget_ms}ms")
+        failed = True
+    if lazy_loaded:
+        print(f"\n✗ 以下模块应延迟导入，但在启动时已加载: {', '.join(lazy_loaded)}")
+        failed = True
+    if not failed:
+        print("\n✓ 启动耗时在预算内")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=5, help="测量次数")
+    parser.add_argument("--top", type=int, default=15, help="列出最慢的模块数")
+    parser.add_argument("--budget-ms", type=int, default=IMPORT_BUDGET_MS, help="导入耗时预算（毫秒）")
+    main(parser.parse_args())
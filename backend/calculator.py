@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+安全的数学表达式计算器
+
+基于 AST 白名单编译表达式，替代 eval：
+- 表达式编译为闭包并缓存，相同表达式不会重复解析
+- 限制整数位数、序列长度和求值步数，防止 pow(10, 10**9) 之类的表达式卡死服务
+"""
+
+import ast
+import math
+import operator
+from functools import lru_cache
+from typing import Any, Callable, NamedTuple
+
+# 表达式最大长度（字符）
+MAX_EXPRESSION_LENGTH = 2000
+# 整数运算结果的最大位数（约 1233 位十进制数）
+MAX_INT_BITS = 4096
+# 单次求值的最大步数
+MAX_STEPS = 10000
+# 列表/元组字面量的最大长度
+MAX_SEQUENCE_LENGTH = 1000
+# round 的小数位数上限（MAX_INT_BITS 位整数约 1233 位十进制数）
+MAX_ROUND_DIGITS = 1300
+# 超过该位数的整数常量视为大数运算
+_BIG_INT_BITS = 64
+
+
+class CalculatorError(ValueError):
+    """表达式不合法或超出计算限制"""
+
+
+class CompiledExpression(NamedTuple):
+    """编译后的表达式"""
+    evaluate: Callable[[], Any]
+    heavy: bool  # 是否包含大数运算（调用方应放到可中止的子进程中执行）
+
+
+class _Budget:
+    """求值步数计数器"""
+    __slots__ = ("steps",)
+
+    def __init__(self):
+        self.steps = 0
+
+    def step(self):
+        self.steps += 1
+        if self.steps > MAX_STEPS:
+            raise CalculatorError(f"计算步数超过限制 ({MAX_STEPS})")
+
+
+def _check_int(value: Any) -> Any:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise CalculatorError(f"结果过大 (超过 {MAX_INT_BITS} 位)")
+    return value
+
+
+def _safe_pow(base, exp, mod=None):
+    """限制结果大小的幂运算"""
+    if mod is None and isinstance(base, int) and isinstance(exp, int) and exp > 0 and abs(base) > 1:
+        # 结果位数下界为 exp * (bit_length - 1)，超限时不做计算直接拒绝
+        if exp * (abs(base).bit_length() - 1) > MAX_INT_BITS:
+            raise CalculatorError(f"幂运算结果过大 (超过 {MAX_INT_BITS} 位)")
+    if mod is not None:
+        _check_int(mod)
+    return pow(base, exp) if mod is None else pow(base, exp, mod)
+
+
+def _safe_round(number, ndigits=None):
+    """限制小数位数的 round（round(5, -10**8) 需要计算 10**(10**8)）"""
+    if ndigits is not None:
+        if not isinstance(ndigits, int):
+            raise CalculatorError("round 的小数位数必须是整数")
+        if abs(ndigits) > MAX_ROUND_DIGITS:
+            raise CalculatorError(f"round 的小数位数超过限制 ({MAX_ROUND_DIGITS})")
+    return round(number, ndigits)
+
+
+def _safe_mul(a, b):
+    """限制结果大小的乘法（含序列重复）"""
+    if isinstance(a, int) and isinstance(b, int):
+        if a.bit_length() + b.bit_length() > MAX_INT_BITS + 1:
+            raise CalculatorError(f"乘法结果过大 (超过 {MAX_INT_BITS} 位)")
+    elif isinstance(a, (list, tuple)) or isinstance(b, (list, tuple)):
+        raise CalculatorError("不支持序列乘法")
+    return a * b
+
+
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: _safe_mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _safe_pow,
+}
+
+_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+FUNCTIONS = {
+    'abs': abs,
+    'round': _safe_round,
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'pow': _safe_pow,
+    'sqrt': math.sqrt,
+    'sin': math.sin,
+    'cos': math.cos,
+    'tan': math.tan,
+    'log': math.log,
+    'log10': math.log10,
+    'exp': math.exp,
+}
+
+CONSTANTS = {
+    'pi': math.pi,
+    'e': math.e,
+}
+
+
+class _Compiler:
+    """将 AST 编译为闭包，编译期完成所有白名单检查"""
+
+    def __init__(self):
+        self.heavy = False
+
+    def compile(self, node: ast.AST) -> Callable[[_Budget], Any]:
+        method = getattr(self, f"_compile_{type(node).__name__}", None)
+        if method is None:
+            raise CalculatorError(f"不支持的语法: {type(node).__name__}")
+        return method(node)
+
+    def _compile_Expression(self, node: ast.Expression):
+        return self.compile(node.body)
+
+    def _compile_Constant(self, node: ast.Constant):
+        value = node.value
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise CalculatorError(f"不支持的常量: {value!r}")
+        _check_int(value)
+        if isinstance(value, int) and value.bit_length() > _BIG_INT_BITS:
+            self.heavy = True
+        return lambda budget: value
+
+    def _compile_Name(self, node: ast.Name):
+        if node.id not in CONSTANTS:
+            raise CalculatorError(f"未知变量: {node.id}")
+        value = CONSTANTS[node.id]
+        return lambda budget: value
+
+    def _compile_BinOp(self, node: ast.BinOp):
+        op = _BIN_OPS.get(type(node.op))
+        if op is None:
+            raise CalculatorError(f"不支持的运算符: {type(node.op).__name__}")
+        if op is _safe_pow:
+            self.heavy = True
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        def evaluate(budget: _Budget):
+            budget.step()
+            return _check_int(op(left(budget), right(budget)))
+        return evaluate
+
+    def _compile_UnaryOp(self, node: ast.UnaryOp):
+        op = _UNARY_OPS.get(type(node.op))
+        if op is None:
+            raise CalculatorError(f"不支持的运算符: {type(node.op).__name__}")
+        operand = self.compile(node.operand)
+
+        def evaluate(budget: _Budget):
+            budget.step()
+            return op(operand(budget))
+        return evaluate
+
+    def _compile_Compare(self, node: ast.Compare):
+        ops = []
+        for op_node in node.ops:
+            op = _COMPARE_OPS.get(type(op_node))
+            if op is None:
+                raise CalculatorError(f"不支持的比较运算: {type(op_node).__name__}")
+            ops.append(op)
+        left = self.compile(node.left)
+        comparators = [self.compile(c) for c in node.comparators]
+
+        def evaluate(budget: _Budget):
+            budget.step()
+            current = left(budget)
+            for op, comparator in zip(ops, comparators):
+                right = comparator(budget)
+                if not op(current, right):
+                    return False
+                current = right
+            return True
+        return evaluate
+
+    def _compile_Call(self, node: ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            name = node.func.id if isinstance(node.func, ast.Name) else type(node.func).__name__
+            raise CalculatorError(f"不支持的函数: {name}")
+        if node.keywords:
+            raise CalculatorError("不支持关键字参数")
+        func = FUNCTIONS[node.func.id]
+        if func is _safe_pow:
+            self.heavy = True
+        args = [self.compile(arg) for arg in node.args]
+
+        def evaluate(budget: _Budget):
+            budget.step()
+            return _check_int(func(*[arg(budget) for arg in args]))
+        return evaluate
+
+    def _compile_sequence(self, node):
+        if len(node.elts) > MAX_SEQUENCE_LENGTH:
+            raise CalculatorError(f"序列过长 (超过 {MAX_SEQUENCE_LENGTH} 个元素)")
+        elements = [self.compile(elt) for elt in node.elts]
+
+        def evaluate(budget: _Budget):
+            budget.step()
+            return [element(budget) for element in elements]
+        return evaluate
+
+    _compile_List = _compile_sequence
+    _compile_Tuple = _compile_sequence
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression: str) -> CompiledExpression:
+    """
+    解析并编译数学表达式（结果缓存）
+
+    Raises:
+        CalculatorError: 表达式过长、语法错误或包含不支持的语法
+    """
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise CalculatorError(f"表达式过长 (超过 {MAX_EXPRESSION_LENGTH} 个字符)")
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise CalculatorError(f"语法错误: {e.msg}")
+
+    compiler = _Compiler()
+    try:
+        root = compiler.compile(tree)
+    except RecursionError:
+        raise CalculatorError("表达式嵌套过深")
+
+    def evaluate():
+        try:
+            return root(_Budget())
+        except RecursionError:
+            raise CalculatorError("表达式嵌套过深")
+    return CompiledExpression(evaluate=evaluate, heavy=compiler.heavy)
+
+
+def evaluate_expression(expression: str) -> Any:
+    """同步计算表达式"""
+    return compile_expression(expression).evaluate()
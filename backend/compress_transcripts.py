@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+已结束比赛发言记录压缩迁移脚本
+
+把已结束比赛（FINISHED / TIMEOUT / CANCELLED）中未压缩的 JSON 发言记录转为压缩存储，并报告节省的空间
+首次运行（或指定 --train）时会从已有发言记录中训练共享压缩字典
+
+使用方法:
+    # 只统计压缩效果，不写入
+    python compress_transcripts.py --dry-run
+
+    # 训练字典并迁移全部历史比赛
+    python compress_transcripts.py --train
+
+迁移完成后执行 VACUUM（SQLite）或 OPTIMIZE TABLE matches（MySQL）回收磁盘空间
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+def _format_size(num_bytes: int) -> str:
+    return f"{num_bytes / 1024 / 1024:.2f}MB"
+
+
+async def train(database, transcript_store, sample_size: int):
+    """从最近的已结束比赛中采样训练字典"""
+    from sqlalchemy import select
+    from backend.models import MatchModel
+
+    async with database.SessionLocal() as db:
+        rows = (await db.execute(
+            select(MatchModel.transcript, MatchModel.transcript_blob)
+            .where(MatchModel.status.in_(transcript_store.COLD_STATUSES))
+            .order_by(MatchModel.id.desc())
+            .limit(sample_size)
+        )).all()
+    samples = [
+        transcript_store.serialize_transcript(transcript_store.load_transcript(transcript, blob))
+        for transcript, blob in rows
+    ]
+    samples = [s for s in samples if len(s) > 2]
+    if len(samples) < 10:
+        print(f"⚠ 样本不足（{len(samples)} 场），不训练字典")
+        return
+    dictionary = transcript_store.train_dictionary(samples)
+    dictionary_id = await database.save_transcript_dictionary(dictionary, len(samples))
+    print(f"✓ 已训练压缩字典 #{dictionary_id}: {len(samples)} 个样本, {_format_size(len(dictionary))}")
+
+
+async def migrate(database, transcript_store, batch_size: int, level: int, dry_run: bool):
+    """分批压缩未压缩的发言记录"""
+    from sqlalchemy import bindparam, select, update
+    from backend.models import MatchModel
+
+    raw_total = 0
+    compressed_total = 0
+    count = 0
+    last_id = 0
+    start_time = time.perf_counter()
+    while True:
+        async with database.SessionLocal() as db:
+            rows = (await db.execute(
+                select(MatchModel.id, MatchModel.transcript)
+                .where(
+                    MatchModel.id > last_id,
+                    MatchModel.status.in_(transcript_store.COLD_STATUSES),
+                    MatchModel.transcript_blob.is_(None)
+                )
+                .order_by(MatchModel.id)
+                .limit(batch_size)
+            )).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            transcript = row.transcript or []
+            blob = transcript_store.compress_transcript(transcript, level=level)
+            raw_total += len(transcript_store.serialize_transcript(transcript))
+            compressed_total += len(blob)
+            updates.append({"row_id": row.id, "blob": blob})
+
+        if not dry_run:
+            async with database.writer_lock():
+                async with database.engine.begin() as conn:
+                    await conn.execute(
+                        update(MatchModel)
+                        .where(MatchModel.id == bindparam("row_id"))
+                        .values(transcript_blob=bindparam("blob"), transcript=None),
+                        updates
+                    )
+        count += len(rows)
+        print(f"  已处理 {count} 场 ({time.perf_counter() - start_time:.1f}s)")
+
+    print(f"\n{'[dry-run] ' if dry_run else ''}共压缩 {count} 场比赛的发言记录")
+    if count:
+        saved = raw_total - compressed_total
+        print(f"  原始大小: {_format_size(raw_total)}")
+        print(f"  压缩后:   {_format_size(compressed_total)}")
+        print(f"  节省:     {_format_size(saved)} ({saved / raw_total:.1%})")
+    if count and not dry_run:
+        print("提示: 执行 VACUUM（SQLite）或 OPTIMIZE TABLE matches（MySQL）以回收磁盘空间")
+
+
+async def main(args):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from backend import database, transcript_store
+    from backend.config import TRANSCRIPT_STORAGE_CONFIG
+
+    await database.init_db()
+    if args.train or transcript_store.current_dictionary_id() == 0:
+        if args.dry_run:
+            print("[dry-run] 跳过字典训练")
+        else:
+            await train(database, transcript_store, args.sample)
+    await migrate(database, transcript_store, args.batch_size, TRANSCRIPT_STORAGE_CONFIG["level"], args.dry_run)
+    await database.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="已结束比赛发言记录压缩迁移")
+    parser.add_argument("--train", action="store_true", help="重新训练压缩字典")
+    parser.add_argument("--sample", type=int, default=2000, help="训练字典的样本比赛数")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批处理的比赛数")
+    parser.add_argument("--dry-run", action="store_true", help="只统计压缩效果，不写入数据库")
+    asyncio.run(main(parser.parse_args()))
@@ -5,6 +5,7 @@
 Configuration for LLM Debate Arena
 """
 
+import json
 import os
 from dotenv import load_dotenv
 
@@ -22,6 +23,49 @@ LLM_CONFIG = {
     'timeout': 300.0
 }
 
+# 模型服务 HTTP 连接池（每个 base_url 一个独立连接池）
+HTTP_TRANSPORT_CONFIG = {
+    "max_connections": int(os.getenv("LLM_MAX_CONNECTIONS", "1000")),             # 最大连接数（含进行中的流）
+    "max_keepalive_connections": int(os.getenv("LLM_MAX_KEEPALIVE", "500")),      # 空闲保活连接数
+    "keepalive_expiry": float(os.getenv("LLM_KEEPALIVE_EXPIRY", "90")),           # 空闲连接保活时间（秒）
+    "http2": os.getenv("LLM_HTTP2", "false").lower() == "true",                   # 需要安装 h2（httpx[http2]）
+}
+# 按 base_url 覆盖连接池参数，例如 {"https://openrouter.ai/api/v1": {"http2": true, "max_connections": 2000}}
+LLM_TRANSPORT_OVERRIDES = json.loads(os.getenv("LLM_TRANSPORT_OVERRIDES") or "{}")
+
+# 多模型服务端点（JSON 列表），未配置时只使用 OPENROUTER_API_URL；api_key 缺省时使用 OPENROUTER_API_KEY
+# [{"name": "openrouter", "base_url": "https://openrouter.ai/api/v1", "models": ["*"], "model_map": {"gpt-4o": "openai/gpt-4o"}},
+#  {"name": "openai", "base_url": "https://api.openai.com/v1", "api_key": "sk-...", "models": ["gpt-4o", "gpt-4o-mini"]}]
+LLM_PROVIDERS = json.loads(os.getenv("LLM_PROVIDERS") or "[]")
+
+# 服务端点选路与熔断
+PROVIDER_ROUTING_CONFIG = {
+    "window": int(os.getenv("LLM_ROUTING_WINDOW", "50")),                         # TTFT / 错误率滚动窗口（请求数）
+    "first_token_timeout": float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", "30")),     # 还有备选端点时，首 token 超过该时间切换端点
+    "breaker_failures": int(os.getenv("LLM_BREAKER_FAILURES", "5")),              # 连续失败次数达到该值时熔断
+    "breaker_error_rate": float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5")),      # 窗口内错误率达到该值时熔断
+    "breaker_min_samples": int(os.getenv("LLM_BREAKER_MIN_SAMPLES", "10")),       # 按错误率熔断的最少样本数
+    "breaker_cooldown": float(os.getenv("LLM_BREAKER_COOLDOWN", "30")),           # 熔断冷却时间（秒），之后放行一个探测请求
+}
+
+# 模型熔断：某个模型在所有端点上都调用失败（端点切换之后的最终结果）时计入，熔断期间调用立即返回错误，
+# 辩手模型熔断的比赛在开始前拒绝，熔断的裁判替换为 JUDGE_PANEL 中可用的裁判
+MODEL_BREAKER_CONFIG = {
+    "enabled": os.getenv("MODEL_BREAKER_ENABLED", "true").lower() == "true",
+    "failures": int(os.getenv("MODEL_BREAKER_FAILURES", "3")),                    # 连续失败次数达到该值时熔断
+    "error_rate": float(os.getenv("MODEL_BREAKER_ERROR_RATE", "0.5")),            # 窗口内错误率达到该值时熔断
+    "min_samples": int(os.getenv("MODEL_BREAKER_MIN_SAMPLES", "10")),             # 按错误率熔断的最少样本数
+    "cooldown": float(os.getenv("MODEL_BREAKER_COOLDOWN", "60")),                 # 熔断冷却时间（秒），之后放行一个探测请求
+    "window": int(os.getenv("MODEL_BREAKER_WINDOW", "20")),                       # 错误率滚动窗口（调用数）
+}
+
+# 模型调用录制 / 回放（离线复现比赛）
+LLM_RECORD_CONFIG = {
+    "mode": os.getenv("LLM_RECORD_MODE", "off"),                  # off | record | replay
+    "path": os.getenv("LLM_RECORD_PATH", "./llm_recordings.db"),
+    "replay_speed": float(os.getenv("LLM_REPLAY_SPEED", "0")),    # 1 按录制节奏，>1 加速，0 不等待
+}
+
 AVAILABLE_MODELS = os.getenv("AVAILABLE_MODELS", "gpt-4o,gpt-4o-mini,gpt-5")
 
 # ========== 裁判团配置 ==========
@@ -31,16 +75,101 @@ JUDGE_PANEL = [
     "gpt-4o-mini",
 ]
 
+# 裁判输出不是合法 JSON 时的重试次数
+JUDGE_MAX_RETRIES = int(os.getenv("JUDGE_MAX_RETRIES", "1"))
+
+# 支持 JSON Schema 结构化输出的裁判模型（按前缀匹配）
+JUDGE_STRUCTURED_OUTPUT_MODELS = [
+    m.strip() for m in os.getenv("JUDGE_STRUCTURED_OUTPUT_MODELS", "gpt-4o,gpt-4.1,gpt-5").split(",") if m.strip()
+]
+
 # ========== 数据库配置 ==========
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./debate_arena.db")
 
+# 比赛进度后写缓冲：定期把所有进行中比赛的状态合并为一次批量提交
+WRITE_BEHIND_CONFIG = {
+    "flush_interval": float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "1.0")),  # 刷新间隔（秒）
+    "max_batch": int(os.getenv("WRITE_BEHIND_MAX_BATCH", "100")),             # 待写比赛达到该数量时提前刷新
+}
+
+# 已结束比赛的发言记录压缩存储
+TRANSCRIPT_STORAGE_CONFIG = {
+    "compress": os.getenv("TRANSCRIPT_COMPRESSION", "true").lower() == "true",
+    "level": int(os.getenv("TRANSCRIPT_COMPRESSION_LEVEL", "6")),   # zlib 压缩级别 1-9
+}
+
+# ========== 比赛注册表（多进程部署）==========
+
+MATCH_REGISTRY_CONFIG = {
+    # memory: 单进程；database: 通过 DATABASE_URL 在多个进程 / 节点间共享比赛归属
+    "backend": os.getenv("MATCH_REGISTRY_BACKEND", "memory"),
+    # 本进程对其他进程可达的地址（观战 / 重连请求落到其他进程时转发到这里），例如 http://10.0.0.2:8001
+    "advertise_url": os.getenv("WORKER_ADVERTISE_URL", ""),
+    "heartbeat_interval": float(os.getenv("MATCH_REGISTRY_HEARTBEAT", "5")),   # 心跳间隔（秒），3 次未刷新视为进程已退出
+    "retain_seconds": float(os.getenv("LIVE_MATCH_RETAIN_SECONDS", "60")),     # 比赛结束后保留事件以供重连的时间（秒）
+}
+
+# ========== 比赛任务队列（独立 worker 进程执行比赛）==========
+
+MATCH_QUEUE_CONFIG = {
+    # inline: 比赛在 API 进程内运行；queue: 写入任务队列，由 match_worker.py 进程执行
+    "mode": os.getenv("MATCH_EXECUTION_MODE", "inline"),
+    "concurrency": int(os.getenv("MATCH_WORKER_CONCURRENCY", "4")),        # 每个 worker 进程同时运行的比赛数
+    "lease_seconds": float(os.getenv("MATCH_JOB_LEASE_SECONDS", "30")),     # 任务租约时长，worker 每 1/3 租约续约一次
+    "max_attempts": int(os.getenv("MATCH_JOB_MAX_ATTEMPTS", "2")),          # worker 失联后任务最多执行的次数
+    "poll_interval": float(os.getenv("MATCH_QUEUE_POLL_INTERVAL", "0.5")),  # 领取任务 / 读取事件的轮询间隔（秒）
+    "publish_interval": 0.1,                                                 # worker 批量写入事件的间隔（秒）
+    "event_retain_seconds": 3600,                                            # 已结束任务的事件保留时间（秒）
+}
+
+# ========== 批量评测（不推送事件，见 batch_eval.py）==========
+
+BATCH_EVAL_CONFIG = {
+    "concurrency": int(os.getenv("BATCH_EVAL_CONCURRENCY", "8")),   # 同时进行的比赛数
+    "max_retained": 20,                                              # 内存中保留的已结束批次数（API 查询用）
+}
+
+# ========== 信息增益配对（见 matchmaker.py）==========
+
+MATCHMAKING_CONFIG = {
+    # 已安排配对的预约时长（秒），比赛超过该时间未结束时配对重新参与选择；默认与比赛时限一致
+    "reservation_ttl": float(os.getenv("MATCHMAKING_RESERVATION_TTL", "900")),
+}
+
 # ========== 辩论配置 ==========
 
 DEBATE_CONFIG = {
     "max_rounds": 3,
     "enable_tools": True,
-    "tools": ["python_interpreter", "web_search", "calculator"]
+    "tools": ["python_interpreter", "web_search", "calculator"],
+    "max_parallel_tools": int(os.getenv("MAX_PARALLEL_TOOLS", "3")),   # 单次发言内工具并发上限
+    "tool_timeout": float(os.getenv("TOOL_TIMEOUT", "60")),            # 单个工具超时（秒）
+    "max_tool_iterations": int(os.getenv("MAX_TOOL_ITERATIONS", "3")),       # 单次发言最多工具轮数
+    "turn_time_budget": float(os.getenv("TURN_TIME_BUDGET", "240")),         # 单次发言时间预算（秒）
+    "judge_time_budget": float(os.getenv("JUDGE_TIME_BUDGET", "120")),       # 比赛时限中为裁判评分预留的时间（秒）
+    "max_tool_output_bytes": int(os.getenv("MAX_TOOL_OUTPUT_BYTES", "16000")),  # 回传模型的单个工具输出上限
+    # 第 1 轮双方同时开篇立论（反方不等待正方立论），第 2 轮起反方基于双方立论反驳；比赛请求可单独指定
+    "parallel_openings": os.getenv("PARALLEL_OPENINGS", "false").lower() == "true",
+    # 客户端断开后的处理: cancel 取消比赛（标记为 CANCELLED），detach 继续在后台完成比赛
+    "disconnect_policy": os.getenv("MATCH_DISCONNECT_POLICY", "cancel"),
+    "disconnect_poll_interval": 1.0,  # 无事件推送时检查客户端连接的间隔（秒）
+}
+
+# ========== 工具结果缓存配置 ==========
+
+TOOL_CACHE_CONFIG = {
+    "enabled": os.getenv("TOOL_CACHE_ENABLED", "true").lower() == "true",
+    "path": os.getenv("TOOL_CACHE_PATH", "./tool_cache.db"),   # 置空则只使用内存缓存
+    "memory_max_entries": int(os.getenv("TOOL_CACHE_MEMORY_ENTRIES", "1024")),
+    "disk_max_entries": int(os.getenv("TOOL_CACHE_DISK_ENTRIES", "50000")),
+    "max_value_bytes": 256 * 1024,
+    # 各工具缓存有效期（秒），<= 0 表示不缓存
+    "ttl": {
+        "web_search": 6 * 3600,
+        "calculator": 30 * 24 * 3600,
+        "python_interpreter": 0,   # 代码可能依赖时间或随机数，不缓存
+    },
 }
 
 # ========== ELO 配置 ==========
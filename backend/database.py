@@ -4,42 +4,83 @@
 @description: 数据库操作
 """
 
-from sqlalchemy import create_engine, desc
-from sqlalchemy.orm import sessionmaker, Session
-from typing import List, Optional
-from datetime import datetime
+import asyncio
+from contextlib import asynccontextmanager
+from sqlalchemy import and_, delete, desc, event, func, insert, inspect, or_, select, text, union, update
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import defer
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from typing import AsyncIterator, List, Optional
+from datetime import datetime, timedelta
+import hashlib
 import json
 import os
 
-from .config import DATABASE_URL, AVAILABLE_MODELS
+from .config import DATABASE_URL, AVAILABLE_MODELS, TRANSCRIPT_STORAGE_CONFIG
 from .log import logger
+from . import transcript_store
 from .models import (
-    Base, CompetitorModel, DebateTopicModel, MatchModel,
+    Base, CompetitorModel, DebateTopicModel, MatchModel, TranscriptDictionaryModel, LiveMatchModel,
+    MatchJobModel, MatchEventModel, SchemaVersionModel,
     DifficultyLevel, TopicCategory, PersonalityType,
     MatchSession, CompetitorProfile, DebateTopic
 )
 
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# SQLite 每个新连接都会执行的 PRAGMA
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",       # 读写并发
+    "synchronous": "NORMAL",     # WAL 模式下足够安全，减少 fsync
+    "busy_timeout": 30000,       # 等待锁的毫秒数
+    "cache_size": -65536,        # 64MB 页缓存
+    "mmap_size": 268435456,      # 256MB 内存映射
+    "temp_store": "MEMORY",
+}
+
+
+def _to_async_url(url: str) -> str:
+    """将同步驱动的数据库 URL 转换为异步驱动"""
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme and scheme.split("+", 1)[1] in ("aiosqlite", "aiomysql", "asyncmy", "asyncpg"):
+        return url
+    backend = scheme.split("+", 1)[0]
+    async_drivers = {
+        "sqlite": "sqlite+aiosqlite",
+        "mysql": "mysql+aiomysql",
+        "postgresql": "postgresql+asyncpg",
+    }
+    return f"{async_drivers.get(backend, scheme)}{sep}{rest}"
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """在每个池化连接上设置 PRAGMA"""
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 
 def _create_engine():
-    """根据数据库类型创建引擎"""
-    is_sqlite = DATABASE_URL.startswith("sqlite")
+    """根据数据库类型创建异步引擎"""
+    url = _to_async_url(DATABASE_URL)
     
-    if is_sqlite:
-        # SQLite 配置（启用 WAL 模式以支持更好的并发）
-        return create_engine(
-            DATABASE_URL, 
-            connect_args={
-                "check_same_thread": False,
-                "timeout": 30  # 增加超时时间，避免 database locked
-            },
-            pool_size=10,
-            max_overflow=20,
-            pool_pre_ping=True
+    if IS_SQLITE:
+        # SQLite 同一时刻只有一个写者（由 writer_lock 串行化），连接池只需容纳少量并发读
+        sqlite_engine = create_async_engine(
+            url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=8,
+            max_overflow=0,
+            connect_args={"timeout": 30}
         )
+        event.listen(sqlite_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        return sqlite_engine
     else:
         # MySQL / PostgreSQL 配置
-        return create_engine(
-            DATABASE_URL,
+        return create_async_engine(
+            url,
             pool_size=20,           # 连接池大小
             max_overflow=30,        # 最大溢出连接数
             pool_pre_ping=True,     # 连接前检查可用性
@@ -49,42 +90,102 @@ def _create_engine():
 
 
 engine = _create_engine()
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# SQLite 单写者锁：写事务在进程内排队执行，避免 database is locked
+_sqlite_write_lock = asyncio.Lock()
+
+
+@asynccontextmanager
+async def writer_lock() -> AsyncIterator[None]:
+    """写事务串行化（仅 SQLite，其他数据库为空操作）"""
+    if IS_SQLITE:
+        async with _sqlite_write_lock:
+            yield
+    else:
+        yield
+
+
+@asynccontextmanager
+async def write_session() -> AsyncIterator[AsyncSession]:
+    """获取写会话（SQLite 下持有单写者锁直到会话结束）"""
+    async with writer_lock():
+        async with SessionLocal() as db:
+            yield db
 
-def init_db():
-    """初始化数据库"""
-    Base.metadata.create_all(bind=engine)
+
+async def init_db():
+    """
+    初始化数据库
     
-    # SQLite 启用 WAL 模式以支持更好的并发
-    if DATABASE_URL.startswith("sqlite"):
-        try:
-            import sqlite3
-            # 从 DATABASE_URL 中提取数据库文件路径
-            # DATABASE_URL 格式: sqlite:///./debate_arena.db
-            db_path = DATABASE_URL.replace('sqlite:///', '')
-            conn = sqlite3.connect(db_path)
-            conn.execute('PRAGMA journal_mode=WAL')
-            conn.close()
-            logger.info("SQLite WAL 模式已启用")
-        except Exception as e:
-            logger.error(f"启用 WAL 模式失败: {e}")
+    表结构指纹与上次初始化时一致则跳过建表、补列（需要反射全部表）和默认数据检查，
+    缩短 worker / 容器的启动时间
+    """
+    if IS_SQLITE:
+        logger.info(f"SQLite 已启用 PRAGMA: {SQLITE_PRAGMAS}")
     else:
         logger.info(f"使用数据库: {DATABASE_URL.split('@')[-1] if '@' in DATABASE_URL else DATABASE_URL}")
     
-    # 初始化默认数据
-    db = SessionLocal()
+    fingerprint = schema_fingerprint()
+    if await _schema_applied(fingerprint):
+        logger.debug(f"表结构未变化 ({fingerprint[:12]})，跳过建表")
+    else:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(_upgrade_schema)
+        
+        # 初始化默认数据
+        async with write_session() as db:
+            # 检查是否已有数据
+            if await db.scalar(select(func.count()).select_from(CompetitorModel)) == 0:
+                _init_default_competitors(db)
+            if await db.scalar(select(func.count()).select_from(DebateTopicModel)) == 0:
+                _init_default_topics(db)
+            await db.merge(SchemaVersionModel(fingerprint=fingerprint))
+            await db.commit()
+    
+    await load_transcript_dictionaries()
+
+
+def schema_fingerprint() -> str:
+    """当前 ORM 定义的表结构指纹（表、列、索引）"""
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        columns = ",".join(f"{c.name}:{c.type}:{c.nullable}" for c in table.columns)
+        indexes = ",".join(sorted(ix.name for ix in table.indexes))
+        parts.append(f"{table.name}({columns})[{indexes}]")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+async def _schema_applied(fingerprint: str) -> bool:
     try:
-        # 检查是否已有数据
-        if db.query(CompetitorModel).count() == 0:
-            _init_default_competitors(db)
-        if db.query(DebateTopicModel).count() == 0:
-            _init_default_topics(db)
-        db.commit()
-    finally:
-        db.close()
+        async with SessionLocal() as db:
+            return await db.get(SchemaVersionModel, fingerprint) is not None
+    except DBAPIError:
+        # 首次启动，schema_versions 表还不存在
+        return False
+
 
+def _upgrade_schema(sync_conn):
+    """为已存在的表补建新增的列和索引（create_all 只会创建新表）"""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        # 新增列均为可空列，直接 ADD COLUMN
+        existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=sync_conn.dialect)
+                logger.info(f"添加列: {table.name}.{column.name} ({column_type})")
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        
+        existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info(f"创建索引: {table.name}.{index.name}")
+                index.create(sync_conn)
 
-def _init_default_competitors(db: Session):
+
+def _init_default_competitors(db: AsyncSession):
     """从环境变量初始化选手"""
     # 从环境变量读取可用模型列表
     model_ids = [m.strip() for m in AVAILABLE_MODELS.split(",") if m.strip()]
@@ -104,7 +205,7 @@ def _init_default_competitors(db: Session):
         db.add_all(competitors)
 
 
-def _init_default_topics(db: Session):
+def _init_default_topics(db: AsyncSession):
     """初始化默认辩题"""
     topics = [
         DebateTopicModel(
@@ -153,34 +254,25 @@ def _init_default_topics(db: Session):
     db.add_all(topics)
 
 
-def get_db():
+async def get_db() -> AsyncIterator[AsyncSession]:
     """获取数据库会话"""
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 # ========== 选手相关 ==========
 
 async def get_competitor(model_id: str) -> Optional[CompetitorModel]:
     """获取选手信息"""
-    db = SessionLocal()
-    try:
-        return db.query(CompetitorModel).filter(CompetitorModel.model_id == model_id).first()
-    finally:
-        db.close()
+    async with SessionLocal() as db:
+        return await db.scalar(select(CompetitorModel).where(CompetitorModel.model_id == model_id))
 
 
 async def get_all_competitors() -> List[CompetitorProfile]:
     """获取所有选手"""
-    db = SessionLocal()
-    try:
-        competitors = db.query(CompetitorModel).order_by(desc(CompetitorModel.elo_rating)).all()
+    async with SessionLocal() as db:
+        competitors = (await db.scalars(select(CompetitorModel).order_by(desc(CompetitorModel.elo_rating)))).all()
         return [_competitor_to_profile(c) for c in competitors]
-    finally:
-        db.close()
 
 
 async def update_competitor(model_id: str, new_rating: int, result: float):
@@ -189,44 +281,41 @@ async def update_competitor(model_id: str, new_rating: int, result: float):
     retry_count = 0
     
     while retry_count < max_retries:
-        db = SessionLocal()
-        try:
-            competitor = db.query(CompetitorModel).filter(
-                CompetitorModel.model_id == model_id
-            ).with_for_update().first()  # 使用行锁
-            
-            if competitor:
-                competitor.elo_rating = new_rating
-                competitor.matches_played += 1
-                
-                if result == 1.0:
-                    competitor.wins += 1
-                elif result == 0.0:
-                    competitor.losses += 1
-                else:
-                    competitor.draws += 1
-                
-                # 更新 ELO 历史
-                if not competitor.elo_history:
-                    competitor.elo_history = []
-                competitor.elo_history.append({
-                    "date": datetime.utcnow().strftime("%Y-%m-%d"),
-                    "rating": new_rating
-                })
+        async with write_session() as db:
+            try:
+                competitor = await db.scalar(
+                    select(CompetitorModel).where(
+                        CompetitorModel.model_id == model_id
+                    ).with_for_update()  # 使用行锁
+                )
                 
-                competitor.last_match_at = datetime.utcnow()
-                db.commit()
+                if competitor:
+                    competitor.elo_rating = new_rating
+                    competitor.matches_played += 1
+                    
+                    if result == 1.0:
+                        competitor.wins += 1
+                    elif result == 0.0:
+                        competitor.losses += 1
+                    else:
+                        competitor.draws += 1
+                    
+                    # 更新 ELO 历史（重新赋值，JSON 列的原地修改不会被跟踪）
+                    competitor.elo_history = [*(competitor.elo_history or []), {
+                        "date": datetime.utcnow().strftime("%Y-%m-%d"),
+                        "rating": new_rating
+                    }]
+                    
+                    competitor.last_match_at = datetime.utcnow()
+                    await db.commit()
                 break  # 成功，退出循环
-        except Exception as e:
-            db.rollback()
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise e
-            # 简单的退避策略
-            import time
-            time.sleep(0.1 * retry_count)
-        finally:
-            db.close()
+            except Exception as e:
+                await db.rollback()
+                retry_count += 1
+                if retry_count >= max_retries:
+                    raise e
+        # 简单的退避策略（在释放写锁后等待）
+        await asyncio.sleep(0.1 * retry_count)
 
 
 def _competitor_to_profile(c: CompetitorModel) -> CompetitorProfile:
@@ -251,24 +340,35 @@ def _competitor_to_profile(c: CompetitorModel) -> CompetitorProfile:
 
 async def get_topics_by_difficulty(difficulty: DifficultyLevel) -> List[DebateTopic]:
     """根据难度获取辩题"""
-    db = SessionLocal()
-    try:
-        topics = db.query(DebateTopicModel).filter(
+    async with SessionLocal() as db:
+        topics = (await db.scalars(select(DebateTopicModel).where(
             DebateTopicModel.difficulty == difficulty
-        ).all()
+        ))).all()
         return [_topic_to_pydantic(t) for t in topics]
-    finally:
-        db.close()
 
 
 async def get_all_topics() -> List[DebateTopic]:
     """获取所有辩题"""
-    db = SessionLocal()
-    try:
-        topics = db.query(DebateTopicModel).all()
+    async with SessionLocal() as db:
+        topics = (await db.scalars(select(DebateTopicModel))).all()
         return [_topic_to_pydantic(t) for t in topics]
-    finally:
-        db.close()
+
+
+async def record_topic_result(topic: str, rating: Optional[float] = None):
+    """
+    辩题库中的辩题使用次数 +1，rating 不为空时按增量平均计入 avg_rating
+    
+    不在辩题库中的辩题（用户自定义）忽略
+    """
+    async with write_session() as db:
+        t = await db.scalar(select(DebateTopicModel).where(DebateTopicModel.topic == topic).limit(1))
+        if t is None:
+            return
+        usage = t.usage_count or 0
+        if rating is not None:
+            t.avg_rating = (t.avg_rating or 0.0) + (rating - (t.avg_rating or 0.0)) / (usage + 1)
+        t.usage_count = usage + 1
+        await db.commit()
 
 
 def _topic_to_pydantic(t: DebateTopicModel) -> DebateTopic:
@@ -287,169 +387,280 @@ def _topic_to_pydantic(t: DebateTopicModel) -> DebateTopic:
 
 # ========== 比赛相关 ==========
 
+def match_to_row(match: MatchSession, elo_changes: dict = None) -> dict:
+    """将比赛会话序列化为数据库行字段"""
+    # 序列化 Turn 对象（mode='json' 会把 datetime 转为 ISO 字符串）
+    transcript_json = [t.model_dump(mode='json') for t in match.history]
+    
+    # 序列化 result
+    judge_result_json = None
+    if match.result:
+        judge_result_json = match.result.model_dump(mode='json')
+    
+    # 确保 created_at 是 datetime 对象
+    created_at_value = match.created_at
+    if isinstance(created_at_value, str):
+        created_at_value = datetime.fromisoformat(created_at_value)
+    
+    row = {
+        "match_id": match.match_id,
+        "topic": match.topic,
+        "topic_difficulty": match.topic_difficulty,
+        "rounds_setting": match.rounds_setting,
+        "proponent_model_id": match.proponent_model_id,
+        "opponent_model_id": match.opponent_model_id,
+        "proponent_personality": match.proponent_personality,
+        "opponent_personality": match.opponent_personality,
+        "status": match.status,
+        "transcript": transcript_json,
+        "transcript_blob": None,
+        "judge_result": judge_result_json,
+        "audience_votes": match.audience_votes,
+        "user_id": match.user_id,
+        "created_at": created_at_value,
+    }
+    if elo_changes:
+        row["elo_changes"] = elo_changes
+    
+    # 已结束的比赛不再变化，发言记录转为压缩存储
+    if match.status in transcript_store.COLD_STATUSES and TRANSCRIPT_STORAGE_CONFIG["compress"]:
+        row["transcript_blob"] = transcript_store.compress_transcript(
+            transcript_json, level=TRANSCRIPT_STORAGE_CONFIG["level"]
+        )
+        row["transcript"] = None
+    return row
+
+
+def _apply_match_row(db: AsyncSession, existing: Optional[MatchModel], row: dict):
+    """将行字段写入已有记录，或创建新记录"""
+    if existing:
+        # 更新现有记录（created_at 保持不变）
+        for key, value in row.items():
+            if key not in ("match_id", "created_at"):
+                setattr(existing, key, value)
+        if row["status"] == "FINISHED" and existing.finished_at is None:
+            existing.finished_at = datetime.utcnow()
+    else:
+        match_model = MatchModel(**row)
+        if row["status"] == "FINISHED":
+            match_model.finished_at = datetime.utcnow()
+        db.add(match_model)
+
+
 async def save_match(match: MatchSession):
     """保存或更新比赛（带重试机制）"""
+    await save_matches_bulk([match_to_row(match)])
+
+
+async def save_matches_bulk(rows: List[dict]):
+    """
+    批量保存或更新比赛：一次查询已有记录，一次提交
+    
+    Args:
+        rows: match_to_row 生成的行字段列表（match_id 不应重复）
+    """
+    if not rows:
+        return
     max_retries = 3
     retry_count = 0
     
     while retry_count < max_retries:
-        db = SessionLocal()
-        try:
-            # 检查是否已存在
-            existing = db.query(MatchModel).filter(MatchModel.match_id == match.match_id).first()
-            
-            # 序列化 Turn 对象，处理 datetime
-            transcript_json = []
-            for t in match.history:
-                turn_dict = t.model_dump(mode='json')
-                # 确保 timestamp 是 ISO 格式字符串
-                if 'timestamp' in turn_dict and isinstance(turn_dict['timestamp'], datetime):
-                    turn_dict['timestamp'] = turn_dict['timestamp'].isoformat()
-                transcript_json.append(turn_dict)
-            
-            # 序列化 result
-            judge_result_json = None
-            if match.result:
-                judge_result_json = match.result.model_dump(mode='json')
-            
-            # 确保 created_at 是 datetime 对象
-            created_at_value = match.created_at
-            if isinstance(created_at_value, str):
-                from datetime import datetime as dt
-                created_at_value = dt.fromisoformat(created_at_value)
-            
-            if existing:
-                # 更新现有记录
-                existing.topic = match.topic
-                existing.topic_difficulty = match.topic_difficulty
-                existing.rounds_setting = match.rounds_setting
-                existing.proponent_model_id = match.proponent_model_id
-                existing.opponent_model_id = match.opponent_model_id
-                existing.proponent_personality = match.proponent_personality
-                existing.opponent_personality = match.opponent_personality
-                existing.status = match.status
-                existing.transcript = transcript_json
-                existing.judge_result = judge_result_json
-                existing.audience_votes = match.audience_votes
-                existing.user_id = match.user_id  # 更新用户ID
-                if match.status == "FINISHED":
-                    existing.finished_at = datetime.utcnow()
-            else:
-                # 创建新记录
-                match_model = MatchModel(
-                    match_id=match.match_id,
-                    topic=match.topic,
-                    topic_difficulty=match.topic_difficulty,
-                    rounds_setting=match.rounds_setting,
-                    proponent_model_id=match.proponent_model_id,
-                    opponent_model_id=match.opponent_model_id,
-                    proponent_personality=match.proponent_personality,
-                    opponent_personality=match.opponent_personality,
-                    status=match.status,
-                    transcript=transcript_json,
-                    judge_result=judge_result_json,
-                    audience_votes=match.audience_votes,
-                    user_id=match.user_id,  # 保存用户ID
-                    created_at=created_at_value
-                )
-                db.add(match_model)
-            
-            db.commit()
-            break  # 成功，退出循环
-        except Exception as e:
-            db.rollback()
-            retry_count += 1
-            if retry_count >= max_retries:
-                raise e
-            import time
-            time.sleep(0.1 * retry_count)
-        finally:
-            db.close()
+        async with write_session() as db:
+            try:
+                existing = {
+                    m.match_id: m
+                    for m in (await db.scalars(
+                        select(MatchModel).where(MatchModel.match_id.in_([r["match_id"] for r in rows]))
+                    )).all()
+                }
+                for row in rows:
+                    _apply_match_row(db, existing.get(row["match_id"]), row)
+                await db.commit()
+                break  # 成功，退出循环
+            except Exception as e:
+                await db.rollback()
+                retry_count += 1
+                if retry_count >= max_retries:
+                    raise e
+        # 在释放写锁后退避
+        await asyncio.sleep(0.1 * retry_count)
 
 
 async def update_match_status(match_id: str, status: str, elo_changes: dict = None):
     """更新比赛状态和 ELO 变化"""
-    db = SessionLocal()
-    try:
-        match = db.query(MatchModel).filter(MatchModel.match_id == match_id).first()
+    async with write_session() as db:
+        match = await db.scalar(select(MatchModel).where(MatchModel.match_id == match_id))
         if match:
             match.status = status
             if status == "FINISHED":
                 match.finished_at = datetime.utcnow()
             if elo_changes:
                 match.elo_changes = elo_changes
-            db.commit()
-    finally:
-        db.close()
+            await db.commit()
 
 
 async def get_match(match_id: str) -> Optional[MatchModel]:
     """获取比赛详情"""
-    db = SessionLocal()
-    try:
-        return db.query(MatchModel).filter(MatchModel.match_id == match_id).first()
-    finally:
-        db.close()
+    async with SessionLocal() as db:
+        return await db.scalar(select(MatchModel).where(MatchModel.match_id == match_id))
+
+
+async def get_match_transcript(match: MatchModel) -> list:
+    """读取比赛发言记录（压缩存储的记录透明解压）"""
+    blob = match.transcript_blob
+    if blob and not transcript_store.has_dictionary(transcript_store.blob_dictionary_id(blob)):
+        # 字典可能由其他进程新训练，重新加载
+        await load_transcript_dictionaries()
+    return transcript_store.load_transcript(match.transcript, blob)
+
+
+# ========== 发言记录压缩字典 ==========
+
+async def load_transcript_dictionaries():
+    """加载全部压缩字典，最新的字典用于后续压缩"""
+    async with SessionLocal() as db:
+        dictionaries = (await db.scalars(
+            select(TranscriptDictionaryModel).order_by(TranscriptDictionaryModel.id)
+        )).all()
+    for i, d in enumerate(dictionaries):
+        transcript_store.register_dictionary(d.id, d.data, current=(i == len(dictionaries) - 1))
+
+
+async def save_transcript_dictionary(data: bytes, sample_count: int) -> int:
+    """保存新训练的压缩字典并设为当前字典"""
+    async with write_session() as db:
+        dictionary = TranscriptDictionaryModel(data=data, sample_count=sample_count)
+        db.add(dictionary)
+        await db.commit()
+        dictionary_id = dictionary.id
+    transcript_store.register_dictionary(dictionary_id, data, current=True)
+    return dictionary_id
+
+
+# ========== 进行中比赛归属（多进程共享的比赛注册表）==========
+
+async def register_live_match(match_id: str, worker_id: str, owner_url: Optional[str]):
+    """登记比赛由哪个进程运行"""
+    async with write_session() as db:
+        await db.merge(LiveMatchModel(
+            match_id=match_id,
+            worker_id=worker_id,
+            owner_url=owner_url,
+            heartbeat_at=datetime.utcnow()
+        ))
+        await db.commit()
+
+
+async def touch_live_matches(worker_id: str, match_ids: List[str]):
+    """刷新本进程所有进行中比赛的心跳"""
+    if not match_ids:
+        return
+    async with write_session() as db:
+        await db.execute(
+            update(LiveMatchModel)
+            .where(LiveMatchModel.worker_id == worker_id, LiveMatchModel.match_id.in_(match_ids))
+            .values(heartbeat_at=datetime.utcnow())
+        )
+        await db.commit()
+
+
+async def unregister_live_matches(worker_id: str, match_ids: List[str]):
+    """注销比赛（只删除本进程登记的记录）"""
+    if not match_ids:
+        return
+    async with write_session() as db:
+        await db.execute(
+            delete(LiveMatchModel)
+            .where(LiveMatchModel.worker_id == worker_id, LiveMatchModel.match_id.in_(match_ids))
+        )
+        await db.commit()
+
+
+async def get_live_match_owner(match_id: str, max_age: float) -> Optional[LiveMatchModel]:
+    """查询比赛的运行进程（心跳超过 max_age 秒视为进程已退出）"""
+    async with SessionLocal() as db:
+        return await db.scalar(
+            select(LiveMatchModel).where(
+                LiveMatchModel.match_id == match_id,
+                LiveMatchModel.heartbeat_at >= datetime.utcnow() - timedelta(seconds=max_age)
+            )
+        )
 
 
 async def delete_match(match_id: str, user_id: int = None) -> bool:
     """删除比赛记录"""
-    db = SessionLocal()
-    try:
-        query = db.query(MatchModel).filter(MatchModel.match_id == match_id)
+    async with write_session() as db:
+        query = select(MatchModel).where(MatchModel.match_id == match_id)
         # 如果提供了 user_id，验证所有权
         if user_id:
-            query = query.filter(MatchModel.user_id == user_id)
+            query = query.where(MatchModel.user_id == user_id)
         
-        match = query.first()
+        match = await db.scalar(query)
         if match:
-            db.delete(match)
-            db.commit()
+            await db.delete(match)
+            await db.commit()
             return True
         return False
-    finally:
-        db.close()
 
 
 async def rename_match(match_id: str, title: str, user_id: int = None) -> bool:
     """重命名比赛"""
-    db = SessionLocal()
-    try:
-        query = db.query(MatchModel).filter(MatchModel.match_id == match_id)
+    async with write_session() as db:
+        query = select(MatchModel).where(MatchModel.match_id == match_id)
         # 如果提供了 user_id，验证所有权
         if user_id:
-            query = query.filter(MatchModel.user_id == user_id)
+            query = query.where(MatchModel.user_id == user_id)
         
-        match = query.first()
+        match = await db.scalar(query)
         if match:
             match.custom_title = title
-            db.commit()
+            await db.commit()
             return True
         return False
-    finally:
-        db.close()
+
+
+# 列表类查询不加载发言记录
+_LIST_OPTIONS = (defer(MatchModel.transcript), defer(MatchModel.transcript_blob))
+
+
+def _select_model_matches(model_id: str, order_column, limit: int, *conditions):
+    """
+    查询模型参与的比赛（正方或反方），按 order_column 倒序取前 limit 条
+    
+    OR 条件无法同时利用两个索引，这里改写为正方、反方各自走复合索引取前 limit 条，
+    对 id 取并集（同模型对战只保留一条）后再排序截断
+    """
+    branches = [
+        select(MatchModel.id)
+        .where(column == model_id, *conditions)
+        .order_by(desc(order_column))
+        .limit(limit)
+        .subquery()
+        for column in (MatchModel.proponent_model_id, MatchModel.opponent_model_id)
+    ]
+    ids = union(*[select(branch.c.id) for branch in branches]).subquery()
+    return (
+        select(MatchModel)
+        .options(*_LIST_OPTIONS)
+        .join(ids, MatchModel.id == ids.c.id)
+        .order_by(desc(order_column))
+        .limit(limit)
+    )
 
 
 async def get_match_history(limit: int = 50, model_id: str = None, user_id: int = None) -> List[MatchModel]:
     """获取历史比赛（支持按模型和用户筛选）"""
-    db = SessionLocal()
-    try:
-        query = db.query(MatchModel)
+    async with SessionLocal() as db:
+        # 按用户筛选
+        conditions = [MatchModel.user_id == user_id] if user_id else []
         
-        # 按模型筛选（包含正方或反方）
         if model_id:
-            query = query.filter(
-                (MatchModel.proponent_model_id == model_id) | 
-                (MatchModel.opponent_model_id == model_id)
-            )
+            # 按模型筛选（包含正方或反方）
+            query = _select_model_matches(model_id, MatchModel.created_at, limit, *conditions)
+        else:
+            query = select(MatchModel).options(*_LIST_OPTIONS).where(*conditions).order_by(desc(MatchModel.created_at)).limit(limit)
         
-        # 按用户筛选
-        if user_id:
-            query = query.filter(MatchModel.user_id == user_id)
-        
-        return query.order_by(desc(MatchModel.created_at)).limit(limit).all()
-    finally:
-        db.close()
+        return (await db.scalars(query)).all()
 
 
 async def get_model_statistics(model_id: str) -> dict:
@@ -466,16 +677,11 @@ async def get_model_statistics(model_id: str) -> dict:
             "total_matches": 50
         }
     """
-    db = SessionLocal()
-    try:
+    async with SessionLocal() as db:
         # 获取该模型的最近比赛记录
-        matches = db.query(MatchModel).filter(
-            (
-                (MatchModel.proponent_model_id == model_id) | 
-                (MatchModel.opponent_model_id == model_id)
-            ),
-            MatchModel.status == 'FINISHED'
-        ).order_by(desc(MatchModel.finished_at)).limit(20).all()
+        matches = (await db.scalars(_select_model_matches(
+            model_id, MatchModel.finished_at, 20, MatchModel.status == 'FINISHED'
+        ))).all()
         
         # 计算最近战绩（包含对手信息）
         recent_form = []
@@ -516,9 +722,9 @@ async def get_model_statistics(model_id: str) -> dict:
         elo_trend = sum(elo_changes) if elo_changes else 0
         
         # 获取当前ELO和历史最高ELO
-        competitor = db.query(CompetitorModel).filter(
+        competitor = await db.scalar(select(CompetitorModel).where(
             CompetitorModel.model_id == model_id
-        ).first()
+        ))
         
         current_elo = competitor.elo_rating if competitor else 1200
         peak_elo = current_elo
@@ -537,8 +743,6 @@ async def get_model_statistics(model_id: str) -> dict:
             "peak_elo": peak_elo,
             "total_matches": len(matches)
         }
-    finally:
-        db.close()
 
 
 def _get_match_result_for_model(match: MatchModel, model_id: str) -> str:
@@ -555,3 +759,157 @@ def _get_match_result_for_model(match: MatchModel, model_id: str) -> str:
         return 'W'
     else:
         return 'L'
+
+
+# ========== 比赛任务队列（队列模式）==========
+
+# 任务的结束状态
+JOB_TERMINAL_STATUSES = ("DONE", "FAILED", "CANCELLED")
+
+
+async def enqueue_match_job(match_id: str, payload: dict):
+    """写入比赛任务"""
+    async with write_session() as db:
+        db.add(MatchJobModel(match_id=match_id, payload=payload, status="QUEUED"))
+        await db.commit()
+
+
+async def lease_match_job(worker_id: str, lease_seconds: float, max_attempts: int) -> Optional[MatchJobModel]:
+    """
+    领取一个任务：排队中的任务，或租约已过期（worker 失联）的运行中任务
+    
+    通过带条件的 UPDATE 抢占，多个 worker 并发领取同一任务时只有一个成功；
+    已达到最大执行次数的过期任务标记为 FAILED
+    """
+    now = datetime.utcnow()
+    claimable = or_(
+        MatchJobModel.status == "QUEUED",
+        and_(MatchJobModel.status == "RUNNING", MatchJobModel.lease_expires_at < now)
+    )
+    async with write_session() as db:
+        candidates = (await db.execute(
+            select(MatchJobModel.id, MatchJobModel.attempts)
+            .where(claimable)
+            .order_by(MatchJobModel.id)
+            .limit(8)
+        )).all()
+        for job_id, attempts in candidates:
+            if attempts >= max_attempts:
+                await db.execute(
+                    update(MatchJobModel)
+                    .where(MatchJobModel.id == job_id, claimable)
+                    .values(status="FAILED", error="worker 失联，已达到最大执行次数", updated_at=now)
+                )
+                await db.commit()
+                continue
+            result = await db.execute(
+                update(MatchJobModel)
+                .where(MatchJobModel.id == job_id, claimable)
+                .values(
+                    status="RUNNING",
+                    worker_id=worker_id,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds),
+                    attempts=MatchJobModel.attempts + 1,
+                    updated_at=now
+                )
+            )
+            await db.commit()
+            if result.rowcount == 1:
+                return await db.get(MatchJobModel, job_id)
+    return None
+
+
+async def renew_match_job_leases(worker_id: str, job_ids: List[int], lease_seconds: float) -> List[int]:
+    """续约本 worker 持有的任务，返回其中请求取消的任务 ID"""
+    if not job_ids:
+        return []
+    now = datetime.utcnow()
+    async with write_session() as db:
+        await db.execute(
+            update(MatchJobModel)
+            .where(
+                MatchJobModel.id.in_(job_ids),
+                MatchJobModel.worker_id == worker_id,
+                MatchJobModel.status == "RUNNING"
+            )
+            .values(lease_expires_at=now + timedelta(seconds=lease_seconds), updated_at=now)
+        )
+        await db.commit()
+        return list((await db.scalars(
+            select(MatchJobModel.id).where(MatchJobModel.id.in_(job_ids), MatchJobModel.cancel_requested.is_(True))
+        )).all())
+
+
+async def finish_match_job(job_id: int, worker_id: str, status: str, error: str = None):
+    """标记任务结束（只更新本 worker 持有的任务）"""
+    async with write_session() as db:
+        await db.execute(
+            update(MatchJobModel)
+            .where(MatchJobModel.id == job_id, MatchJobModel.worker_id == worker_id)
+            .values(status=status, error=error, lease_expires_at=None, updated_at=datetime.utcnow())
+        )
+        await db.commit()
+
+
+async def request_match_job_cancel(match_id: str):
+    """请求取消任务：排队中的任务直接取消，运行中的任务由 worker 在续约时取消"""
+    async with write_session() as db:
+        await db.execute(
+            update(MatchJobModel)
+            .where(MatchJobModel.match_id == match_id, MatchJobModel.status == "QUEUED")
+            .values(status="CANCELLED", updated_at=datetime.utcnow())
+        )
+        await db.execute(
+            update(MatchJobModel)
+            .where(MatchJobModel.match_id == match_id, MatchJobModel.status == "RUNNING")
+            .values(cancel_requested=True)
+        )
+        await db.commit()
+
+
+async def get_match_job(match_id: str) -> Optional[MatchJobModel]:
+    async with SessionLocal() as db:
+        return await db.scalar(select(MatchJobModel).where(MatchJobModel.match_id == match_id))
+
+
+async def append_match_events(rows: List[dict]):
+    """批量写入事件帧（rows: match_id / seq / frame）"""
+    if not rows:
+        return
+    async with write_session() as db:
+        await db.execute(insert(MatchEventModel), rows)
+        await db.commit()
+
+
+async def get_match_events(match_id: str, after_seq: int = 0, limit: int = 500) -> List[tuple]:
+    """读取 after_seq 之后的事件帧，返回 [(seq, frame), ...]"""
+    async with SessionLocal() as db:
+        return (await db.execute(
+            select(MatchEventModel.seq, MatchEventModel.frame)
+            .where(MatchEventModel.match_id == match_id, MatchEventModel.seq > after_seq)
+            .order_by(MatchEventModel.seq)
+            .limit(limit)
+        )).all()
+
+
+async def get_last_match_event_seq(match_id: str) -> int:
+    async with SessionLocal() as db:
+        return await db.scalar(
+            select(func.max(MatchEventModel.seq)).where(MatchEventModel.match_id == match_id)
+        ) or 0
+
+
+async def purge_match_events(older_than_seconds: float) -> int:
+    """删除已结束超过 older_than_seconds 秒的任务的事件帧"""
+    cutoff = datetime.utcnow() - timedelta(seconds=older_than_seconds)
+    async with write_session() as db:
+        result = await db.execute(
+            delete(MatchEventModel).where(MatchEventModel.match_id.in_(
+                select(MatchJobModel.match_id).where(
+                    MatchJobModel.status.in_(JOB_TERMINAL_STATUSES),
+                    MatchJobModel.updated_at < cutoff
+                )
+            ))
+        )
+        await db.commit()
+        return result.rowcount
@@ -5,23 +5,87 @@
 """
 
 import asyncio
-from typing import List, Optional, AsyncGenerator
+import time
+from typing import Callable, Dict, List, Optional, AsyncGenerator, Tuple
 
 from .log import logger
 from .models import MatchSession, JudgeScore, MatchResult, Turn
-from .llm_client import query_model
-from .utils import parse_json
-from .config import JUDGE_PANEL
+from .llm_client import query_model, query_model_stream
+from .utils import IncrementalJSONParser, JSONStreamError
+from .config import JUDGE_PANEL, JUDGE_MAX_RETRIES, JUDGE_STRUCTURED_OUTPUT_MODELS
 
+JUDGE_DIMENSIONS = ("logic", "evidence", "persuasion")
 
-async def judge_match_with_panel_stream(match: MatchSession, judges: List[str] = None) -> AsyncGenerator[dict, None]:
+# 裁判输出的 JSON Schema（用于结构化输出约束）
+_SIDE_SCORES_SCHEMA = {
+    "type": "object",
+    "properties": {dim: {"type": "number", "minimum": 0, "maximum": 10} for dim in JUDGE_DIMENSIONS},
+    "required": list(JUDGE_DIMENSIONS),
+    "additionalProperties": False
+}
+
+JUDGE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "scores": {
+            "type": "object",
+            "properties": {"proponent": _SIDE_SCORES_SCHEMA, "opponent": _SIDE_SCORES_SCHEMA},
+            "required": ["proponent", "opponent"],
+            "additionalProperties": False
+        },
+        "winner": {"type": "string", "enum": ["proponent", "opponent", "draw"]},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["scores", "winner", "reasoning"],
+    "additionalProperties": False
+}
+
+JUDGE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "judge_score", "schema": JUDGE_RESPONSE_SCHEMA, "strict": True}
+}
+
+# 参数错误信息中出现这些关键词时，才认为是结构化输出参数被拒绝
+_RESPONSE_FORMAT_ERROR_KEYWORDS = ("response_format", "json_schema", "structured output", "structured_output")
+
+# 降级为普通输出的有效期（秒），过期后重新尝试结构化输出（提供方可能只是暂时不支持）
+STRUCTURED_OUTPUT_RETRY_SECONDS = 60 * 60
+
+# 拒绝结构化输出参数的模型 -> 记录时间（time.monotonic()）
+_structured_output_unsupported: Dict[str, float] = {}
+
+# 各裁判模型的解析统计
+_judge_stats: Dict[str, Dict[str, int]] = {}
+
+
+class JudgeError(Exception):
+    """裁判评分失败（API 错误或多次输出格式错误）"""
+
+
+class JudgeAPIError(JudgeError):
+    """裁判模型 API 调用失败"""
+    
+    def __init__(self, message: str, error_type: str = "unknown"):
+        super().__init__(message)
+        self.error_type = error_type
+
+
+async def judge_match_with_panel_stream(
+    match: MatchSession,
+    judges: List[str] = None,
+    deadline: Optional[float] = None
+) -> AsyncGenerator[dict, None]:
     """
     多裁判投票制 (流式)
     
+    deadline: 评分截止时间（event loop 时间），到期仍未完成的裁判取消并按评分失败处理
+    
     Yields:
         {"type": "judge_start", "judges": [...]}
+        {"type": "judge_partial", "judge": "gpt-4o", "field": "scores.proponent.logic", "value": 8.5}
         {"type": "judge_progress", "judge": "gpt-4o", "progress": 0.33}
         {"type": "judge_score", "judge_score": JudgeScore}
+        {"type": "judge_failed", "judge": "gpt-4o", "error": "..."}
         {"type": "judge_complete", "result": MatchResult}
     """
     
@@ -40,34 +104,147 @@ async def judge_match_with_panel_stream(match: MatchSession, judges: List[str] =
     logger.info(f"📋 裁判团: {judges}")
     yield {"type": "judge_start", "judges": judges}
     
-    # 并行调用裁判 (带进度推送)
+    # 并行调用裁判 (带进度推送)，通过队列合并各裁判的部分评分和最终评分
     judge_scores: List[JudgeScore] = []
     total_judges = len(judges)
+    queue: asyncio.Queue = asyncio.Queue()
     
-    tasks = []
-    for i, judge_model in enumerate(judges):
-        tasks.append(judge_single_with_progress(match, judge_model, i, total_judges))
+    async def run_judge(judge_model: str, index: int):
+        def on_partial(field: str, value):
+            queue.put_nowait(("partial", {
+                "type": "judge_partial",
+                "judge": judge_model,
+                "field": field,
+                "value": value
+            }))
+        result = await judge_single_with_progress(match, judge_model, index, total_judges, on_partial)
+        queue.put_nowait(("done", result))
+    
+    tasks = [asyncio.create_task(run_judge(judge_model, i)) for i, judge_model in enumerate(judges)]
     
     # 收集裁判评分
-    for coro in asyncio.as_completed(tasks):
-        score, judge_model, index = await coro
-        judge_scores.append(score)
-        
-        logger.info(f"✅ 裁判 {index + 1}/{total_judges} ({judge_model}) 完成评分，胜者: {score.winner}")
-        
-        yield {
-            "type": "judge_progress",
-            "judge": judge_model,
-            "progress": len(judge_scores) / total_judges,
-            "current": len(judge_scores),
-            "total": total_judges
-        }
-        
-        yield {
-            "type": "judge_score",
-            "judge_score": score.model_dump(mode='json')
-        }
+    finished = 0
+    pending = set(range(total_judges))
+    loop = asyncio.get_running_loop()
+    try:
+        while finished < total_judges:
+            try:
+                if deadline is None:
+                    kind, payload = await queue.get()
+                else:
+                    kind, payload = await asyncio.wait_for(queue.get(), timeout=max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                for index in sorted(pending):
+                    logger.warning(f"⚠️ 裁判 {index + 1}/{total_judges} ({judges[index]}) 评分超时，不计入结果")
+                    yield {
+                        "type": "judge_failed",
+                        "judge": judges[index],
+                        "error": "评分超时"
+                    }
+                break
+            if kind == "partial":
+                yield payload
+                continue
+            
+            score, judge_model, index, error = payload
+            finished += 1
+            pending.discard(index)
+            
+            yield {
+                "type": "judge_progress",
+                "judge": judge_model,
+                "progress": finished / total_judges,
+                "current": finished,
+                "total": total_judges
+            }
+            
+            if score is None:
+                # 评分失败的裁判不参与计票，避免默认平局污染 ELO
+                logger.warning(f"⚠️ 裁判 {index + 1}/{total_judges} ({judge_model}) 评分失败，不计入结果: {error}")
+                yield {
+                    "type": "judge_failed",
+                    "judge": judge_model,
+                    "error": error
+                }
+                continue
+            
+            judge_scores.append(score)
+            logger.info(f"✅ 裁判 {index + 1}/{total_judges} ({judge_model}) 完成评分，胜者: {score.winner}")
+            
+            yield {
+                "type": "judge_score",
+                "judge_score": score
+            }
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    
+    if not judge_scores:
+        logger.error("❌ 所有裁判评分失败，本场不产生结果")
+        yield {"type": "status", "content": "所有裁判评分失败，本场比赛不计结果"}
+        return
+    
+    result = aggregate_judge_scores(match, judge_scores)
     
+    yield {
+        "type": "judge_complete",
+        "result": result
+    }
+
+
+async def judge_match_with_panel(
+    match: MatchSession,
+    judges: List[str] = None,
+    deadline: Optional[float] = None
+) -> Tuple[Optional[MatchResult], Dict[str, str]]:
+    """
+    多裁判投票制 (非流式，批量评测使用)
+    
+    与 judge_match_with_panel_stream 的计票规则相同，裁判使用非流式调用，不输出中间事件
+    
+    Returns:
+        (result, failures): 全部裁判失败时 result 为 None，failures 为 {裁判模型: 错误描述}
+    """
+    if judges is None:
+        judges = JUDGE_PANEL
+    if len(judges) < 2:
+        judges = ["gpt-4o", "gpt-4o-mini"]
+        logger.warning(f"⚠️ 裁判数量不足，使用默认裁判: {judges}")
+    
+    tasks = [
+        asyncio.create_task(judge_single_with_progress(match, judge_model, i, len(judges), stream=False))
+        for i, judge_model in enumerate(judges)
+    ]
+    loop = asyncio.get_running_loop()
+    timeout = None if deadline is None else max(deadline - loop.time(), 0)
+    _, pending = await asyncio.wait(tasks, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    
+    judge_scores: List[JudgeScore] = []
+    failures: Dict[str, str] = {}
+    for i, task in enumerate(tasks):
+        if task in pending:
+            failures[judges[i]] = "评分超时"
+            continue
+        score, judge_model, _, error = task.result()
+        if score is None:
+            failures[judge_model] = error
+        else:
+            judge_scores.append(score)
+    for judge_model, error in failures.items():
+        logger.warning(f"⚠️ 裁判 {judge_model} 评分失败，不计入结果: {error}")
+    
+    if not judge_scores:
+        logger.error("❌ 所有裁判评分失败，本场不产生结果")
+        return None, failures
+    return aggregate_judge_scores(match, judge_scores), failures
+
+
+def aggregate_judge_scores(match: MatchSession, judge_scores: List[JudgeScore]) -> MatchResult:
+    """综合各裁判评分：多数票、平均分和观众投票加成"""
     # === 综合打分 ===
     logger.info("📊 开始综合打分")
     
@@ -124,7 +301,7 @@ async def judge_match_with_panel_stream(match: MatchSession, judges: List[str] =
     # 生成综合判词
     reasoning = generate_final_reasoning(judge_scores, winner, audience_winner)
     
-    result = MatchResult(
+    return MatchResult(
         winner=final_winner,
         judge_scores=judge_scores,
         final_scores={
@@ -136,27 +313,229 @@ async def judge_match_with_panel_stream(match: MatchSession, judges: List[str] =
         reasoning=reasoning,
         mvp_turn_index=find_mvp_turn(match)
     )
-    
-    yield {
-        "type": "judge_complete",
-        "result": result.model_dump(mode='json')
-    }
 
 
 async def judge_single_with_progress(
     match: MatchSession, 
     judge_model: str, 
     index: int, 
-    total: int
+    total: int,
+    on_partial: Optional[Callable[[str, object], None]] = None,
+    stream: bool = True
 ) -> tuple:
-    """单个裁判的评分 (带进度)"""
+    """
+    单个裁判的评分 (带进度)
+    
+    Returns:
+        (score, judge_model, index, error): 失败时 score 为 None，error 为错误描述
+    """
     logger.info(f"👨‍⚖️ 裁判 {index + 1}/{total} ({judge_model}) 开始评分")
-    score = await judge_single(match, judge_model)
-    return score, judge_model, index
+    try:
+        score = await judge_single(match, judge_model, on_partial, stream)
+        return score, judge_model, index, None
+    except JudgeError as e:
+        logger.error(f"❌ 裁判 {judge_model} 评分失败: {e}")
+        return None, judge_model, index, str(e)
+    except Exception as e:
+        logger.error(f"❌ 裁判 {judge_model} 评分失败 (未知错误): {type(e).__name__} - {e}", exc_info=True)
+        return None, judge_model, index, f"{type(e).__name__}: {e}"
+
+
+async def stream_judge_response(
+    judge_model: str,
+    messages: List[dict],
+    parser: IncrementalJSONParser,
+    on_partial: Optional[Callable[[str, object], None]] = None,
+    response_format: Optional[dict] = None
+) -> dict:
+    """
+    流式获取裁判响应并增量解析 JSON
+    
+    每解析出一个字段就回调 on_partial("scores.proponent.logic", 8.5)；
+    输出一旦确定不是合法 JSON 立即关闭流并抛出 JSONStreamError
+    """
+    stream = query_model_stream(judge_model, messages, response_format=response_format)
+    try:
+        async for event in stream:
+            if event["type"] == "content":
+                for path, value in parser.feed(event["delta"]):
+                    if on_partial is not None:
+                        on_partial(".".join(str(p) for p in path), value)
+                if parser.done:
+                    break
+            elif event["type"] == "done":
+                break
+            elif event["type"] == "error":
+                error_type = event.get("error_type", "unknown")
+                logger.error(f"❌ 裁判 {judge_model} API调用失败 [{error_type}]: {event['error']}")
+                raise JudgeAPIError(f"API调用失败 [{error_type}]: {event['error']}", error_type)
+    finally:
+        await stream.aclose()
+    return parser.finish()
+
 
+async def fetch_judge_response(
+    judge_model: str,
+    messages: List[dict],
+    parser: IncrementalJSONParser,
+    response_format: Optional[dict] = None
+) -> dict:
+    """非流式获取裁判响应并解析 JSON（与 stream_judge_response 相同的解析和错误处理）"""
+    response = await query_model(judge_model, messages, response_format=response_format)
+    if "error_type" in response:
+        error_type = response["error_type"]
+        logger.error(f"❌ 裁判 {judge_model} API调用失败 [{error_type}]: {response['content']}")
+        raise JudgeAPIError(f"API调用失败 [{error_type}]: {response['content']}", error_type)
+    parser.feed(response["content"])
+    return parser.finish()
 
-async def judge_single(match: MatchSession, judge_model: str) -> JudgeScore:
-    """单个裁判的评分"""
+
+def validate_judge_result(result) -> Tuple[Optional[dict], List[str]]:
+    """
+    按 JUDGE_RESPONSE_SCHEMA 校验裁判输出
+    
+    Returns:
+        (normalized, errors): 校验通过时 errors 为空，normalized 为规范化后的结果
+    """
+    if not isinstance(result, dict):
+        return None, ["顶层必须是 JSON 对象"]
+    
+    errors = []
+    scores = {}
+    raw_scores = result.get("scores")
+    if not isinstance(raw_scores, dict):
+        errors.append("缺少 scores 对象")
+    else:
+        for side in ("proponent", "opponent"):
+            side_scores = raw_scores.get(side)
+            if not isinstance(side_scores, dict):
+                errors.append(f"缺少 scores.{side} 对象")
+                continue
+            scores[side] = {}
+            for dim in JUDGE_DIMENSIONS:
+                value = side_scores.get(dim)
+                if isinstance(value, str):
+                    try:
+                        value = float(value)
+                    except ValueError:
+                        pass
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    errors.append(f"scores.{side}.{dim} 必须是数字")
+                elif not 0 <= value <= 10:
+                    errors.append(f"scores.{side}.{dim} 必须在 0-10 之间")
+                else:
+                    scores[side][dim] = float(value)
+    
+    winner = result.get("winner")
+    if winner not in ("proponent", "opponent", "draw"):
+        errors.append("winner 必须是 proponent、opponent 或 draw")
+    
+    reasoning = result.get("reasoning", "")
+    if not isinstance(reasoning, str):
+        errors.append("reasoning 必须是字符串")
+    
+    if errors:
+        return None, errors
+    return {"scores": scores, "winner": winner, "reasoning": reasoning}, []
+
+
+def build_repair_prompt(raw_output: str, errors: List[str]) -> str:
+    """构建修复格式错误的提示词（不包含辩论记录，开销很小）"""
+    error_lines = "\n".join(f"- {e}" for e in errors)
+    return f"""
+你之前输出的辩论评分不符合要求的 JSON 格式，请修正。
+
+【格式错误】
+{error_lines}
+
+【原始输出】
+{raw_output[-4000:]}
+
+【要求】
+- 只输出一个 JSON 对象，不要输出任何其他内容
+- 保留原始输出中的评分、胜者和判词，不要修改分数
+- 如果原始输出中缺少评分，输出 {{"scores": null}}
+- 格式: {{"scores": {{"proponent": {{"logic": 0-10, "evidence": 0-10, "persuasion": 0-10}}, "opponent": {{...}}}}, "winner": "proponent|opponent|draw", "reasoning": "..."}}
+"""
+
+
+def get_judge_stats() -> Dict[str, dict]:
+    """各裁判模型的输出解析统计（解析失败率、修复成功数等）"""
+    stats = {}
+    for model, counts in _judge_stats.items():
+        responses = counts["responses"]
+        stats[model] = {
+            **counts,
+            "parse_failure_rate": round(counts["parse_failures"] / responses, 4) if responses else 0.0
+        }
+    return stats
+
+
+def _stats_for(judge_model: str) -> Dict[str, int]:
+    return _judge_stats.setdefault(judge_model, {
+        "requests": 0,         # 评分请求数
+        "responses": 0,        # 完整评分响应数（含重试）
+        "parse_failures": 0,   # 格式错误的响应数
+        "repairs": 0,          # 修复请求数
+        "repaired": 0,         # 修复成功数
+        "failures": 0,         # 最终失败数
+    })
+
+
+async def _judge_attempt(
+    judge_model: str,
+    messages: List[dict],
+    on_partial: Optional[Callable[[str, object], None]] = None,
+    stream: bool = True
+) -> Tuple[str, Optional[dict], List[str]]:
+    """
+    发起一次裁判请求，返回 (原始输出, 规范化结果, 错误列表)
+    
+    支持的模型使用结构化输出；如果提供方明确拒绝该参数，在一段时间内降级为普通输出
+    （其他参数错误照常抛出，不影响之后的结构化输出）
+    stream=False 时使用非流式调用（不回调 on_partial）
+    """
+    unsupported_at = _structured_output_unsupported.get(judge_model)
+    if unsupported_at is not None and time.monotonic() - unsupported_at >= STRUCTURED_OUTPUT_RETRY_SECONDS:
+        del _structured_output_unsupported[judge_model]
+        unsupported_at = None
+    use_schema = (
+        unsupported_at is None
+        and any(judge_model.startswith(prefix) for prefix in JUDGE_STRUCTURED_OUTPUT_MODELS)
+    )
+    parser = IncrementalJSONParser()
+    response_format = JUDGE_RESPONSE_FORMAT if use_schema else None
+    try:
+        if stream:
+            result = await stream_judge_response(judge_model, messages, parser, on_partial, response_format)
+        else:
+            result = await fetch_judge_response(judge_model, messages, parser, response_format)
+    except JudgeAPIError as e:
+        if use_schema and e.error_type == "bad_request" and _is_response_format_error(str(e)):
+            logger.warning(f"⚠️ 裁判 {judge_model} 不支持结构化输出，降级为普通 JSON 输出")
+            _structured_output_unsupported[judge_model] = time.monotonic()
+            return await _judge_attempt(judge_model, messages, on_partial, stream)
+        raise
+    except JSONStreamError as e:
+        return parser.text, None, [f"输出不是合法 JSON: {e}"]
+    
+    normalized, errors = validate_judge_result(result)
+    return parser.text, normalized, errors
+
+
+def _is_response_format_error(message: str) -> bool:
+    """参数错误是否针对结构化输出参数"""
+    message = message.lower()
+    return any(keyword in message for keyword in _RESPONSE_FORMAT_ERROR_KEYWORDS)
+
+
+async def judge_single(
+    match: MatchSession,
+    judge_model: str,
+    on_partial: Optional[Callable[[str, object], None]] = None,
+    stream: bool = True
+) -> JudgeScore:
+    """单个裁判的评分（stream=False 时使用非流式调用）"""
     
     transcript = format_transcript(match.history)
     
@@ -214,55 +593,52 @@ async def judge_single(match: MatchSession, judge_model: str) -> JudgeScore:
 }}
 """
     
-    try:
-        logger.debug(f"   发送评分请求到 {judge_model}")
-        response = await query_model(judge_model, [{"role": "user", "content": judge_prompt}])
-        
-        # 检查是否有错误
-        if "error_type" in response:
-            error_type = response.get("error_type", "unknown")
-            error_msg = response.get("content", "Unknown error")
-            logger.error(f"❌ 裁判 {judge_model} API调用失败 [{error_type}]: {error_msg}")
-            raise ValueError(f"API调用失败 [{error_type}]: {error_msg}")
+    stats = _stats_for(judge_model)
+    stats["requests"] += 1
+    messages = [{"role": "user", "content": judge_prompt}]
+    
+    result = None
+    errors: List[str] = []
+    for attempt in range(JUDGE_MAX_RETRIES + 1):
+        logger.debug(f"   发送评分请求到 {judge_model} (第 {attempt + 1} 次)")
+        try:
+            raw_output, result, errors = await _judge_attempt(judge_model, messages, on_partial, stream)
+        except JudgeAPIError:
+            stats["failures"] += 1
+            raise
+        stats["responses"] += 1
+        if not errors:
+            break
         
-        result = parse_json(response['content'])
+        stats["parse_failures"] += 1
+        logger.warning(f"⚠️ 裁判 {judge_model} 输出格式错误: {errors}")
         
-        # 验证必要字段
-        if not result or 'scores' not in result:
-            raise ValueError(f"Invalid judge response: {response['content'][:200]}")
-        
-        logger.debug(f"   {judge_model} 评分结果: {result.get('winner', 'unknown')}")
-        
-        return JudgeScore(
-            judge_model=judge_model,
-            scores=result['scores'],
-            winner=result.get('winner', 'draw'),
-            reasoning=result.get('reasoning', '')
-        )
-    except ValueError as e:
-        # JSON 解析错误或响应格式错误
-        logger.error(f"❌ 裁判 {judge_model} 响应格式错误: {e}", exc_info=True)
-        return JudgeScore(
-            judge_model=judge_model,
-            scores={
-                "proponent": {"logic": 5.0, "evidence": 5.0, "persuasion": 5.0},
-                "opponent": {"logic": 5.0, "evidence": 5.0, "persuasion": 5.0}
-            },
-            winner="draw",
-            reasoning=f"评分出错（响应格式错误），默认平局。错误: {str(e)}"
-        )
-    except Exception as e:
-        # 其他未知错误
-        logger.error(f"❌ 裁判 {judge_model} 评分失败 (未知错误): {type(e).__name__} - {e}", exc_info=True)
-        return JudgeScore(
-            judge_model=judge_model,
-            scores={
-                "proponent": {"logic": 5.0, "evidence": 5.0, "persuasion": 5.0},
-                "opponent": {"logic": 5.0, "evidence": 5.0, "persuasion": 5.0}
-            },
-            winner="draw",
-            reasoning=f"评分出错（{type(e).__name__}），默认平局"
-        )
+        # 先尝试低成本的定向修复，失败再完整重评
+        if raw_output.strip():
+            stats["repairs"] += 1
+            repair_messages = [{"role": "user", "content": build_repair_prompt(raw_output, errors)}]
+            try:
+                _, result, errors = await _judge_attempt(judge_model, repair_messages, stream=stream)
+            except JudgeAPIError:
+                stats["failures"] += 1
+                raise
+            if not errors:
+                stats["repaired"] += 1
+                logger.info(f"🔧 裁判 {judge_model} 输出已修复")
+                break
+    
+    if errors:
+        stats["failures"] += 1
+        raise JudgeError(f"裁判输出格式错误: {'; '.join(errors)}")
+    
+    logger.debug(f"   {judge_model} 评分结果: {result['winner']}")
+    
+    return JudgeScore(
+        judge_model=judge_model,
+        scores=result['scores'],
+        winner=result['winner'],
+        reasoning=result['reasoning']
+    )
 
 
 def format_transcript(history: List[Turn]) -> str:
@@ -3,268 +3,561 @@
 @author:XuMing(xuming624@qq.com)
 @description: LLM 客户端 - 兼容 OpenAI SDK"""
 
-from openai import (
-    AsyncOpenAI,
-    APIError,
-    APIConnectionError,
-    RateLimitError,
-    APITimeoutError,
-    AuthenticationError,
-    BadRequestError
-)
+import asyncio
 import json
-from typing import List, Dict, AsyncGenerator, Optional
+from contextlib import aclosing
+from typing import List, Dict, AsyncGenerator, Optional, Tuple
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from backend.log import logger
-from backend.config import LLM_CONFIG
+from backend.config import LLM_CONFIG, HTTP_TRANSPORT_CONFIG, LLM_TRANSPORT_OVERRIDES, PROVIDER_ROUTING_CONFIG
+from backend.provider_router import FAILOVER_ERROR_TYPES, get_provider_router
+from backend.llm_recorder import LLMRecorder, get_llm_recorder, make_request_key
 
-# 使用异步客户端，支持真正的并发
-client = AsyncOpenAI(
-    api_key=LLM_CONFIG['api_key'],
-    base_url=LLM_CONFIG['base_url'],
-    timeout=LLM_CONFIG['timeout']
-)
-logger.info(f"LLM client: {client}, LLM base_url: {LLM_CONFIG['base_url']}, api_key: {LLM_CONFIG.get('api_key', '')[:6]}...")
+# openai SDK 导入较慢（约 0.5 秒），首次调用模型时才导入并创建客户端，缩短进程启动时间
+# 每个 base_url 一个客户端，各自持有独立的 HTTP 连接池，进程内所有比赛共享
+_clients = {}
 
 
-async def query_model_stream(
+def get_transport_config(base_url: str) -> dict:
+    """base_url 对应的连接池参数（全局配置 + LLM_TRANSPORT_OVERRIDES 覆盖）"""
+    return {**HTTP_TRANSPORT_CONFIG, **LLM_TRANSPORT_OVERRIDES.get(base_url, {})}
+
+
+def _build_http_client(base_url: str):
+    """按连接池参数创建 httpx 异步客户端"""
+    import httpx
+    from openai import DefaultAsyncHttpxClient
+
+    transport = get_transport_config(base_url)
+    http2 = transport["http2"]
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("LLM_HTTP2 已开启但未安装 h2（pip install 'httpx[http2]'），回退到 HTTP/1.1")
+            http2 = False
+    limits = httpx.Limits(
+        max_connections=transport["max_connections"],
+        max_keepalive_connections=transport["max_keepalive_connections"],
+        keepalive_expiry=transport["keepalive_expiry"],
+    )
+    return DefaultAsyncHttpxClient(limits=limits, http2=http2), transport, http2
+
+
+def get_client(base_url: Optional[str] = None, api_key: Optional[str] = None):
+    """获取 base_url 对应的异步客户端（首次调用时创建），支持真正的并发"""
+    base_url = base_url or LLM_CONFIG['base_url']
+    client = _clients.get(base_url)
+    if client is None:
+        from openai import AsyncOpenAI
+        http_client, transport, http2 = _build_http_client(base_url)
+        key = api_key or LLM_CONFIG['api_key']
+        client = AsyncOpenAI(
+            api_key=key,
+            base_url=base_url,
+            timeout=LLM_CONFIG['timeout'],
+            http_client=http_client
+        )
+        _clients[base_url] = client
+        logger.info(
+            f"LLM client: {base_url}, api_key: {(key or '')[:6]}..., "
+            f"max_connections: {transport['max_connections']}, "
+            f"max_keepalive: {transport['max_keepalive_connections']}, "
+            f"keepalive_expiry: {transport['keepalive_expiry']}s, http2: {http2}"
+        )
+    return client
+
+
+async def close_clients():
+    """关闭全部客户端及其连接池"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.warning(f"关闭 LLM 客户端失败: {e}")
+
+
+def _classify_error(e: Exception, first_token_timeout: float = 0) -> Tuple[str, str]:
+    """模型调用异常 -> (error_type, 错误描述)"""
+    from openai import (
+        APIError,
+        APIConnectionError,
+        RateLimitError,
+        APITimeoutError,
+        AuthenticationError,
+        BadRequestError
+    )
+
+    if isinstance(e, RateLimitError):
+        return "rate_limit", f"API 限流错误 (QPM/RPM 超限): {str(e)}"
+    if isinstance(e, APITimeoutError):
+        return "timeout", f"API 超时错误: {str(e)}"
+    if isinstance(e, asyncio.TimeoutError):
+        return "timeout", f"首 token 超时 ({first_token_timeout:.0f}s)"
+    if isinstance(e, APIConnectionError):
+        return "connection", f"API 连接错误 (网络问题): {str(e)}"
+    if isinstance(e, AuthenticationError):
+        return "auth", f"API 认证错误 (API Key 无效): {str(e)}"
+    if isinstance(e, BadRequestError):
+        return "bad_request", f"API 请求错误 (参数无效): {str(e)}"
+    if isinstance(e, APIError):
+        return "api_error", f"API 通用错误: {str(e)}"
+    return "unknown", f"未知错误: {type(e).__name__} - {str(e)}"
+
+
+def _format_messages(messages: List) -> List[Dict]:
+    """消息转为请求格式，保留 tool_calls（助手消息）和 tool_call_id（工具结果消息）"""
+    formatted_messages = []
+    for msg in messages:
+        if isinstance(msg, dict):
+            formatted_msg = {'role': msg['role'], 'content': msg.get('content', '')}
+            if 'tool_calls' in msg and msg['tool_calls']:
+                formatted_msg['tool_calls'] = msg['tool_calls']
+            if 'tool_call_id' in msg:
+                formatted_msg['tool_call_id'] = msg['tool_call_id']
+        else:
+            formatted_msg = {'role': msg.role, 'content': msg.content or ''}
+            if hasattr(msg, 'tool_calls') and msg.tool_calls:
+                formatted_msg['tool_calls'] = [
+                    {
+                        'id': tc.id,
+                        'type': tc.type,
+                        'function': {
+                            'name': tc.function.name,
+                            'arguments': tc.function.arguments
+                        }
+                    }
+                    for tc in msg.tool_calls
+                ]
+            if hasattr(msg, 'tool_call_id'):
+                formatted_msg['tool_call_id'] = msg.tool_call_id
+        formatted_messages.append(formatted_msg)
+    return formatted_messages
+
+
+async def _query_model_stream_live(
     model_id: str, 
     messages: List[Dict], 
     temperature: float = 0.7,
-    tools: Optional[List[Dict]] = None
+    tools: Optional[List[Dict]] = None,
+    response_format: Optional[Dict] = None,
+    deadline: Optional[float] = None
 ) -> AsyncGenerator[Dict, None]:
     """
-    流式查询 LLM (支持工具调用)
+    流式调用模型服务（参数和事件格式见 query_model_stream）
+    
+    按 provider_router 的优先级依次尝试服务端点：在输出第一个增量之前出错，或还有备选端点时首 token
+    超过 first_token_timeout，切换到下一个端点；已经输出内容后出错则直接返回错误
     
     Yields:
         {"type": "content", "delta": "..."}
         {"type": "tool_call", "tool_call": {...}}
-        {"type": "done", "content": "...", "tool_calls": [...]}
+        {"type": "done", "content": "...", "tool_calls": [...], "provider": "..."}
     """
+    from openai import APITimeoutError
+    
     logger.info(f"开始流式调用模型: {model_id}, 消息数: {len(messages)}")
     
-    try:
-        # 格式化消息
-        formatted_messages = []
-        for msg in messages:
-            if isinstance(msg, dict):
-                formatted_msg = {'role': msg['role'], 'content': msg.get('content', '')}
-                # 保留 tool_calls（助手消息）
-                if 'tool_calls' in msg and msg['tool_calls']:
-                    formatted_msg['tool_calls'] = msg['tool_calls']
-                # 保留 tool_call_id（工具结果消息）
-                if 'tool_call_id' in msg:
-                    formatted_msg['tool_call_id'] = msg['tool_call_id']
-                formatted_messages.append(formatted_msg)
-            else:
-                formatted_msg = {'role': msg.role, 'content': msg.content or ''}
-                if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                    formatted_msg['tool_calls'] = [
-                        {
-                            'id': tc.id,
-                            'type': tc.type,
-                            'function': {
-                                'name': tc.function.name,
-                                'arguments': tc.function.arguments
-                            }
-                        }
-                        for tc in msg.tool_calls
-                    ]
-                if hasattr(msg, 'tool_call_id'):
-                    formatted_msg['tool_call_id'] = msg.tool_call_id
-                formatted_messages.append(formatted_msg)
-        
-        # 构建请求参数
-        request_params = {
-            "model": model_id,
-            "messages": formatted_messages,
-            "temperature": temperature,
-            "stream": True
-        }
-        
-        if tools:
-            request_params["tools"] = tools
-            logger.debug(f"使用工具: {[t['function']['name'] for t in tools]}")
-        
-        # 流式调用（使用 await 异步调用）
-        logger.debug(f"请求参数: {request_params}")
-        stream = await client.chat.completions.create(**request_params)
-        
-        # 累积内容和工具调用
-        accumulated_content = ""
-        accumulated_tool_calls = []
-        tool_call_buffer = {}
-        
-        # 使用 async for 异步迭代，不阻塞事件循环
-        async for chunk in stream:
-            if not hasattr(chunk, 'choices') or not chunk.choices:
-                continue
+    # 构建请求参数
+    request_params = {
+        "messages": _format_messages(messages),
+        "temperature": temperature,
+        "stream": True
+    }
+    
+    if tools:
+        request_params["tools"] = tools
+        logger.debug(f"使用工具: {[t['function']['name'] for t in tools]}")
+    
+    if response_format:
+        request_params["response_format"] = response_format
+    
+    router = get_provider_router()
+    if not router.allow_model(model_id):
+        retry_after = router.model_breaker(model_id).retry_after()
+        logger.warning(f"模型 {model_id} 熔断中，{retry_after:.0f}s 后重试")
+        yield {"type": "error", "error": f"模型 {model_id} 暂时不可用（熔断中）", "error_type": "circuit_open"}
+        return
+    
+    endpoints = router.route(model_id)
+    first_token_timeout = PROVIDER_ROUTING_CONFIG["first_token_timeout"]
+    loop = asyncio.get_running_loop()
+    last_error = None
+    deadline_exceeded = False
+    
+    for i, endpoint in enumerate(endpoints):
+        if not endpoint.breaker.allow():
+            continue
+        # 还有备选端点时限制首 token 等待时间
+        has_fallback = i < len(endpoints) - 1
+        started = loop.time()
+        ttft = None
+        emitted = False
+        stream = None
+
+        async def first_token(awaitable):
+            if ttft is not None or not has_fallback:
+                return await awaitable
+            return await asyncio.wait_for(awaitable, max(first_token_timeout - (loop.time() - started), 0))
+
+        try:
+            params = dict(request_params, model=endpoint.resolve_model(model_id))
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise APITimeoutError(request=None)
+                params["timeout"] = min(LLM_CONFIG['timeout'], remaining)
             
-            choice = chunk.choices[0]
+            # 流式调用（使用 await 异步调用）
+            logger.debug(f"请求参数 [{endpoint.name}]: {params}")
+            client = get_client(endpoint.base_url, endpoint.api_key)
+            if has_fallback:
+                # 有备选端点时不在同一端点上重试，直接切换
+                client = client.with_options(max_retries=0)
+            stream = await first_token(client.chat.completions.create(**params))
+            chunks = stream.__aiter__()
             
-            # 处理内容增量
-            if hasattr(choice, 'delta') and choice.delta:
-                delta = choice.delta
+            # 累积内容和工具调用
+            accumulated_content = ""
+            accumulated_tool_calls = []
+            tool_call_buffer = {}
+            
+            # 使用 async for 异步迭代，不阻塞事件循环
+            while True:
+                try:
+                    chunk = await first_token(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                if not hasattr(chunk, 'choices') or not chunk.choices:
+                    continue
+                if ttft is None:
+                    ttft = loop.time() - started
                 
-                # 内容增量
-                if hasattr(delta, 'content') and delta.content:
-                    accumulated_content += delta.content
-                    # logger.debug(f"内容增量: {delta.content}")
-                    yield {
-                        "type": "content",
-                        "delta": delta.content
-                    }
+                choice = chunk.choices[0]
                 
-                # 工具调用增量
-                if hasattr(delta, 'tool_calls') and delta.tool_calls:
-                    for tc_delta in delta.tool_calls:
-                        idx = tc_delta.index
-                        
-                        # 初始化工具调用缓冲区
-                        if idx not in tool_call_buffer:
-                            tool_call_buffer[idx] = {
-                                "id": "",
-                                "type": "function",
-                                "function": {
-                                    "name": "",
-                                    "arguments": ""
+                # 处理内容增量
+                if hasattr(choice, 'delta') and choice.delta:
+                    delta = choice.delta
+                    
+                    # 内容增量
+                    if hasattr(delta, 'content') and delta.content:
+                        accumulated_content += delta.content
+                        emitted = True
+                        yield {
+                            "type": "content",
+                            "delta": delta.content
+                        }
+                    
+                    # 工具调用增量
+                    if hasattr(delta, 'tool_calls') and delta.tool_calls:
+                        for tc_delta in delta.tool_calls:
+                            idx = tc_delta.index
+                            
+                            # 初始化工具调用缓冲区
+                            if idx not in tool_call_buffer:
+                                tool_call_buffer[idx] = {
+                                    "id": "",
+                                    "type": "function",
+                                    "function": {
+                                        "name": "",
+                                        "arguments": ""
+                                    }
                                 }
-                            }
-                        
-                        # 累积工具调用数据
-                        if hasattr(tc_delta, 'id') and tc_delta.id:
-                            tool_call_buffer[idx]["id"] = tc_delta.id
-                        
-                        if hasattr(tc_delta, 'function') and tc_delta.function:
-                            if hasattr(tc_delta.function, 'name') and tc_delta.function.name:
-                                tool_call_buffer[idx]["function"]["name"] = tc_delta.function.name
-                            if hasattr(tc_delta.function, 'arguments') and tc_delta.function.arguments:
-                                tool_call_buffer[idx]["function"]["arguments"] += tc_delta.function.arguments
+                            
+                            # 累积工具调用数据
+                            if hasattr(tc_delta, 'id') and tc_delta.id:
+                                tool_call_buffer[idx]["id"] = tc_delta.id
+                            
+                            if hasattr(tc_delta, 'function') and tc_delta.function:
+                                if hasattr(tc_delta.function, 'name') and tc_delta.function.name:
+                                    tool_call_buffer[idx]["function"]["name"] = tc_delta.function.name
+                                if hasattr(tc_delta.function, 'arguments') and tc_delta.function.arguments:
+                                    tool_call_buffer[idx]["function"]["arguments"] += tc_delta.function.arguments
             
-        # 整理工具调用
-        if tool_call_buffer:
-            accumulated_tool_calls = [tool_call_buffer[i] for i in sorted(tool_call_buffer.keys())]
-            logger.info(f"检测到工具调用: {[tc['function']['name'] for tc in accumulated_tool_calls]}")
+            router.record_success(endpoint, ttft)
+            router.record_model_result(model_id)
             
-            for tc in accumulated_tool_calls:
-                yield {
-                    "type": "tool_call",
-                    "tool_call": tc
-                }
-        
-        # 最终完成
-        yield {
-            "type": "done",
-            "content": accumulated_content,
-            "tool_calls": accumulated_tool_calls
-        }
-        # logger.info(f"模型调用完成，内容长度: {len(accumulated_content)}, 工具调用: {len(accumulated_tool_calls)}")
-    except RateLimitError as e:
-        error_msg = f"API 限流错误 (QPM/RPM 超限): {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "rate_limit"}
-    except APITimeoutError as e:
-        error_msg = f"API 超时错误: {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "timeout"}
-    except APIConnectionError as e:
-        error_msg = f"API 连接错误 (网络问题): {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "connection"}
-    except AuthenticationError as e:
-        error_msg = f"API 认证错误 (API Key 无效): {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "auth"}
-    except BadRequestError as e:
-        error_msg = f"API 请求错误 (参数无效): {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "bad_request"}
-    except APIError as e:
-        error_msg = f"API 通用错误: {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "api_error"}
-    except Exception as e:
-        error_msg = f"未知错误: {type(e).__name__} - {str(e)}"
-        logger.error(f"流式调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        yield {"type": "error", "error": error_msg, "error_type": "unknown"}
-
-
-async def query_model(model_id: str, messages: List[Dict], temperature: float = 0.7) -> Dict:
+            # 整理工具调用
+            if tool_call_buffer:
+                accumulated_tool_calls = [tool_call_buffer[i] for i in sorted(tool_call_buffer.keys())]
+                logger.info(f"检测到工具调用: {[tc['function']['name'] for tc in accumulated_tool_calls]}")
+                
+                for tc in accumulated_tool_calls:
+                    yield {
+                        "type": "tool_call",
+                        "tool_call": tc
+                    }
+            
+            # 最终完成
+            yield {
+                "type": "done",
+                "content": accumulated_content,
+                "tool_calls": accumulated_tool_calls,
+                "provider": endpoint.name
+            }
+            return
+        except Exception as e:
+            error_type, error_msg = _classify_error(e, first_token_timeout)
+            last_error = (error_type, error_msg)
+            if deadline is not None and loop.time() >= deadline:
+                # 比赛时间用尽导致的失败不是服务端故障，不计入端点和模型熔断
+                deadline_exceeded = True
+                break
+            # 首 token 超时时把等待时间计入端点 TTFT，使慢端点排到后面
+            waited = loop.time() - started if error_type == "timeout" and ttft is None else None
+            router.record_failure(endpoint, error_type, ttft=waited)
+            if emitted or error_type not in FAILOVER_ERROR_TYPES:
+                break
+            logger.warning(f"模型服务端点 {endpoint.name} 调用失败 [{model_id}]: {error_msg}，切换到下一个端点")
+        finally:
+            # 调用方提前关闭、任务被取消或切换端点时，立即断开与模型服务的连接，停止消耗 token
+            if stream is not None:
+                await stream.close()
+    
+    if last_error is None:
+        last_error = ("circuit_open", f"模型 {model_id} 的服务端点均已熔断")
+    elif not deadline_exceeded:
+        router.record_model_result(model_id, last_error[0])
+    error_type, error_msg = last_error
+    logger.error(f"流式调用失败 [{model_id}]: {error_msg}")
+    yield {"type": "error", "error": error_msg, "error_type": error_type}
+
+
+async def _query_model_live(
+    model_id: str,
+    messages: List[Dict],
+    temperature: float = 0.7,
+    tools: Optional[List[Dict]] = None,
+    response_format: Optional[Dict] = None,
+    deadline: Optional[float] = None
+) -> Dict:
     """
-    查询 LLM (非流式，用于裁判评分等不需要流式的场景)
+    非流式调用模型服务（参数和返回格式见 query_model）
     
-    返回: {"content": "...", "tool_calls": [...]}
+    按 provider_router 的优先级依次尝试服务端点，失败时切换到下一个
     """
+    from openai import APITimeoutError
+    
     logger.info(f"调用模型 (非流式): {model_id}")
     
-    try:
-        formatted_messages = []
-        for msg in messages:
-            if isinstance(msg, dict):
-                formatted_messages.append({'role': msg['role'], 'content': msg['content']})
-            else:
-                formatted_messages.append({'role': msg.role, 'content': msg.content})
-        
-        # 使用 await 异步调用
-        response = await client.chat.completions.create(
-            model=model_id,
-            messages=formatted_messages,
-            temperature=temperature,
-            stream=False
-        )
-        
-        choice = response.choices[0]
-        result = {
-            "content": choice.message.content or "",
-            "tool_calls": []
-        }
-        
-        if hasattr(choice.message, 'tool_calls') and choice.message.tool_calls:
-            result["tool_calls"] = [
-                {
-                    "id": tc.id,
-                    "type": tc.type,
-                    "function": {
-                        "name": tc.function.name,
-                        "arguments": tc.function.arguments
+    request_params = {
+        "messages": _format_messages(messages),
+        "temperature": temperature,
+        "stream": False
+    }
+    if tools:
+        request_params["tools"] = tools
+    if response_format:
+        request_params["response_format"] = response_format
+    loop = asyncio.get_running_loop()
+    deadline_exceeded = False
+    router = get_provider_router()
+    if not router.allow_model(model_id):
+        error_msg = f"模型 {model_id} 暂时不可用（熔断中）"
+        logger.warning(error_msg)
+        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "circuit_open"}
+    last_error = None
+    
+    endpoints = router.route(model_id)
+    for i, endpoint in enumerate(endpoints):
+        if not endpoint.breaker.allow():
+            continue
+        client = get_client(endpoint.base_url, endpoint.api_key)
+        if i < len(endpoints) - 1:
+            client = client.with_options(max_retries=0)
+        try:
+            params = dict(request_params, model=endpoint.resolve_model(model_id))
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise APITimeoutError(request=None)
+                params["timeout"] = min(LLM_CONFIG['timeout'], remaining)
+            # 使用 await 异步调用
+            response = await client.chat.completions.create(**params)
+            router.record_success(endpoint)
+            router.record_model_result(model_id)
+            
+            choice = response.choices[0]
+            result = {
+                "content": choice.message.content or "",
+                "tool_calls": []
+            }
+            
+            if hasattr(choice.message, 'tool_calls') and choice.message.tool_calls:
+                result["tool_calls"] = [
+                    {
+                        "id": tc.id,
+                        "type": tc.type,
+                        "function": {
+                            "name": tc.function.name,
+                            "arguments": tc.function.arguments
+                        }
                     }
-                }
-                for tc in choice.message.tool_calls
-            ]
-        
-        logger.info(f"模型调用成功，内容长度: {len(result['content'])}, result: {result}")
+                    for tc in choice.message.tool_calls
+                ]
+            
+            logger.info(f"模型调用成功 [{endpoint.name}]，内容长度: {len(result['content'])}, result: {result}")
+            return result
+        except Exception as e:
+            error_type, error_msg = _classify_error(e)
+            last_error = (error_type, error_msg)
+            if deadline is not None and loop.time() >= deadline:
+                # 与流式调用相同，时间用尽导致的失败不计入端点和模型熔断
+                deadline_exceeded = True
+                break
+            router.record_failure(endpoint, error_type)
+            if error_type not in FAILOVER_ERROR_TYPES:
+                break
+            logger.warning(f"模型服务端点 {endpoint.name} 调用失败 [{model_id}]: {error_msg}，切换到下一个端点")
+    
+    if last_error is None:
+        last_error = ("circuit_open", f"模型 {model_id} 的服务端点均已熔断")
+    elif not deadline_exceeded:
+        router.record_model_result(model_id, last_error[0])
+    error_type, error_msg = last_error
+    logger.error(f"模型调用失败 [{model_id}]: {error_msg}")
+    return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": error_type}
+
+
+def _request_fingerprint(model_id: str, messages: List, temperature: float, stream: bool,
+                         tools: Optional[List[Dict]] = None, response_format: Optional[Dict] = None) -> Dict:
+    """录制 / 回放使用的请求内容（不含超时、截止时间等与结果无关的参数）"""
+    return {
+        "model": model_id,
+        "messages": _format_messages(messages),
+        "temperature": temperature,
+        "tools": tools,
+        "response_format": response_format,
+        "stream": stream,
+    }
+
+
+def query_model_stream(
+    model_id: str, 
+    messages: List[Dict], 
+    temperature: float = 0.7,
+    tools: Optional[List[Dict]] = None,
+    response_format: Optional[Dict] = None,
+    deadline: Optional[float] = None
+) -> AsyncGenerator[Dict, None]:
+    """
+    流式查询 LLM (支持工具调用)
+    
+    response_format: 结构化输出约束，例如 {"type": "json_schema", "json_schema": {...}}
+    deadline: 截止时间（event loop 时间），请求超时不超过剩余时间；整体时长由调用方按同一截止时间约束
+    
+    开启录制 / 回放（LLM_RECORD_MODE）时经 llm_recorder 录制或回放，否则直接返回模型服务的事件流
+    
+    Yields:
+        {"type": "content", "delta": "..."}
+        {"type": "tool_call", "tool_call": {...}}
+        {"type": "done", "content": "...", "tool_calls": [...], "provider": "..."}
+    """
+    recorder = get_llm_recorder()
+    if recorder is None:
+        return _query_model_stream_live(model_id, messages, temperature, tools, response_format, deadline)
+    return _recorded_model_stream(recorder, model_id, messages, temperature, tools, response_format, deadline)
+
+
+async def _recorded_model_stream(
+    recorder: LLMRecorder,
+    model_id: str,
+    messages: List[Dict],
+    temperature: float,
+    tools: Optional[List[Dict]],
+    response_format: Optional[Dict],
+    deadline: Optional[float]
+) -> AsyncGenerator[Dict, None]:
+    """录制模式下调用模型服务并存档完整的事件流；回放模式下从存档输出"""
+    request = _request_fingerprint(model_id, messages, temperature, True, tools, response_format)
+    key = make_request_key(request)
+    seq = recorder.next_seq(key)
+    
+    if recorder.mode == "replay":
+        events = await recorder.load(key, seq)
+        if events is None:
+            logger.warning(f"回放存档中没有该请求 [{model_id}]: {key[:12]}")
+            yield {"type": "error", "error": f"回放存档中没有该请求 ({key[:12]})", "error_type": "replay_miss"}
+            return
+        async for event in recorder.replay(events):
+            yield event
+        return
+    
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    events = []
+    saved = False
+    
+    async def save():
+        nonlocal saved
+        if not saved:
+            saved = True
+            await recorder.save(key, seq, model_id, request, events, loop.time() - started)
+    
+    try:
+        async with aclosing(
+            _query_model_stream_live(model_id, messages, temperature, tools, response_format, deadline)
+        ) as stream:
+            async for event in stream:
+                events.append((loop.time() - started, event))
+                # 调用方通常读到 done 后就停止迭代，在输出结束事件之前存档
+                if event["type"] in ("done", "error"):
+                    await save()
+                yield event
+    except GeneratorExit:
+        # 调用方读到所需内容后主动关闭（例如裁判 JSON 已解析完成），按已输出的事件存档，
+        # 回放时调用方在同一位置停止；任务被取消时不存档
+        if events:
+            await save()
+        raise
+
+
+async def query_model(
+    model_id: str,
+    messages: List[Dict],
+    temperature: float = 0.7,
+    tools: Optional[List[Dict]] = None,
+    response_format: Optional[Dict] = None,
+    deadline: Optional[float] = None
+) -> Dict:
+    """
+    查询 LLM (非流式，用于批量评测等不需要流式的场景，参数同 query_model_stream)
+    
+    开启录制 / 回放时经 llm_recorder 录制或回放
+    
+    返回: {"content": "...", "tool_calls": [...]}，失败时 content 为错误描述并带 error_type
+    """
+    recorder = get_llm_recorder()
+    if recorder is None:
+        return await _query_model_live(model_id, messages, temperature, tools, response_format, deadline)
+    
+    request = _request_fingerprint(model_id, messages, temperature, False, tools, response_format)
+    key = make_request_key(request)
+    seq = recorder.next_seq(key)
+    
+    if recorder.mode == "replay":
+        # 非流式调用的存档只有一个 result 事件，按录制耗时等待后直接返回，回放模式下不调用模型服务
+        events = await recorder.load(key, seq)
+        results = [(offset, event["result"]) for offset, event in events or [] if event.get("type") == "result"]
+        if not results:
+            error_msg = f"回放存档中没有该请求 ({key[:12]})"
+            logger.warning(f"{error_msg} [{model_id}]")
+            return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "replay_miss"}
+        offset, result = results[-1]
+        if recorder.speed > 0 and offset > 0:
+            await asyncio.sleep(offset / recorder.speed)
         return result
-        
-    except RateLimitError as e:
-        error_msg = f"API 限流错误 (QPM/RPM 超限): {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "rate_limit"}
-    except APITimeoutError as e:
-        error_msg = f"API 超时错误: {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "timeout"}
-    except APIConnectionError as e:
-        error_msg = f"API 连接错误 (网络问题): {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "connection"}
-    except AuthenticationError as e:
-        error_msg = f"API 认证错误 (API Key 无效): {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "auth"}
-    except BadRequestError as e:
-        error_msg = f"API 请求错误 (参数无效): {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "bad_request"}
-    except APIError as e:
-        error_msg = f"API 通用错误: {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "api_error"}
-    except Exception as e:
-        error_msg = f"未知错误: {type(e).__name__} - {str(e)}"
-        logger.error(f"模型调用失败 [{model_id}]: {error_msg}", exc_info=True)
-        return {"content": f"Error: {error_msg}", "tool_calls": [], "error_type": "unknown"}
+    
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = await _query_model_live(model_id, messages, temperature, tools, response_format, deadline)
+    elapsed = loop.time() - started
+    await recorder.save(key, seq, model_id, request, [(elapsed, {"type": "result", "result": result})], elapsed)
+    return result
 
 
 # add demo
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+模型调用录制与回放 - 离线、可复现地重跑比赛
+
+- record: 每次模型调用的请求和输出事件（含相对时间）压缩后写入本地 SQLite 存档
+- replay: 按请求哈希从存档取出事件回放，不调用模型服务；speed=1 按录制时的节奏输出，
+  speed>1 加速，speed=0 不等待
+- 请求哈希为 sha256(规范化的模型、消息、温度、工具、输出格式)。同一请求在一次运行中多次出现时按出现顺序
+  分别录制（seq），回放时按相同顺序取出，超出录制次数时重复最后一次
+- 存档格式: llm_recordings(key, seq) -> zlib(JSON [[相对时间, 事件], ...])
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from .config import LLM_RECORD_CONFIG
+from .log import logger
+
+RECORDER_MODES = ("off", "record", "replay")
+
+
+def make_request_key(request: Dict[str, Any]) -> str:
+    """请求哈希（不含超时等与结果无关的参数）"""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _pack(value: Any) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def _unpack(blob: bytes) -> Any:
+    return json.loads(zlib.decompress(blob))
+
+
+class LLMRecorder:
+    """模型调用存档"""
+
+    def __init__(self, mode: str, path: str, speed: float = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"未知的录制模式: {mode}")
+        self.mode = mode
+        self.path = path
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._occurrences: Dict[str, int] = {}   # 本次运行中每个请求出现的次数
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0, "bytes": 0}
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_recordings ("
+            " key TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " model TEXT NOT NULL,"
+            " request BLOB NOT NULL,"
+            " events BLOB NOT NULL,"
+            " duration REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (key, seq))"
+        )
+        self._conn.commit()
+
+    def next_seq(self, key: str) -> int:
+        """同一请求在本次运行中的出现序号"""
+        with self._lock:
+            seq = self._occurrences.get(key, 0)
+            self._occurrences[key] = seq + 1
+            return seq
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"mode": self.mode, "path": self.path, **self._stats}
+
+    # ---------- 同步实现（在线程中执行磁盘 IO） ----------
+
+    def _save_sync(self, key: str, seq: int, model_id: str, request: dict,
+                   events: List[Tuple[float, dict]], duration: float):
+        blob = _pack([[round(offset, 4), event] for offset, event in events])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_recordings (key, seq, model, request, events, duration, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, seq, model_id, _pack(request), blob, duration, time.time())
+            )
+            self._conn.commit()
+            self._stats["recorded"] += 1
+            self._stats["bytes"] += len(blob)
+
+    def _load_sync(self, key: str, seq: int) -> Optional[list]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT events FROM llm_recordings WHERE key = ? AND seq <= ? ORDER BY seq DESC LIMIT 1",
+                (key, seq)
+            ).fetchone()
+            self._stats["replayed" if row else "misses"] += 1
+        return _unpack(row[0]) if row else None
+
+    # ---------- 异步接口 ----------
+
+    async def save(self, key: str, seq: int, model_id: str, request: dict,
+                   events: List[Tuple[float, dict]], duration: float):
+        try:
+            await asyncio.to_thread(self._save_sync, key, seq, model_id, request, events, duration)
+        except Exception as e:
+            logger.error(f"模型调用录制失败 [{model_id}]: {e}")
+
+    async def load(self, key: str, seq: int) -> Optional[list]:
+        return await asyncio.to_thread(self._load_sync, key, seq)
+
+    async def replay(self, events: list) -> AsyncGenerator[dict, None]:
+        """按录制时的相对时间（除以 speed）输出事件"""
+        elapsed = 0.0
+        for offset, event in events:
+            if self.speed > 0 and offset > elapsed:
+                await asyncio.sleep((offset - elapsed) / self.speed)
+            elapsed = max(elapsed, offset)
+            yield event
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_recorder: Optional[LLMRecorder] = None
+_configured = False
+
+
+def configure_llm_recorder(mode: str, path: Optional[str] = None, speed: Optional[float] = None) -> Optional[LLMRecorder]:
+    """切换录制模式（脚本中使用，服务进程按 LLM_RECORD_CONFIG 配置）"""
+    global _recorder, _configured
+    if mode not in RECORDER_MODES:
+        raise ValueError(f"未知的录制模式: {mode}，可选: {', '.join(RECORDER_MODES)}")
+    if _recorder is not None:
+        _recorder.close()
+    _recorder = None
+    _configured = True
+    if mode != "off":
+        _recorder = LLMRecorder(
+            mode,
+            path or LLM_RECORD_CONFIG["path"],
+            LLM_RECORD_CONFIG["replay_speed"] if speed is None else speed,
+        )
+        logger.info(f"模型调用{'录制' if mode == 'record' else '回放'}已启用: {_recorder.path}"
+                    + (f", 回放速度: {_recorder.speed}x" if mode == "replay" else ""))
+    return _recorder
+
+
+def get_llm_recorder() -> Optional[LLMRecorder]:
+    """获取全局录制器（首次调用时按配置创建），未启用时返回 None"""
+    if not _configured:
+        configure_llm_recorder(LLM_RECORD_CONFIG["mode"])
+    return _recorder
@@ -5,25 +5,38 @@
 FastAPI Main Application
 """
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 from datetime import datetime
-import json
+from contextlib import aclosing
+import asyncio
 import sys
 sys.path.append(".")
 sys.path.append("..")
 
 from backend.log import logger
-from backend.models import MatchRequest, MatchRenameRequest, CompetitorProfile, DebateTopic, UserRegister, UserLogin, UserProfile, UserModel
+from backend.models import MatchRequest, BatchMatchRequest, MatchRenameRequest, CompetitorProfile, DebateTopic, UserRegister, UserLogin, UserProfile, UserModel
 from backend.database import (
-    init_db, get_db, get_all_competitors, get_all_topics,
-    get_match, get_match_history, get_model_statistics,
-    delete_match, rename_match
+    init_db, get_db, writer_lock, get_all_competitors, get_all_topics,
+    get_match, get_match_transcript, get_match_history, get_model_statistics,
+    rename_match,
+    JOB_TERMINAL_STATUSES, enqueue_match_job, get_match_job, get_match_events, request_match_job_cancel
 )
 from backend.tournament import run_tournament_match
+from backend.batch_eval import cancel_batches, get_batch, start_batch
+from backend.matchmaker import get_matchmaker, load_matchmaker
+from backend.tool_cache import get_tool_cache
+from backend.persistence import get_write_buffer
+from backend.match_registry import LiveMatch, get_match_registry, proxy_live_stream
+from backend.llm_client import close_clients
+from backend.provider_router import ModelUnavailableError, get_provider_router
+from backend.utils import generate_id
+from backend.config import AVAILABLE_MODELS, DEBATE_CONFIG, JUDGE_PANEL, MATCH_QUEUE_CONFIG
+from backend.judge import get_judge_stats
 from backend.auth import hash_password, verify_password, create_access_token, decode_access_token
 
 app = FastAPI(
@@ -46,11 +59,24 @@ app.add_middleware(
 async def startup_event():
     logger.info("🚀 LLM Debate Arena 启动中...")
     logger.info("📦 初始化数据库...")
-    init_db()
+    await init_db()
     logger.info("✅ 数据库初始化完成")
     logger.info("🎯 API 服务已就绪")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 注销本进程运行的比赛
+    await get_match_registry().close()
+    # 取消进行中的批量评测
+    await cancel_batches()
+    # 写入缓冲中尚未落库的比赛进度
+    await get_write_buffer().close()
+    # 关闭模型服务连接池
+    await close_clients()
+    logger.info("👋 LLM Debate Arena 已关闭")
+
+
 # ========== 健康检查 ==========
 
 @app.get("/")
@@ -68,12 +94,110 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/api/tools/cache/stats")
+async def tool_cache_stats():
+    """工具结果缓存命中率统计"""
+    cache = get_tool_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+
+@app.get("/api/judges/stats")
+async def judge_stats():
+    """各裁判模型的输出解析失败率统计"""
+    return get_judge_stats()
+
+
+@app.get("/api/models/health")
+async def model_health():
+    """模型熔断状态（按本进程的调用结果统计）和服务端点状态"""
+    models = [m.strip() for m in AVAILABLE_MODELS.split(",") if m.strip()] + JUDGE_PANEL
+    return get_provider_router().get_health(models)
+
+
+@app.get("/api/providers/stats")
+async def provider_stats():
+    """模型服务端点的 TTFT、错误率和熔断状态"""
+    return get_provider_router().get_stats()
+
+
+@app.get("/api/matches/live/stats")
+async def live_match_stats():
+    """本进程运行的比赛和订阅者数量"""
+    return get_match_registry().get_stats()
+
+
 # ========== 比赛相关 ==========
 
+# 客户端断开后转入后台运行的比赛任务（保持引用，避免被垃圾回收）
+_detached_matches = set()
+# 其他后台任务（如队列模式下的取消请求）
+_background_tasks = set()
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # 禁用 Nginx 缓冲
+}
+
+
+async def _stream_live(live: LiveMatch, http_request: Request, last_event_id: int = 0):
+    """订阅进行中比赛的 SSE 帧，空闲时检查客户端是否已断开"""
+    poll_interval = DEBATE_CONFIG["disconnect_poll_interval"]
+    queue = live.subscribe(last_event_id)
+    getter = None
+    try:
+        while True:
+            getter = getter or asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=poll_interval)
+            if not done:
+                if await http_request.is_disconnected():
+                    logger.warning(f"⚠️ SSE 客户端已断开 (比赛 {live.match_id})")
+                    break
+                continue
+            frame, getter = getter.result(), None
+            if frame is None:
+                break
+            yield frame
+    finally:
+        if getter is not None:
+            getter.cancel()
+        live.unsubscribe(queue)
+
+
+async def _stream_job_events(match_id: str, http_request: Request, last_event_id: int = 0):
+    """队列模式：轮询 worker 发布的事件帧，任务结束且事件读完后结束"""
+    poll_interval = MATCH_QUEUE_CONFIG["poll_interval"]
+    while True:
+        rows = await get_match_events(match_id, last_event_id)
+        for seq, frame in rows:
+            last_event_id = seq
+            yield frame
+        if rows:
+            continue
+        job = await get_match_job(match_id)
+        if job is None or job.status in JOB_TERMINAL_STATUSES:
+            # worker 先写完事件再标记任务结束，这里补读最后一批
+            for seq, frame in await get_match_events(match_id, last_event_id):
+                yield frame
+            return
+        if await http_request.is_disconnected():
+            logger.warning(f"⚠️ SSE 客户端已断开 (比赛 {match_id})")
+            return
+        await asyncio.sleep(poll_interval)
+
+
 @app.post("/api/tournament/match/stream")
-async def match_stream_sse(request: MatchRequest):
+async def match_stream_sse(request: MatchRequest, http_request: Request):
     """
     SSE 流式推送比赛数据
+    
+    比赛在独立任务中运行并登记到比赛注册表，事件广播给发起者和观战者
+    （队列模式下写入任务队列，由 match_worker 进程执行）。
+    发起者断开后按 DEBATE_CONFIG["disconnect_policy"] 处理：
+    cancel 在没有其他观战者时取消比赛（关闭模型流、取消工具和裁判任务，比赛标记为 CANCELLED），
+    detach 让比赛在后台继续完成，可通过 /api/tournament/match/{match_id}/live 重连
     """
     logger.info(f"📝 收到 SSE 比赛请求: {request.topic[:50]}...")
     
@@ -91,56 +215,192 @@ async def match_stream_sse(request: MatchRequest):
         logger.warning(f"❌ 裁判数量不足: {len(request.judges)}")
         raise HTTPException(status_code=400, detail="至少需要2个裁判")
     
+    # 辩手模型熔断中的比赛直接拒绝，熔断的裁判替换为可用裁判，不让比赛进行到一半才失败
+    try:
+        judges = get_provider_router().plan_match_models(
+            request.proponent_model, request.opponent_model, request.judges
+        )
+    except ModelUnavailableError as e:
+        logger.warning(f"❌ {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(int(e.retry_after), 1))})
+    
     logger.info(f"✅ 比赛配置验证通过")
     logger.info(f"   正方: {request.proponent_model} ({request.proponent_personality})")
     logger.info(f"   反方: {request.opponent_model} ({request.opponent_personality})")
-    logger.info(f"   裁判团: {request.judges}")
+    logger.info(f"   裁判团: {judges}")
     logger.info(f"   可用工具: {request.enabled_tools}")
     logger.info(f"   轮数: {request.rounds}")
     logger.info(f"   用户ID: {request.user_id}")
     
+    disconnect_policy = DEBATE_CONFIG["disconnect_policy"]
+    registry = get_match_registry()
+    match_id = generate_id()
+    match_kwargs = dict(
+        topic=request.topic,
+        topic_difficulty=request.topic_difficulty,
+        prop_model_id=request.proponent_model,
+        opp_model_id=request.opponent_model,
+        prop_personality=request.proponent_personality,
+        opp_personality=request.opponent_personality,
+        rounds=request.rounds,
+        judges=judges,
+        enabled_tools=request.enabled_tools,
+        parallel_openings=request.parallel_openings,
+        same_model_battle=same_model_battle,
+        user_id=request.user_id  # 传递用户ID
+    )
+    
+    if MATCH_QUEUE_CONFIG["mode"] == "queue":
+        # 队列模式：比赛由 match_worker 进程执行，这里只读取其发布的事件
+        await enqueue_match_job(match_id, {**match_kwargs, "topic_difficulty": request.topic_difficulty.value})
+        logger.info(f"比赛任务已入队: {match_id}")
+        
+        async def queued_event_generator():
+            try:
+                async for frame in _stream_job_events(match_id, http_request):
+                    yield frame
+            finally:
+                # 取消请求只作用于未结束的任务，比赛正常结束时无影响
+                if disconnect_policy != "detach":
+                    task = asyncio.create_task(request_match_job_cancel(match_id))
+                    _background_tasks.add(task)
+                    task.add_done_callback(_background_tasks.discard)
+        
+        return StreamingResponse(queued_event_generator(), media_type="text/event-stream", headers=SSE_HEADERS)
+    
     async def event_generator():
         """SSE 事件生成器"""
-        event_count = 0
+        live = await registry.open(match_id)
+        
+        async def produce():
+            """运行比赛，事件广播给所有订阅者"""
+            try:
+                async for event in run_tournament_match(**match_kwargs, match_id=match_id):
+                    live.publish(event)
+            except Exception as e:
+                # 修复 logger 格式化错误
+                error_msg = str(e).replace('{', '{{').replace('}', '}}')
+                logger.error(f"❌ SSE 比赛过程出错: {error_msg}", exc_info=True)
+                live.publish({
+                    "type": "error",
+                    "content": str(e)
+                })
+            finally:
+                registry.release(match_id)
+        
+        producer = asyncio.create_task(produce())
         try:
-            async for event in run_tournament_match(
-                topic=request.topic,
-                topic_difficulty=request.topic_difficulty,
-                prop_model_id=request.proponent_model,
-                opp_model_id=request.opponent_model,
-                prop_personality=request.proponent_personality,
-                opp_personality=request.opponent_personality,
-                rounds=request.rounds,
-                judges=request.judges,
-                enabled_tools=request.enabled_tools,
-                same_model_battle=same_model_battle,
-                user_id=request.user_id  # 传递用户ID
-            ):
-                # SSE 格式: data: {json}\n\n
-                event_json = json.dumps(event, ensure_ascii=False)
-                yield f"data: {event_json}\n\n"
-                event_count += 1
-        except Exception as e:
-            # 修复 logger 格式化错误
-            error_msg = str(e).replace('{', '{{').replace('}', '}}')
-            logger.error(f"❌ SSE 比赛过程出错: {error_msg}", exc_info=True)
-            error_event = json.dumps({
-                "type": "error",
-                "content": str(e)
-            }, ensure_ascii=False)
-            yield f"data: {error_event}\n\n"
+            async with aclosing(_stream_live(live, http_request)) as frames:
+                async for frame in frames:
+                    yield frame
+        finally:
+            # 正常结束、客户端断开或响应被取消时都会执行
+            if not producer.done():
+                if disconnect_policy == "detach" or live.subscriber_count:
+                    logger.info(f"比赛转入后台继续运行 (观战者: {live.subscriber_count})")
+                    _detached_matches.add(producer)
+                    producer.add_done_callback(_detached_matches.discard)
+                else:
+                    producer.cancel()
     
     return StreamingResponse(
         event_generator(),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Accel-Buffering": "no",  # 禁用 Nginx 缓冲
-        }
+        headers=SSE_HEADERS
     )
 
 
+@app.post("/api/batch/matches")
+async def create_batch(request: BatchMatchRequest):
+    """
+    批量评测：后台运行一批比赛，不推送事件（发言和裁判使用非流式调用），结果批量落库
+    
+    返回批次 ID 和进度，通过 GET /api/batch/{batch_id} 查询
+    """
+    if not request.matches:
+        raise HTTPException(status_code=400, detail="比赛列表为空")
+    for m in request.matches:
+        if not m.topic or len(m.topic) < 3:
+            raise HTTPException(status_code=400, detail=f"辩题太短: {m.topic}")
+    batch = start_batch(request.matches, request.concurrency)
+    return batch.get_stats()
+
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch_status(batch_id: str, include_results: bool = False):
+    """批量评测进度；include_results=true 时附带每场比赛的摘要"""
+    batch = get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    stats = batch.get_stats()
+    if include_results:
+        stats["results"] = batch.results
+    return stats
+
+
+@app.post("/api/matchmaking/next")
+async def matchmaking_next(count: int = 1, rounds: int = 3, reload: bool = False):
+    """
+    按信息增益安排比赛：评分接近、场数少的模型对优先，辩题优先选择使用少的分类
+    
+    返回的比赛请求可直接提交到 /api/tournament/match/stream；已安排的配对在比赛结束前优先让给其他配对。
+    reload=true 时从数据库重新加载选手和辩题（其他进程产生的比赛结果）
+    """
+    matchmaker = get_matchmaker()
+    if matchmaker is None or reload:
+        matchmaker = await load_matchmaker()
+    router = get_provider_router()
+    proposals = []
+    for _ in range(max(1, min(count, 100))):
+        picked = matchmaker.next_match(available=router.model_available, rounds=rounds)
+        if picked is None:
+            break
+        request, information = picked
+        proposals.append({**request.model_dump(mode="json"), "information": round(information, 4)})
+    return proposals
+
+
+@app.get("/api/matchmaking/stats")
+async def matchmaking_stats():
+    """配对器状态：候选配对数、预约中的配对和各分类辩题使用次数"""
+    matchmaker = get_matchmaker()
+    if matchmaker is None:
+        return {"loaded": False}
+    return {"loaded": True, **matchmaker.get_stats()}
+
+
+@app.get("/api/tournament/match/{match_id}/live")
+async def match_live_sse(match_id: str, http_request: Request):
+    """
+    观战 / 断线重连：订阅进行中比赛的事件流
+    
+    请求头 Last-Event-ID 为已收到的最后一个事件 ID，之后的事件会先补发；
+    比赛由其他进程运行时（共享比赛注册表）转发到该进程
+    """
+    try:
+        last_event_id = int(http_request.headers.get("last-event-id") or 0)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID 无效")
+    
+    registry = get_match_registry()
+    live = registry.get(match_id)
+    if live is not None:
+        stream = _stream_live(live, http_request, last_event_id)
+    elif MATCH_QUEUE_CONFIG["mode"] == "queue" and await get_match_job(match_id) is not None:
+        stream = _stream_job_events(match_id, http_request, last_event_id)
+    else:
+        owner = None
+        # 已转发过的请求不再转发，避免进程间循环
+        if not http_request.headers.get("x-match-forwarded"):
+            owner = await registry.lookup(match_id)
+        if owner is None or not owner["owner_url"]:
+            raise HTTPException(status_code=404, detail="比赛不在进行中，请查询比赛详情")
+        logger.info(f"比赛 {match_id} 由 {owner['worker_id']} 运行，转发事件流")
+        stream = proxy_live_stream(owner["owner_url"], match_id, last_event_id)
+    
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
 @app.get("/api/tournament/match/{match_id}")
 async def get_match_detail(match_id: str):
     """
@@ -163,7 +423,7 @@ async def get_match_detail(match_id: str):
         "proponent_model_id": match.proponent_model_id,
         "opponent_model_id": match.opponent_model_id,
         "status": match.status,
-        "transcript": match.transcript,
+        "transcript": await get_match_transcript(match),
         "judge_result": match.judge_result,
         "elo_changes": match.elo_changes,
         "created_at": match.created_at.isoformat(),
@@ -178,7 +438,8 @@ async def delete_match_api(match_id: str, user_id: int = None):
     """
     logger.info(f"🗑️ 删除比赛: {match_id}, user_id={user_id}")
     
-    success = await delete_match(match_id, user_id)
+    # 经写缓冲删除：删除成功后该比赛（包括进行中的比赛）不会被写回
+    success = await get_write_buffer().delete(match_id, user_id)
     if not success:
         logger.warning(f"❌ 删除失败，比赛不存在或无权限: {match_id}")
         raise HTTPException(status_code=404, detail="比赛不存在或无权限删除")
@@ -242,7 +503,7 @@ async def get_topics():
 # ========== 历史记录 ==========
 
 @app.get("/api/tournament/matches/history")
-async def get_history(limit: int = 50, model_id: str = None, user_id: int = None, db: Session = Depends(get_db)):
+async def get_history(limit: int = 50, model_id: str = None, user_id: int = None, db: AsyncSession = Depends(get_db)):
     """
     获取历史记录（支持按模型和用户筛选）
     """
@@ -275,7 +536,7 @@ async def get_history(limit: int = 50, model_id: str = None, user_id: int = None
 # ========== 模型统计（脱敏） ==========
 
 @app.get("/api/tournament/model/{model_id}/stats")
-async def get_model_stats(model_id: str, db: Session = Depends(get_db)):
+async def get_model_stats(model_id: str, db: AsyncSession = Depends(get_db)):
     """
     获取模型的统计数据（脱敏版本，不包含具体辩题内容）
     """
@@ -295,18 +556,18 @@ async def get_model_stats(model_id: str, db: Session = Depends(get_db)):
 # ========== 用户认证 ==========
 
 @app.post("/api/auth/register")
-async def register(user_data: UserRegister, db: Session = Depends(get_db)):
+async def register(user_data: UserRegister, db: AsyncSession = Depends(get_db)):
     """用户注册"""
     logger.info(f"📝 用户注册请求: {user_data.username}")
     
     # 检查用户名是否已存在
-    existing_user = db.query(UserModel).filter(UserModel.username == user_data.username).first()
+    existing_user = await db.scalar(select(UserModel).where(UserModel.username == user_data.username))
     if existing_user:
         logger.warning(f"❌ 用户名已存在: {user_data.username}")
         raise HTTPException(status_code=400, detail="用户名已存在")
     
     # 检查邮箱是否已存在
-    existing_email = db.query(UserModel).filter(UserModel.email == user_data.email).first()
+    existing_email = await db.scalar(select(UserModel).where(UserModel.email == user_data.email))
     if existing_email:
         logger.warning(f"❌ 邮箱已存在: {user_data.email}")
         raise HTTPException(status_code=400, detail="邮箱已存在")
@@ -320,9 +581,10 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
         created_at=datetime.utcnow()
     )
     
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    async with writer_lock():
+        db.add(new_user)
+        await db.commit()
+    await db.refresh(new_user)
     
     logger.info(f"✅ 用户注册成功: {user_data.username}")
     
@@ -341,15 +603,15 @@ async def register(user_data: UserRegister, db: Session = Depends(get_db)):
 
 
 @app.post("/api/auth/login")
-async def login(user_data: UserLogin, db: Session = Depends(get_db)):
+async def login(user_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """用户登录（支持邮箱或用户名）"""
     logger.info(f"🔑 用户登录请求: {user_data.username}")
     
     # 查找用户（支持邮箱或用户名）
-    user = db.query(UserModel).filter(
+    user = await db.scalar(select(UserModel).where(
         (UserModel.username == user_data.username) | 
         (UserModel.email == user_data.username)
-    ).first()
+    ))
     
     if not user:
         logger.warning(f"❌ 用户不存在: {user_data.username}")
@@ -362,7 +624,8 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
     
     # 更新最后登录时间
     user.last_login = datetime.utcnow()
-    db.commit()
+    async with writer_lock():
+        await db.commit()
     
     logger.info(f"✅ 用户登录成功: {user.username}")
     
@@ -383,7 +646,7 @@ async def login(user_data: UserLogin, db: Session = Depends(get_db)):
 
 
 @app.get("/api/auth/me")
-async def get_current_user(token: str, db: Session = Depends(get_db)):
+async def get_current_user(token: str, db: AsyncSession = Depends(get_db)):
     """获取当前用户信息"""
     logger.info(f"👤 获取用户信息")
     
@@ -393,7 +656,7 @@ async def get_current_user(token: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=401, detail="Token无效")
     
     user_id = payload.get("user_id")
-    user = db.query(UserModel).filter(UserModel.id == user_id).first()
+    user = await db.scalar(select(UserModel).where(UserModel.id == user_id))
     
     if not user:
         logger.warning(f"❌ 用户不存在: user_id={user_id}")
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+进行中比赛的注册表
+
+- 每场进行中的比赛对应一个 LiveMatch：保存已编码的 SSE 帧，向所有订阅者（发起者、观战者、
+  断线重连的客户端）广播，新订阅者可按 Last-Event-ID 从断点续传
+- memory 后端只在本进程内登记；database 后端同时把比赛归属（进程 ID、可达地址、心跳）
+  写入 live_matches 表，请求落到其他进程时可查到比赛所在进程并转发
+"""
+
+import asyncio
+import os
+import socket
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from .config import MATCH_REGISTRY_CONFIG
+from .log import logger
+from .sse import SSEEncoder
+from . import database
+
+
+class LiveMatch:
+    """单场进行中比赛的事件广播"""
+
+    def __init__(self, match_id: str):
+        self.match_id = match_id
+        self.closed = False
+        self._encoder = SSEEncoder()
+        self._frames: List[bytes] = []  # 第 i 帧的事件 ID 为 i + 1
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event: dict):
+        """编码事件并推送给所有订阅者"""
+        frame = self._encoder.encode(event)
+        self._frames.append(frame)
+        for queue in self._subscribers:
+            queue.put_nowait(frame)
+
+    def subscribe(self, last_event_id: int = 0) -> asyncio.Queue:
+        """
+        订阅比赛事件
+
+        返回的队列先补发 last_event_id 之后的全部帧，之后实时推送；None 表示比赛结束
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for frame in self._frames[max(last_event_id, 0):]:
+            queue.put_nowait(frame)
+        if self.closed:
+            queue.put_nowait(None)
+        else:
+            self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def close(self):
+        """比赛结束，通知所有订阅者"""
+        self.closed = True
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+        self._subscribers.clear()
+
+
+class MatchRegistry:
+    """
+    比赛注册表
+
+    本进程运行的比赛保存在内存中；启用共享后端时定期刷新心跳，
+    其他进程可通过 lookup() 查到比赛所在进程的地址
+    """
+
+    def __init__(
+        self,
+        shared: bool = False,
+        advertise_url: str = "",
+        heartbeat_interval: float = 5.0,
+        retain_seconds: float = 60.0
+    ):
+        self.shared = shared
+        self.advertise_url = advertise_url.rstrip("/") or None
+        self.heartbeat_interval = heartbeat_interval
+        self.retain_seconds = retain_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._matches: Dict[str, LiveMatch] = {}
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._expire_tasks: Set[asyncio.Task] = set()
+
+    def get(self, match_id: str) -> Optional[LiveMatch]:
+        """本进程内的比赛"""
+        return self._matches.get(match_id)
+
+    async def open(self, match_id: str) -> LiveMatch:
+        """登记由本进程运行的比赛"""
+        live = LiveMatch(match_id)
+        self._matches[match_id] = live
+        if self.shared:
+            self._ensure_heartbeat()
+            try:
+                await database.register_live_match(match_id, self.worker_id, self.advertise_url)
+            except Exception as e:
+                # 登记失败只影响跨进程观战，不影响比赛本身
+                logger.error(f"比赛归属登记失败 ({match_id}): {e}")
+        return live
+
+    def release(self, match_id: str):
+        """比赛结束：通知订阅者，保留 retain_seconds 秒供断线重连后注销"""
+        live = self._matches.get(match_id)
+        if live is None:
+            return
+        live.close()
+        task = asyncio.create_task(self._expire(match_id, live))
+        self._expire_tasks.add(task)
+        task.add_done_callback(self._expire_tasks.discard)
+
+    async def _expire(self, match_id: str, live: LiveMatch):
+        try:
+            await asyncio.sleep(self.retain_seconds)
+        finally:
+            if self._matches.get(match_id) is live:
+                del self._matches[match_id]
+                if self.shared:
+                    try:
+                        await database.unregister_live_matches(self.worker_id, [match_id])
+                    except Exception as e:
+                        logger.error(f"比赛归属注销失败 ({match_id}): {e}")
+
+    async def lookup(self, match_id: str) -> Optional[dict]:
+        """
+        查询其他进程运行的比赛
+
+        Returns:
+            {"worker_id": ..., "owner_url": ...}，未找到或所在进程已失联时返回 None
+        """
+        if not self.shared:
+            return None
+        owner = await database.get_live_match_owner(match_id, max_age=self.heartbeat_interval * 3)
+        if owner is None or owner.worker_id == self.worker_id:
+            return None
+        return {"worker_id": owner.worker_id, "owner_url": owner.owner_url}
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await database.touch_live_matches(self.worker_id, list(self._matches))
+            except Exception as e:
+                logger.error(f"比赛注册表心跳失败: {e}")
+
+    async def close(self):
+        """服务关闭：停止心跳并注销本进程的全部比赛"""
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        for task in list(self._expire_tasks):
+            task.cancel()
+        match_ids = list(self._matches)
+        for live in self._matches.values():
+            live.close()
+        self._matches.clear()
+        if self.shared and match_ids:
+            try:
+                await database.unregister_live_matches(self.worker_id, match_ids)
+            except Exception as e:
+                logger.error(f"比赛归属注销失败: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "backend": "database" if self.shared else "memory",
+            "worker_id": self.worker_id,
+            "advertise_url": self.advertise_url,
+            "live_matches": sum(1 for live in self._matches.values() if not live.closed),
+            "subscribers": sum(live.subscriber_count for live in self._matches.values()),
+        }
+
+
+async def proxy_live_stream(owner_url: str, match_id: str, last_event_id: int = 0) -> AsyncIterator[bytes]:
+    """把观战 / 重连请求转发到比赛所在进程，原样转发 SSE 字节流"""
+    import httpx  # 只在多进程转发时使用，延迟导入
+
+    url = f"{owner_url.rstrip('/')}/api/tournament/match/{match_id}/live"
+    headers = {"Last-Event-ID": str(last_event_id), "X-Match-Forwarded": "1"}
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=None)) as client:
+        async with client.stream("GET", url, headers=headers) as response:
+            if response.status_code != 200:
+                logger.warning(f"转发比赛事件流失败 ({owner_url}): HTTP {response.status_code}")
+                return
+            async for chunk in response.aiter_raw():
+                yield chunk
+
+
+_registry: Optional[MatchRegistry] = None
+
+
+def get_match_registry() -> MatchRegistry:
+    """获取全局比赛注册表"""
+    global _registry
+    if _registry is None:
+        _registry = MatchRegistry(
+            shared=MATCH_REGISTRY_CONFIG["backend"] == "database",
+            advertise_url=MATCH_REGISTRY_CONFIG["advertise_url"],
+            heartbeat_interval=MATCH_REGISTRY_CONFIG["heartbeat_interval"],
+            retain_seconds=MATCH_REGISTRY_CONFIG["retain_seconds"],
+        )
+    return _registry
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+比赛 worker 进程（队列模式）
+
+从 match_jobs 表领取比赛任务并执行 run_tournament_match，事件编码为 SSE 帧批量写入
+match_events 表，由 API 进程读取后推送给客户端。任务带租约：worker 定期续约，
+进程退出后租约过期，任务会被其他 worker 重新领取
+
+使用方法（API 进程设置 MATCH_EXECUTION_MODE=queue）:
+    python match_worker.py --concurrency 4
+
+收到 SIGINT / SIGTERM 后不再领取新任务，等待进行中的比赛完成；再次收到信号时取消进行中的比赛
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import database
+from backend.config import MATCH_QUEUE_CONFIG
+from backend.llm_client import close_clients
+from backend.log import logger
+from backend.models import DifficultyLevel
+from backend.persistence import get_write_buffer
+from backend.sse import SSEEncoder
+from backend.tournament import run_tournament_match
+
+
+class MatchWorker:
+    """比赛任务执行器"""
+
+    def __init__(self, concurrency: int, lease_seconds: float, max_attempts: int,
+                 poll_interval: float, publish_interval: float, event_retain_seconds: float):
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.publish_interval = publish_interval
+        self.event_retain_seconds = event_retain_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:match-worker"
+        self._running = {}       # job_id -> 比赛任务
+        self._pending_events = []
+        self._publish_lock = asyncio.Lock()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        """第一次调用停止领取新任务，第二次调用取消进行中的比赛"""
+        if self._stopping.is_set():
+            logger.warning(f"取消进行中的 {len(self._running)} 场比赛")
+            for task in self._running.values():
+                task.cancel()
+        else:
+            logger.info("停止领取新任务，等待进行中的比赛完成（再次中断将取消比赛）")
+            self._stopping.set()
+
+    async def run(self):
+        await database.init_db()
+        logger.info(f"比赛 worker 已启动: {self.worker_id}, 并发: {self.concurrency}")
+        background = [
+            asyncio.create_task(self._publish_loop()),
+            asyncio.create_task(self._lease_loop()),
+        ]
+        try:
+            while not self._stopping.is_set():
+                job = None
+                if len(self._running) < self.concurrency:
+                    job = await database.lease_match_job(self.worker_id, self.lease_seconds, self.max_attempts)
+                if job is not None:
+                    self._running[job.id] = asyncio.create_task(self._run_job(job))
+                    continue
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            if self._running:
+                await asyncio.gather(*self._running.values(), return_exceptions=True)
+        finally:
+            for task in background:
+                task.cancel()
+            await self._publish()
+            await get_write_buffer().close()
+            await close_clients()
+            await database.engine.dispose()
+            logger.info("比赛 worker 已退出")
+
+    async def _run_job(self, job):
+        """执行单个比赛任务，事件按 SSE 帧登记，由发布任务批量写入"""
+        match_id = job.match_id
+        encoder = SSEEncoder(start_id=await database.get_last_match_event_seq(match_id))
+
+        def publish(event: dict):
+            frame = encoder.encode(event)
+            self._pending_events.append({"match_id": match_id, "seq": encoder.last_id, "frame": frame})
+
+        logger.info(f"开始执行比赛任务 #{job.id} ({match_id}, 第 {job.attempts} 次)")
+        if job.attempts > 1:
+            publish({"type": "status", "content": "比赛所在进程已失联，比赛重新开始"})
+
+        kwargs = dict(job.payload)
+        kwargs["topic_difficulty"] = DifficultyLevel(kwargs["topic_difficulty"])
+        status, error = "DONE", None
+        try:
+            async for event in run_tournament_match(**kwargs, match_id=match_id):
+                publish(event)
+        except asyncio.CancelledError:
+            logger.warning(f"比赛任务 #{job.id} 已取消")
+            status = "CANCELLED"
+        except Exception as e:
+            logger.error(f"比赛任务 #{job.id} 执行失败: {e}", exc_info=True)
+            publish({"type": "error", "content": str(e)})
+            status, error = "FAILED", str(e)
+        finally:
+            # 先写入全部事件再标记任务结束，API 进程看到结束状态时事件已完整
+            await self._publish()
+            await database.finish_match_job(job.id, self.worker_id, status, error)
+            self._running.pop(job.id, None)
+
+    async def _publish(self):
+        async with self._publish_lock:
+            rows, self._pending_events = self._pending_events, []
+            if not rows:
+                return
+            try:
+                await database.append_match_events(rows)
+            except Exception as e:
+                logger.error(f"比赛事件写入失败 ({len(rows)} 条)，将在下次发布时重试: {e}")
+                self._pending_events = rows + self._pending_events
+
+    async def _publish_loop(self):
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            await self._publish()
+
+    async def _lease_loop(self):
+        """续约进行中的任务，取消被请求取消的比赛，并定期清理过期事件"""
+        loop = asyncio.get_running_loop()
+        last_purge = 0.0
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                cancelled = await database.renew_match_job_leases(
+                    self.worker_id, list(self._running), self.lease_seconds
+                )
+                for job_id in cancelled:
+                    task = self._running.get(job_id)
+                    if task is not None and not task.done():
+                        logger.info(f"客户端已断开，取消比赛任务 #{job_id}")
+                        task.cancel()
+                if loop.time() - last_purge > 600:
+                    last_purge = loop.time()
+                    purged = await database.purge_match_events(self.event_retain_seconds)
+                    if purged:
+                        logger.info(f"已清理 {purged} 条过期比赛事件")
+            except Exception as e:
+                logger.error(f"比赛任务续约失败: {e}")
+
+
+async def main(args):
+    worker = MatchWorker(
+        concurrency=args.concurrency,
+        lease_seconds=MATCH_QUEUE_CONFIG["lease_seconds"],
+        max_attempts=MATCH_QUEUE_CONFIG["max_attempts"],
+        poll_interval=MATCH_QUEUE_CONFIG["poll_interval"],
+        publish_interval=MATCH_QUEUE_CONFIG["publish_interval"],
+        event_retain_seconds=MATCH_QUEUE_CONFIG["event_retain_seconds"],
+    )
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+    await worker.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比赛 worker 进程（队列模式）")
+    parser.add_argument("--concurrency", type=int, default=MATCH_QUEUE_CONFIG["concurrency"], help="同时运行的比赛数")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+信息增益配对 - 选择最能修正 ELO 排名的模型对和辩题
+
+- 配对分数 = 4·p·(1-p) × 双方评分不确定度的均值，p 为 ELO 期望胜率，不确定度为 1 / (1 + 已赛场数)：
+  评分接近（结果最难预测）、场数少（评分最不可信）的模型对优先
+- 所有配对分数预先计算并放入最大堆（惰性删除），取下一场为 O(log n)；一场比赛结束后只重算涉及双方的配对
+- 已安排但未结束的配对暂时移出候选（预约），比赛结束或预约超时后重新加入，并发安排的比赛不会集中在同一对模型；
+  可用配对都已预约时才重复安排已预约的配对
+- 辩题优先选择使用次数少的分类（按分类内平均使用次数），分类内选择使用次数最少的辩题
+- 比赛结束时（流式比赛和批量评测）更新辩题库的 usage_count / avg_rating，并把 ELO 变化同步到配对分数
+
+状态在进程内维护，首次使用时从数据库加载（选手 ELO 和场数、辩题使用次数）
+"""
+
+import heapq
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import MATCHMAKING_CONFIG
+from .database import get_all_competitors, get_all_topics, record_topic_result
+from .log import logger
+from .models import DebateTopic, MatchRequest, MatchSession
+
+Pair = Tuple[str, str]
+
+
+def expected_score(rating_a: float, rating_b: float) -> float:
+    """A 对 B 的 ELO 期望胜率"""
+    return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
+
+
+def pair_information(rating_a: float, played_a: int, rating_b: float, played_b: int) -> float:
+    """一场比赛对双方评分的预期信息量（0-1）"""
+    p = expected_score(rating_a, rating_b)
+    return 4 * p * (1 - p) * (1 / (1 + played_a) + 1 / (1 + played_b)) / 2
+
+
+def _pair_key(a: str, b: str) -> Pair:
+    return (a, b) if a < b else (b, a)
+
+
+class Matchmaker:
+    """
+    配对器
+
+    - 配对堆: (-分数, 版本, a, b)，配对分数变化时版本 +1，旧条目在出堆时丢弃
+    - 辩题堆: 每个分类一个 (使用次数, 辩题 ID) 最小堆，分类堆按 (平均使用次数, 分类)；
+      使用次数只增不减，条目与当前值不一致即为过期
+    """
+
+    def __init__(self, competitors: Iterable[Tuple[str, int, int]], topics: Iterable[DebateTopic],
+                 reservation_ttl: float = 900.0):
+        """
+        Args:
+            competitors: (model_id, elo_rating, matches_played)
+            topics: 辩题库
+            reservation_ttl: 已安排配对的预约时长（秒），超时未结束的比赛重新参与配对
+        """
+        self.reservation_ttl = reservation_ttl
+        self._players: Dict[str, Tuple[int, int]] = {m: (rating, played) for m, rating, played in competitors}
+        self._versions: Dict[Pair, int] = {}
+        self._pair_heap: List[Tuple[float, int, str, str]] = []
+        self._reserved: Dict[Pair, Tuple[float, List[int]]] = {}   # 配对 -> (预约到期时间, 进行中比赛的辩题 ID)
+        self._expiry_heap: List[Tuple[float, Pair]] = []
+        self._pair_games: Counter = Counter()   # 各配对已安排的场数，用于轮换正反方
+        self._stats = {"scheduled": 0, "results": 0, "expired": 0, "overbooked": 0}
+
+        self._topics: Dict[int, DebateTopic] = {}
+        self._topic_ids: Dict[str, int] = {}
+        self._topic_usage: Dict[int, int] = {}
+        self._category_topics: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._category_usage: Counter = Counter()
+        self._category_size: Counter = Counter()
+        self._category_heap: List[Tuple[float, str]] = []
+        for topic in topics:
+            self._topics[topic.id] = topic
+            self._topic_ids.setdefault(topic.topic, topic.id)
+            self._topic_usage[topic.id] = topic.usage_count
+            self._category_topics[topic.category.value].append((topic.usage_count, topic.id))
+            self._category_usage[topic.category.value] += topic.usage_count
+            self._category_size[topic.category.value] += 1
+        for category, entries in self._category_topics.items():
+            heapq.heapify(entries)
+            self._category_heap.append((self._category_load(category), category))
+        heapq.heapify(self._category_heap)
+
+        models = sorted(self._players)
+        for i, a in enumerate(models):
+            for b in models[i + 1:]:
+                self._versions[(a, b)] = 0
+                self._pair_heap.append((-self._score(a, b), 0, a, b))
+        heapq.heapify(self._pair_heap)
+
+    # ---------- 配对 ----------
+
+    def _score(self, a: str, b: str) -> float:
+        rating_a, played_a = self._players[a]
+        rating_b, played_b = self._players[b]
+        return pair_information(rating_a, played_a, rating_b, played_b)
+
+    def _push_pair(self, pair: Pair):
+        """配对分数变化：旧条目作废，未预约时放入新条目"""
+        version = self._versions[pair] + 1
+        self._versions[pair] = version
+        if pair not in self._reserved:
+            heapq.heappush(self._pair_heap, (-self._score(*pair), version, *pair))
+        # 过期条目过多时重建堆
+        if len(self._pair_heap) > 4 * len(self._versions) + 64:
+            self._pair_heap = [
+                entry for entry in self._pair_heap
+                if self._versions[(entry[2], entry[3])] == entry[1] and (entry[2], entry[3]) not in self._reserved
+            ]
+            heapq.heapify(self._pair_heap)
+
+    def _expire_reservations(self, now: float):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, pair = heapq.heappop(self._expiry_heap)
+            if pair in self._reserved and self._reserved[pair][0] == expires_at:
+                del self._reserved[pair]
+                self._stats["expired"] += 1
+                self._push_pair(pair)
+
+    def next_match(self, available: Optional[Callable[[str], bool]] = None,
+                   **request_fields) -> Optional[Tuple[MatchRequest, float]]:
+        """
+        选择信息量最大的配对和辩题，并预约该配对
+
+        Args:
+            available: 模型是否可用（例如 provider_router.model_available），不可用的配对本次跳过
+            request_fields: MatchRequest 的其他字段（rounds、judges 等）
+
+        Returns:
+            (比赛请求, 配对分数)，没有可用模型对或辩题库为空时返回 None
+        """
+        now = time.monotonic()
+        self._expire_reservations(now)
+        if not self._topics:
+            return None
+
+        skipped = []
+        picked = None
+        while self._pair_heap:
+            entry = heapq.heappop(self._pair_heap)
+            neg_score, version, a, b = entry
+            if self._versions.get((a, b)) != version:
+                continue
+            if available is not None and not (available(a) and available(b)):
+                skipped.append(entry)
+                continue
+            picked = entry
+            break
+        for entry in skipped:
+            heapq.heappush(self._pair_heap, entry)
+        if picked is not None:
+            neg_score, _, a, b = picked
+        else:
+            # 可用配对都已预约（并发数超过配对数）：重复安排分数最高的已预约配对
+            candidates = [
+                pair for pair in self._reserved
+                if available is None or (available(pair[0]) and available(pair[1]))
+            ]
+            if not candidates:
+                return None
+            a, b = max(candidates, key=lambda pair: self._score(*pair))
+            neg_score = -self._score(a, b)
+            self._stats["overbooked"] += 1
+
+        topic = self._pick_topic()
+        pair = (a, b)
+        expires_at = now + self.reservation_ttl
+        self._reserved[pair] = (expires_at, self._reserved.get(pair, (0.0, []))[1] + [topic.id])
+        heapq.heappush(self._expiry_heap, (expires_at, pair))
+        # 同一配对轮换正反方
+        prop, opp = (a, b) if self._pair_games[pair] % 2 == 0 else (b, a)
+        self._pair_games[pair] += 1
+        self._stats["scheduled"] += 1
+
+        request = MatchRequest(
+            topic=topic.topic,
+            topic_difficulty=topic.difficulty,
+            proponent_model=prop,
+            opponent_model=opp,
+            **request_fields
+        )
+        return request, -neg_score
+
+    def release(self, prop: str, opp: str):
+        """取消预约（比赛未能进行）"""
+        pair = _pair_key(prop, opp)
+        if pair in self._reserved:
+            self._finish_reservation(pair)
+            if pair not in self._reserved:
+                self._push_pair(pair)
+
+    def _finish_reservation(self, pair: Pair, topic_id: Optional[int] = None) -> bool:
+        """一场已安排的比赛结束，配对没有进行中的比赛时取消预约；返回辩题是否由本配对器安排（已计入使用次数）"""
+        expires_at, topic_ids = self._reserved[pair]
+        scheduled = topic_id in topic_ids
+        topic_ids.remove(topic_id if scheduled else topic_ids[0])
+        if not topic_ids:
+            del self._reserved[pair]
+        return scheduled
+
+    def record_result(self, prop: str, opp: str, topic: str, elo_changes: Optional[dict] = None):
+        """
+        比赛结束：释放预约，同步双方 ELO 和场数并重算涉及双方的配对分数
+
+        不是由本配对器安排的比赛，辩题在辩题库中时计入使用次数
+        """
+        pair = _pair_key(prop, opp)
+        topic_id = self._topic_ids.get(topic)
+        reserved = pair in self._reserved
+        scheduled = reserved and self._finish_reservation(pair, topic_id)
+        if topic_id is not None and not scheduled:
+            self._use_topic(topic_id)
+        self._stats["results"] += 1
+
+        updated = False
+        if elo_changes and not elo_changes.get("proponent", {}).get("skipped"):
+            for model_id, side in ((prop, "proponent"), (opp, "opponent")):
+                if model_id in self._players:
+                    _, played = self._players[model_id]
+                    self._players[model_id] = (elo_changes[side]["new_rating"], played + 1)
+                    updated = True
+        if updated:
+            for model_id in {prop, opp} & self._players.keys():
+                for other in self._players:
+                    if other != model_id:
+                        self._push_pair(_pair_key(model_id, other))
+        elif reserved and pair not in self._reserved:
+            self._push_pair(pair)
+
+    # ---------- 辩题 ----------
+
+    def _category_load(self, category: str) -> float:
+        return self._category_usage[category] / self._category_size[category]
+
+    def _use_topic(self, topic_id: int):
+        category = self._topics[topic_id].category.value
+        self._topic_usage[topic_id] += 1
+        self._category_usage[category] += 1
+        heapq.heappush(self._category_topics[category], (self._topic_usage[topic_id], topic_id))
+        heapq.heappush(self._category_heap, (self._category_load(category), category))
+
+    def _pick_topic(self) -> DebateTopic:
+        """使用次数最少的分类中使用次数最少的辩题（选中即计入使用次数）"""
+        while self._category_heap[0][0] != self._category_load(self._category_heap[0][1]):
+            heapq.heappop(self._category_heap)
+        entries = self._category_topics[self._category_heap[0][1]]
+        while entries[0][0] != self._topic_usage[entries[0][1]]:
+            heapq.heappop(entries)
+        topic_id = entries[0][1]
+        self._use_topic(topic_id)
+        return self._topics[topic_id]
+
+    def get_stats(self) -> dict:
+        return {
+            **self._stats,
+            "models": len(self._players),
+            "pairs": len(self._versions),
+            "reserved": len(self._reserved),
+            "heap_size": len(self._pair_heap),
+            "topics": len(self._topics),
+            "category_usage": dict(self._category_usage),
+        }
+
+
+_matchmaker: Optional[Matchmaker] = None
+
+
+async def load_matchmaker() -> Matchmaker:
+    """从数据库加载选手和辩题，创建（或重建）全局配对器"""
+    global _matchmaker
+    competitors = [(c.model_id, c.elo_rating, c.matches_played) for c in await get_all_competitors()]
+    _matchmaker = Matchmaker(competitors, await get_all_topics(), MATCHMAKING_CONFIG["reservation_ttl"])
+    logger.info(f"配对器已加载: {len(competitors)} 个模型, {_matchmaker.get_stats()['topics']} 个辩题")
+    return _matchmaker
+
+
+def get_matchmaker() -> Optional[Matchmaker]:
+    """获取全局配对器，尚未加载时返回 None"""
+    return _matchmaker
+
+
+def release_match(prop: str, opp: str):
+    """比赛未能进行时释放配对器中的预约"""
+    if _matchmaker is not None:
+        _matchmaker.release(prop, opp)
+
+
+async def record_match_outcome(match: MatchSession, elo_changes: Optional[dict] = None):
+    """
+    比赛结束时调用：更新辩题库的使用次数和平均评分，同步配对器
+
+    平均评分为双方各维度的平均分（0-10），没有裁判结果时只计使用次数
+    """
+    rating = None
+    if match.result is not None:
+        rating = sum(match.result.final_scores.values()) / 6
+    try:
+        await record_topic_result(match.topic, rating)
+    except Exception as e:
+        logger.error(f"辩题统计更新失败: {e}")
+    if _matchmaker is not None:
+        _matchmaker.record_result(match.proponent_model_id, match.opponent_model_id, match.topic, elo_changes)
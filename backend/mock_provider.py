@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟的 OpenAI 兼容模型服务
+
+用于压测和本地联调：/v1/chat/completions 以 SSE 流式返回固定内容，裁判请求返回合法的评分 JSON。
+--ttft / --error-rate 模拟首 token 慢和服务端故障（返回 503）。
+/stats 返回请求数和客户端建立的 TCP 连接数（按客户端地址去重），用于观察连接复用情况。
+
+使用方法:
+    python mock_provider.py --port 9100 --chunks 10 --delay 0.15
+    OPENROUTER_API_URL=http://127.0.0.1:9100/v1 uvicorn backend.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+JUDGE_RESULT = {
+    "scores": {
+        "proponent": {"logic": 8, "evidence": 7, "persuasion": 8},
+        "opponent": {"logic": 6, "evidence": 6, "persuasion": 6},
+    },
+    "winner": "proponent",
+    "reasoning": "正方论证更充分，证据更具体。",
+}
+
+
+def create_app(chunks: int = 10, delay: float = 0.15, ttft: float = 0.0, error_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Mock LLM Provider")
+    stats = {"requests": 0, "connections": set()}
+
+    def _chunk(content: str) -> str:
+        data = {
+            "id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": "mock",
+            "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+        }
+        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        if request.client:
+            stats["connections"].add((request.client.host, request.client.port))
+        messages = body.get("messages") or [{}]
+        is_judge = any("裁判" in (m.get("content") or "")[:50] for m in (messages[0], messages[-1]))
+        if random.random() < error_rate:
+            return JSONResponse({"error": {"message": "mock provider unavailable"}}, status_code=503)
+
+        if not body.get("stream"):
+            await asyncio.sleep(ttft + delay * chunks)
+            content = json.dumps(JUDGE_RESULT, ensure_ascii=False) if is_judge else \
+                "".join(f"论点{i + 1}。" for i in range(chunks))
+            return {
+                "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": "mock",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            }
+
+        async def generate():
+            if ttft:
+                await asyncio.sleep(ttft)
+            if is_judge:
+                yield _chunk(json.dumps(JUDGE_RESULT, ensure_ascii=False))
+            else:
+                for i in range(chunks):
+                    await asyncio.sleep(delay)
+                    yield _chunk(f"论点{i + 1}。")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return {"requests": stats["requests"], "connections": len(stats["connections"])}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        stats["requests"] = 0
+        stats["connections"].clear()
+        return {"ok": True}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="模拟的 OpenAI 兼容模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--chunks", type=int, default=10, help="每个流式响应的分块数")
+    parser.add_argument("--delay", type=float, default=0.15, help="分块间隔（秒）")
+    parser.add_argument("--ttft", type=float, default=0.0, help="首个分块前的额外延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的请求比例")
+    parser.add_argument("--keep-alive", type=int, default=75, help="服务端空闲连接保持时间（秒），与常见网关一致")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.chunks, args.delay, args.ttft, args.error_rate), host=args.host, port=args.port,
+                log_level="warning", backlog=4096, timeout_keep_alive=args.keep_alive)
@@ -4,7 +4,8 @@
 @description: 数据模型定义
 """
 
-from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Enum, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, JSON, DateTime, Enum, Boolean, Text, Index, LargeBinary
+from sqlalchemy.dialects.mysql import LONGBLOB
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
 from typing import List, Optional, Literal, Dict
@@ -13,6 +14,9 @@ import enum
 
 Base = declarative_base()
 
+# 二进制大字段（MySQL 的 BLOB 上限只有 64KB）
+BinaryBlob = LargeBinary().with_variant(LONGBLOB(), "mysql")
+
 # ========== 枚举类型 ==========
 
 class DifficultyLevel(str, enum.Enum):
@@ -130,12 +134,86 @@ class MatchModel(Base):
     
     status = Column(String(20))
     transcript = Column(JSON, default=list)
+    transcript_blob = Column(BinaryBlob)  # 比赛结束后的压缩发言记录（此时 transcript 为空）
     judge_result = Column(JSON)
     audience_votes = Column(JSON, default=dict)
     elo_changes = Column(JSON)
     
     created_at = Column(DateTime, default=datetime.utcnow)
     finished_at = Column(DateTime)
+    
+    # 热点查询索引：正方/反方各一组，OR 条件改写为两次索引扫描的并集
+    __table_args__ = (
+        Index("ix_matches_created_at", "created_at"),                                   # 历史记录
+        Index("ix_matches_user_created", "user_id", "created_at"),                      # 按用户的历史记录
+        Index("ix_matches_proponent_created", "proponent_model_id", "created_at"),      # 按模型的历史记录
+        Index("ix_matches_opponent_created", "opponent_model_id", "created_at"),
+        Index("ix_matches_proponent_status_finished", "proponent_model_id", "status", "finished_at"),  # 模型统计
+        Index("ix_matches_opponent_status_finished", "opponent_model_id", "status", "finished_at"),
+    )
+
+
+class TranscriptDictionaryModel(Base):
+    """发言记录压缩字典表"""
+    __tablename__ = "transcript_dictionaries"
+    
+    id = Column(Integer, primary_key=True)
+    data = Column(BinaryBlob, nullable=False)
+    sample_count = Column(Integer, default=0)  # 训练样本数
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class LiveMatchModel(Base):
+    """进行中比赛的归属表（多进程 / 多节点部署时共享）"""
+    __tablename__ = "live_matches"
+    
+    match_id = Column(String(64), primary_key=True)
+    worker_id = Column(String(128), nullable=False)      # 运行比赛的进程: 主机名:PID
+    owner_url = Column(String(255), nullable=True)       # 该进程对其他进程可达的地址
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class MatchJobModel(Base):
+    """比赛任务队列表（队列模式下由独立的 worker 进程领取执行）"""
+    __tablename__ = "match_jobs"
+    
+    id = Column(Integer, primary_key=True)
+    match_id = Column(String(64), unique=True, nullable=False)
+    payload = Column(JSON, nullable=False)              # run_tournament_match 的参数
+    status = Column(String(20), default="QUEUED")       # QUEUED / RUNNING / DONE / FAILED / CANCELLED
+    worker_id = Column(String(128), nullable=True)      # 持有租约的 worker
+    lease_expires_at = Column(DateTime, nullable=True)  # 租约到期未续约视为 worker 已退出，任务可被重新领取
+    attempts = Column(Integer, default=0)
+    cancel_requested = Column(Boolean, default=False)   # 客户端断开后请求取消
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_match_jobs_status_lease", "status", "lease_expires_at"),   # 领取任务
+    )
+
+
+class MatchEventModel(Base):
+    """队列模式下 worker 发布的比赛事件（已编码的 SSE 帧），API 进程读取后推送给客户端"""
+    __tablename__ = "match_events"
+    
+    id = Column(Integer, primary_key=True)
+    match_id = Column(String(64), nullable=False)
+    seq = Column(Integer, nullable=False)   # SSE 事件 ID
+    frame = Column(BinaryBlob, nullable=False)
+    
+    __table_args__ = (
+        Index("ix_match_events_match_seq", "match_id", "seq", unique=True),
+    )
+
+
+class SchemaVersionModel(Base):
+    """已应用的表结构指纹（与当前代码一致时，启动跳过建表、补列和默认数据检查）"""
+    __tablename__ = "schema_versions"
+    
+    fingerprint = Column(String(64), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
 
 
 # ========== Pydantic 模型 (API 交互) ==========
@@ -232,9 +310,16 @@ class MatchRequest(BaseModel):
     rounds: int = 3
     judges: List[str] = Field(default_factory=lambda: ["gpt-4o", "gpt-4o-mini"])
     enabled_tools: List[str] = Field(default_factory=list)  # 默认为空列表，不启用任何工具
+    parallel_openings: Optional[bool] = None  # 第 1 轮双方同时开篇立论，None 使用 DEBATE_CONFIG 配置
     user_id: Optional[int] = None  # 用户ID（可选）
 
 
+class BatchMatchRequest(BaseModel):
+    """批量评测请求"""
+    matches: List[MatchRequest]
+    concurrency: Optional[int] = None  # 同时进行的比赛数，None 使用 BATCH_EVAL_CONFIG 配置
+
+
 class MatchRenameRequest(BaseModel):
     """重命名比赛请求"""
     title: str
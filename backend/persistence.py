@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+比赛进度的后写（write-behind）缓冲
+
+比赛过程中的状态变化和新增发言只登记到内存，由后台任务定期把所有进行中比赛的
+最新状态合并为一次批量提交；比赛结束时立即触发刷新，服务关闭时刷新全部剩余数据
+流式推送路径不再等待数据库
+
+写缓冲是进程内状态，假设比赛只在当前进程中运行和删除（单进程部署）；
+多个工作进程各自持有缓冲，无法感知其他进程删除的比赛
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from .config import WRITE_BEHIND_CONFIG
+from .database import delete_match, match_to_row, save_matches_bulk
+from .log import logger
+from .models import MatchSession
+
+# 删除标记的保留时间（秒），远大于比赛超时（15 分钟），过期后删除标记被清理
+DELETED_TTL_SECONDS = 60 * 60
+
+
+class MatchWriteBuffer:
+    """
+    比赛写缓冲
+
+    - 同一场比赛的多次登记只保留最新状态（序列化推迟到刷新时进行）
+    - 后台任务每 flush_interval 秒刷新一次，待写比赛数达到 max_batch 时提前刷新
+    - 写入失败的比赛重新放回队列，等待下次刷新
+    - 已删除的比赛记录在 _deleted 中，之后的登记和刷新都跳过（进行中的比赛被删除后不会被写回）；
+      删除标记保留 deleted_ttl 秒后清理，长期运行时不会无限增长
+    """
+
+    def __init__(self, flush_interval: float = 1.0, max_batch: int = 100, deleted_ttl: float = DELETED_TTL_SECONDS):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.deleted_ttl = deleted_ttl
+        self._pending: Dict[str, Tuple[MatchSession, Optional[dict]]] = {}
+        # match_id -> 删除时间（time.monotonic()）
+        self._deleted: Dict[str, float] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._stats = {"records": 0, "flushes": 0, "rows_written": 0, "failures": 0}
+
+    def _ensure_started(self):
+        """首次使用时在当前事件循环中启动后台刷新任务"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    def record(self, match: MatchSession, elo_changes: Optional[dict] = None, flush: bool = False):
+        """
+        登记比赛的最新状态（不等待数据库）
+
+        Args:
+            match: 比赛会话（刷新时才序列化，期间的修改会一并写入）
+            elo_changes: ELO 变化，为 None 时保留之前登记的值
+            flush: 是否立即唤醒后台任务（比赛结束时使用）
+        """
+        if self._is_deleted(match.match_id):
+            return
+        self._ensure_started()
+        previous = self._pending.get(match.match_id)
+        if elo_changes is None and previous is not None:
+            elo_changes = previous[1]
+        self._pending[match.match_id] = (match, elo_changes)
+        self._stats["records"] += 1
+        if flush or len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def discard(self, match_id: str):
+        """丢弃尚未写入的比赛，并且不再接受该比赛的登记（比赛已删除）"""
+        self._pending.pop(match_id, None)
+        now = time.monotonic()
+        # 插入顺序即删除时间顺序，从头清理过期标记
+        for expired in list(self._deleted):
+            if now - self._deleted[expired] < self.deleted_ttl:
+                break
+            del self._deleted[expired]
+        self._deleted.pop(match_id, None)
+        self._deleted[match_id] = now
+
+    def _is_deleted(self, match_id: str) -> bool:
+        deleted_at = self._deleted.get(match_id)
+        return deleted_at is not None and time.monotonic() - deleted_at < self.deleted_ttl
+
+    async def delete(self, match_id: str, user_id: Optional[int] = None) -> bool:
+        """
+        删除比赛记录
+
+        持有刷新锁执行，期间不会有批次写入该比赛：先写入尚未落库的最新状态（进行中的比赛也能按归属校验删除），
+        删除成功后丢弃该比赛；归属校验失败时不影响写缓冲
+        """
+        self._ensure_started()
+        async with self._flush_lock:
+            item = self._pending.pop(match_id, None)
+            try:
+                if item is not None:
+                    await save_matches_bulk([match_to_row(*item)])
+                deleted = await delete_match(match_id, user_id)
+            except Exception:
+                if item is not None:
+                    self._pending.setdefault(match_id, item)
+                raise
+            if deleted:
+                self.discard(match_id)
+            return deleted
+
+    async def flush(self):
+        """把所有待写比赛合并为一次批量提交"""
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            for match_id in [match_id for match_id in batch if self._is_deleted(match_id)]:
+                del batch[match_id]
+            if not batch:
+                return
+            rows = [match_to_row(match, elo_changes) for match, elo_changes in batch.values()]
+            try:
+                await save_matches_bulk(rows)
+                self._stats["flushes"] += 1
+                self._stats["rows_written"] += len(rows)
+            except Exception as e:
+                self._stats["failures"] += 1
+                logger.error(f"比赛批量写入失败 ({len(rows)} 场)，将在下次刷新时重试: {e}")
+                # 期间重新登记过的比赛以新状态为准
+                for match_id, item in batch.items():
+                    if not self._is_deleted(match_id):
+                        self._pending.setdefault(match_id, item)
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def close(self):
+        """停止后台任务并写入全部剩余数据（服务关闭时调用）"""
+        if self._task is not None:
+            # 不直接取消任务，避免正在写入的批次丢失
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "pending": len(self._pending), "deleted": len(self._deleted)}
+
+
+_write_buffer: Optional[MatchWriteBuffer] = None
+
+
+def get_write_buffer() -> MatchWriteBuffer:
+    """获取全局比赛写缓冲"""
+    global _write_buffer
+    if _write_buffer is None:
+        _write_buffer = MatchWriteBuffer(
+            flush_interval=WRITE_BEHIND_CONFIG["flush_interval"],
+            max_batch=WRITE_BEHIND_CONFIG["max_batch"],
+        )
+    return _write_buffer
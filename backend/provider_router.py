@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+模型服务路由 - 多服务端点的延迟感知选路与故障切换
+
+- 每个模型可由一个或多个服务端点提供（LLM_PROVIDERS），未配置时只有 OPENROUTER_API_URL 一个端点
+- 每个端点按滚动窗口统计首 token 延迟（TTFT）和错误率，选路时按 TTFT 中位数排序，错误率高的端点靠后
+- 每个端点一个熔断器（closed / open / half-open），熔断期间不参与选路，冷却后放行一个探测请求
+- 每个模型一个熔断器，按端点切换之后的最终结果计数；熔断期间该模型的调用立即失败，
+  比赛开始前通过 plan_match_models 拒绝辩手模型熔断的比赛、替换熔断的裁判
+"""
+
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from statistics import median
+from typing import Dict, Iterable, List, Optional
+
+from .config import JUDGE_PANEL, LLM_CONFIG, LLM_PROVIDERS, MODEL_BREAKER_CONFIG, PROVIDER_ROUTING_CONFIG
+from .log import logger
+
+# 计入端点故障（并触发切换）的错误类型；bad_request 是请求本身的问题，换端点也无济于事
+FAILOVER_ERROR_TYPES = ("rate_limit", "timeout", "connection", "auth", "api_error", "unknown")
+
+
+class ModelUnavailableError(Exception):
+    """比赛所需的模型熔断中"""
+
+    def __init__(self, message: str, models: List[str], retry_after: float):
+        super().__init__(message)
+        self.models = models
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed: 正常放行；连续失败达到阈值，或窗口内错误率超过阈值时打开
+    - open: 拒绝请求，冷却 cooldown 秒后进入 half-open
+    - half-open: 只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, error_rate: float, min_samples: int, cooldown: float,
+                 window: int):
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+        self._outcomes = deque(maxlen=window)   # True 表示成功
+
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+
+    def current_state(self) -> str:
+        """当前状态（冷却结束的 open 视为 half-open）"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            return self.HALF_OPEN
+        return self.state
+
+    def retry_after(self) -> float:
+        """距离放行探测请求的剩余秒数"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """是否放行请求；half-open 时放行一个探测请求（探测超过冷却时间未结束则再放行一个）"""
+        state = self.current_state()
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN:
+            return False
+        now = time.monotonic()
+        if self.probe_started_at is not None and now - self.probe_started_at < self.cooldown:
+            return False
+        self.state = self.HALF_OPEN
+        self.probe_started_at = now
+        return True
+
+    def record_success(self):
+        self._outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            self.probe_started_at = None
+            self._outcomes.clear()
+
+    def record_failure(self) -> bool:
+        """记录一次失败，返回熔断器是否因此打开"""
+        self._outcomes.append(False)
+        self.consecutive_failures += 1
+        should_open = (
+            self.state == self.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+            or (len(self._outcomes) >= self.min_samples and self.error_rate >= self.error_rate_threshold)
+        )
+        if should_open and self.state != self.OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.probe_started_at = None
+            return True
+        if self.state == self.OPEN:
+            self.opened_at = time.monotonic()
+        return False
+
+    def get_stats(self) -> dict:
+        return {
+            "state": self.current_state(),
+            "consecutive_failures": self.consecutive_failures,
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self._outcomes),
+            "retry_after": round(self.retry_after(), 1),
+        }
+
+
+def create_model_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=MODEL_BREAKER_CONFIG["failures"],
+        error_rate=MODEL_BREAKER_CONFIG["error_rate"],
+        min_samples=MODEL_BREAKER_CONFIG["min_samples"],
+        cooldown=MODEL_BREAKER_CONFIG["cooldown"],
+        window=MODEL_BREAKER_CONFIG["window"],
+    )
+
+
+def create_breaker() -> CircuitBreaker:
+    return CircuitBreaker(
+        failure_threshold=PROVIDER_ROUTING_CONFIG["breaker_failures"],
+        error_rate=PROVIDER_ROUTING_CONFIG["breaker_error_rate"],
+        min_samples=PROVIDER_ROUTING_CONFIG["breaker_min_samples"],
+        cooldown=PROVIDER_ROUTING_CONFIG["breaker_cooldown"],
+        window=PROVIDER_ROUTING_CONFIG["window"],
+    )
+
+
+@dataclass
+class ProviderEndpoint:
+    """模型服务端点"""
+    name: str
+    base_url: str
+    api_key: Optional[str]
+    models: List[str]                                   # 支持的模型，"*" 表示全部
+    model_map: Dict[str, str] = field(default_factory=dict)   # 模型 ID -> 该端点上的模型名
+    breaker: CircuitBreaker = field(default_factory=create_breaker)
+    ttfts: deque = field(default_factory=lambda: deque(maxlen=PROVIDER_ROUTING_CONFIG["window"]))
+    requests: int = 0
+    failures: int = 0
+
+    def serves(self, model_id: str) -> bool:
+        return "*" in self.models or model_id in self.models or model_id in self.model_map
+
+    def resolve_model(self, model_id: str) -> str:
+        return self.model_map.get(model_id, model_id)
+
+    @property
+    def ttft_p50(self) -> Optional[float]:
+        return median(self.ttfts) if self.ttfts else None
+
+    def score(self) -> float:
+        """选路得分（越小越优先）：TTFT 中位数按错误率加权，没有样本的端点优先探索"""
+        if not self.ttfts:
+            return 0.0
+        return self.ttft_p50 * (1 + 4 * self.breaker.error_rate)
+
+
+class ProviderRouter:
+    """按模型选择服务端点，并记录每个端点的延迟和错误"""
+
+    def __init__(self, endpoints: List[ProviderEndpoint], model_breaker_enabled: bool = True):
+        self.endpoints = endpoints
+        self.model_breaker_enabled = model_breaker_enabled
+        self.model_breakers: Dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_config(cls, providers: List[dict]) -> "ProviderRouter":
+        if not providers:
+            providers = [{"name": "default", "base_url": LLM_CONFIG["base_url"], "models": ["*"]}]
+        endpoints = [
+            ProviderEndpoint(
+                name=p.get("name") or p["base_url"],
+                base_url=p["base_url"],
+                api_key=p.get("api_key") or LLM_CONFIG["api_key"],
+                models=list(p.get("models") or ["*"]),
+                model_map=dict(p.get("model_map") or {}),
+            )
+            for p in providers
+        ]
+        logger.info(f"模型服务端点: {[(e.name, e.base_url, e.models) for e in endpoints]}")
+        return cls(endpoints, MODEL_BREAKER_CONFIG["enabled"])
+
+    def route(self, model_id: str) -> List[ProviderEndpoint]:
+        """
+        返回按优先级排序的候选端点（熔断中的端点不返回）
+
+        调用方依次尝试，每次尝试前调用 endpoint.breaker.allow()（half-open 的端点只放行一个探测请求），
+        首个端点失败或首 token 过慢时切换到下一个
+        """
+        candidates = [e for e in self.endpoints
+                      if e.serves(model_id) and e.breaker.current_state() != CircuitBreaker.OPEN]
+        return sorted(candidates, key=lambda e: e.score())
+
+    def has_endpoint(self, model_id: str) -> bool:
+        return any(e.serves(model_id) for e in self.endpoints)
+
+    def record_success(self, endpoint: ProviderEndpoint, ttft: Optional[float] = None):
+        endpoint.requests += 1
+        if ttft is not None:
+            endpoint.ttfts.append(ttft)
+        endpoint.breaker.record_success()
+
+    def record_failure(self, endpoint: ProviderEndpoint, error_type: str, ttft: Optional[float] = None):
+        """记录端点失败；首 token 超时时把等待时间计入 TTFT，使慢端点排到后面"""
+        endpoint.requests += 1
+        if error_type not in FAILOVER_ERROR_TYPES:
+            return
+        endpoint.failures += 1
+        if ttft is not None:
+            endpoint.ttfts.append(ttft)
+        if endpoint.breaker.record_failure():
+            logger.warning(
+                f"模型服务端点 {endpoint.name} 熔断 {endpoint.breaker.cooldown:.0f}s "
+                f"(连续失败 {endpoint.breaker.consecutive_failures} 次, 错误率 {endpoint.breaker.error_rate:.0%})"
+            )
+
+    # ---------- 模型熔断 ----------
+
+    def model_breaker(self, model_id: str) -> CircuitBreaker:
+        breaker = self.model_breakers.get(model_id)
+        if breaker is None:
+            breaker = self.model_breakers[model_id] = create_model_breaker()
+        return breaker
+
+    def model_available(self, model_id: str) -> bool:
+        """模型是否可用（不占用 half-open 的探测名额）"""
+        if not self.model_breaker_enabled:
+            return True
+        breaker = self.model_breakers.get(model_id)
+        return breaker is None or breaker.current_state() != CircuitBreaker.OPEN
+
+    def allow_model(self, model_id: str) -> bool:
+        """调用模型前检查；熔断中返回 False，half-open 时只放行一个探测调用"""
+        return not self.model_breaker_enabled or self.model_breaker(model_id).allow()
+
+    def record_model_result(self, model_id: str, error_type: Optional[str] = None):
+        """记录一次模型调用的最终结果（端点切换之后）；请求参数错误等非服务故障不计入"""
+        if not self.model_breaker_enabled:
+            return
+        breaker = self.model_breaker(model_id)
+        if error_type is None:
+            breaker.record_success()
+        elif error_type in FAILOVER_ERROR_TYPES and breaker.record_failure():
+            logger.warning(
+                f"模型 {model_id} 熔断 {breaker.cooldown:.0f}s "
+                f"(连续失败 {breaker.consecutive_failures} 次, 错误率 {breaker.error_rate:.0%})"
+            )
+
+    def plan_match_models(self, prop_model_id: str, opp_model_id: str, judges: List[str]) -> List[str]:
+        """
+        比赛开始前检查模型熔断状态，避免比赛进行到一半才失败
+
+        - 辩手模型熔断时抛出 ModelUnavailableError
+        - 熔断的裁判替换为 JUDGE_PANEL 中可用且未在裁判团中的模型，可用裁判不足 2 个时抛出 ModelUnavailableError
+
+        Returns:
+            调整后的裁判团
+        """
+        unavailable = [m for m in dict.fromkeys((prop_model_id, opp_model_id)) if not self.model_available(m)]
+        if unavailable:
+            raise ModelUnavailableError(
+                f"模型 {', '.join(unavailable)} 暂时不可用（熔断中），请稍后再试",
+                unavailable, max(self.model_breakers[m].retry_after() for m in unavailable)
+            )
+
+        open_judges = [j for j in judges if not self.model_available(j)]
+        if not open_judges:
+            return judges
+        healthy = [j for j in judges if j not in open_judges]
+        spares = [j for j in JUDGE_PANEL if j not in judges and self.model_available(j)]
+        replaced = healthy + spares[:len(open_judges)]
+        if len(replaced) < 2:
+            raise ModelUnavailableError(
+                f"裁判 {', '.join(open_judges)} 暂时不可用（熔断中），可用裁判不足 2 个",
+                open_judges, min(self.model_breakers[j].retry_after() for j in open_judges)
+            )
+        logger.warning(f"裁判 {open_judges} 熔断中，裁判团调整为 {replaced}")
+        return replaced
+
+    def get_health(self, model_ids: Iterable[str]) -> dict:
+        """模型和服务端点的健康状态"""
+        models = {
+            m: (self.model_breakers[m].get_stats() if m in self.model_breakers
+                else {"state": CircuitBreaker.CLOSED, "samples": 0})
+            for m in dict.fromkeys([*model_ids, *self.model_breakers])
+        }
+        endpoints = self.get_stats()
+        degraded = (
+            any(m["state"] == CircuitBreaker.OPEN for m in models.values())
+            or any(e["breaker"]["state"] == CircuitBreaker.OPEN for e in endpoints)
+        )
+        return {"status": "degraded" if degraded else "ok", "models": models, "endpoints": endpoints}
+
+    def get_stats(self) -> List[dict]:
+        return [
+            {
+                "name": e.name,
+                "base_url": e.base_url,
+                "models": e.models,
+                "requests": e.requests,
+                "failures": e.failures,
+                "ttft_p50_ms": round(e.ttft_p50 * 1000) if e.ttfts else None,
+                "breaker": e.breaker.get_stats(),
+            }
+            for e in self.endpoints
+        ]
+
+
+_router = None
+
+
+def get_provider_router() -> ProviderRouter:
+    """获取全局模型服务路由（首次调用时按配置创建）"""
+    global _router
+    if _router is None:
+        _router = ProviderRouter.from_config(LLM_PROVIDERS)
+    return _router
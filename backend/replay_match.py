@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+比赛录制与离线回放
+
+record: 调用真实模型服务运行一场比赛，模型调用写入存档（llm_recorder），比赛参数一并保存
+replay: 从存档回放模型调用重跑同一场比赛，不调用模型服务；每次运行使用全新的临时数据库，
+        检查辩论内容、裁判结果和 ELO 变化与录制时一致，并统计编排、评分和 ELO 流程的耗时
+
+使用方法:
+    python replay_match.py record --archive match.db --topic "人工智能是否应该开源" --prop gpt-4o --opp gpt-4o-mini
+    python replay_match.py replay --archive match.db --runs 5              # 不等待，测量流程本身的开销
+    python replay_match.py replay --archive match.db --runs 1 --speed 10   # 按录制节奏 10 倍速回放
+
+工具结果与模型调用一并录制，回放时不执行工具（不需要 SERPER_API_KEY）
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _save_match_params(archive: str, params: dict):
+    conn = sqlite3.connect(archive)
+    conn.execute("CREATE TABLE IF NOT EXISTS recorded_match (id INTEGER PRIMARY KEY CHECK (id = 1), params TEXT)")
+    conn.execute("INSERT OR REPLACE INTO recorded_match (id, params) VALUES (1, ?)", (json.dumps(params),))
+    conn.commit()
+    conn.close()
+
+
+def _load_match_params(archive: str) -> dict:
+    conn = sqlite3.connect(archive)
+    try:
+        row = conn.execute("SELECT params FROM recorded_match WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    conn.close()
+    if row is None:
+        print(f"❌ 存档中没有录制的比赛: {archive}")
+        sys.exit(1)
+    return json.loads(row[0])
+
+
+async def _run_match(params: dict, mode: str, archive: str, speed: float) -> dict:
+    """在当前进程中运行一场比赛，返回可比较的结果摘要"""
+    sys.path.insert(0, ROOT)
+    from backend.database import init_db
+    from backend.llm_recorder import configure_llm_recorder
+    from backend.models import DifficultyLevel
+    from backend.persistence import get_write_buffer
+    from backend.tournament import run_tournament_match
+
+    recorder = configure_llm_recorder(mode, archive, speed)
+    await init_db()
+
+    transcript = hashlib.sha256()
+    summary = {"turns": 0, "winner": None, "scores": None, "elo": None, "errors": []}
+    started = time.perf_counter()
+    params = {k: v for k, v in params.items() if k != "expected"}
+    params["topic_difficulty"] = DifficultyLevel(params["topic_difficulty"])
+    async for event in run_tournament_match(**params):
+        if event["type"] == "turn_complete":
+            turn = event["turn"]
+            summary["turns"] += 1
+            transcript.update(f"{turn.speaker_role}\n{turn.content}\n".encode("utf-8"))
+        elif event["type"] == "judge_complete":
+            result = event["result"]
+            summary["winner"] = result.winner
+            summary["scores"] = result.final_scores
+        elif event["type"] == "elo_update":
+            data = event["data"]
+            summary["elo"] = None if data.get("skip") else [data["proponent"]["change"], data["opponent"]["change"]]
+        elif event["type"] == "error":
+            summary["errors"].append(event["content"])
+    summary["elapsed"] = time.perf_counter() - started
+    summary["transcript_sha256"] = transcript.hexdigest()
+    summary["recorder"] = recorder.get_stats()
+    await get_write_buffer().close()
+    return summary
+
+
+def _run_in_subprocess(mode: str, archive: str, speed: float) -> dict:
+    """每次运行使用全新的临时数据库，ELO 从相同的初始分开始"""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'arena.db')}"
+        env.setdefault("DEBATE_LOG_LEVEL", "WARNING")
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "_run", "--archive", archive,
+             "--mode", mode, "--speed", str(speed)],
+            cwd=ROOT, env=env, capture_output=True, text=True
+        )
+    if result.returncode != 0:
+        print(result.stderr[-3000:])
+        sys.exit(result.returncode)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _comparable(summary: dict) -> dict:
+    return {k: summary[k] for k in ("turns", "winner", "scores", "elo", "transcript_sha256")}
+
+
+def record(args):
+    archive = os.path.abspath(args.archive)
+    params = {
+        "topic": args.topic,
+        "topic_difficulty": args.difficulty,
+        "prop_model_id": args.prop,
+        "opp_model_id": args.opp,
+        "prop_personality": args.prop_personality,
+        "opp_personality": args.opp_personality,
+        "rounds": args.rounds,
+        "judges": args.judges.split(","),
+        "enabled_tools": [t for t in args.tools.split(",") if t],
+    }
+    _save_match_params(archive, params)
+    print(f"录制比赛: {args.prop} vs {args.opp}, 辩题: {args.topic}")
+    summary = _run_in_subprocess("record", archive, 0)
+    _save_match_params(archive, {**params, "expected": _comparable(summary)})
+    print(f"✓ 已录制 {summary['recorder']['recorded']} 次模型和工具调用 "
+          f"({summary['recorder']['bytes'] / 1024:.1f}KB), 耗时 {summary['elapsed']:.1f}s")
+    print(f"  胜者: {summary['winner']}, 比分: {summary['scores']}, ELO: {summary['elo']}")
+    if summary["errors"]:
+        print(f"  ⚠️ 比赛中出现错误: {summary['errors']}")
+
+
+def replay(args):
+    archive = os.path.abspath(args.archive)
+    expected = _load_match_params(archive).get("expected")
+    samples = []
+    mismatched = 0
+    for i in range(args.runs):
+        summary = _run_in_subprocess("replay", archive, args.speed)
+        samples.append(summary["elapsed"])
+        same = expected is None or _comparable(summary) == expected
+        mismatched += not same
+        print(f"第 {i + 1} 次: {summary['elapsed'] * 1000:.0f}ms, 回放 {summary['recorder']['replayed']} 次, "
+              f"未命中 {summary['recorder']['misses']} 次, 结果{'一致' if same else '不一致'}")
+        if not same:
+            print(f"  期望: {expected}\n  实际: {_comparable(summary)}")
+    print(f"\n回放 {args.runs} 次，耗时中位数 {statistics.median(samples) * 1000:.0f}ms（速度 {args.speed or '不等待'}）")
+    if mismatched:
+        print(f"✗ {mismatched} 次结果与录制不一致")
+        sys.exit(1)
+    print("✓ 回放结果与录制一致")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="比赛录制与离线回放")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("record", help="调用模型服务运行并录制一场比赛")
+    p.add_argument("--archive", required=True, help="存档路径")
+    p.add_argument("--topic", required=True)
+    p.add_argument("--prop", required=True, help="正方模型")
+    p.add_argument("--opp", required=True, help="反方模型")
+    p.add_argument("--prop-personality", default="rational")
+    p.add_argument("--opp-personality", default="rational")
+    p.add_argument("--difficulty", default="medium")
+    p.add_argument("--rounds", type=int, default=3)
+    p.add_argument("--judges", default="gpt-4o,gpt-4o-mini", help="裁判模型（逗号分隔）")
+    p.add_argument("--tools", default="", help="启用的工具（逗号分隔）")
+
+    p = sub.add_parser("replay", help="从存档回放比赛")
+    p.add_argument("--archive", required=True, help="存档路径")
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--speed", type=float, default=0.0, help="1 按录制节奏，>1 加速，0 不等待")
+
+    p = sub.add_parser("_run", help=argparse.SUPPRESS)
+    p.add_argument("--archive", required=True)
+    p.add_argument("--mode", required=True)
+    p.add_argument("--speed", type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args)
+    elif args.command == "replay":
+        replay(args)
+    else:
+        summary = asyncio.run(_run_match(_load_match_params(args.archive), args.mode, args.archive, args.speed))
+        print(json.dumps(summary, ensure_ascii=False))
@@ -1 +1,22 @@
-uvicorn main:app --port 8000 --host 0.0.0.0 --loop uvloop
\ No newline at end of file
+# 单进程: ./run.sh
+# 多进程: WORKERS=4 ./run.sh 在 PORT..PORT+3 启动 4 个进程，前置 Nginx 等负载均衡；
+# 各进程通过数据库共享比赛注册表，观战 / 重连请求会转发到比赛所在进程
+WORKERS=${WORKERS:-1}
+PORT=${PORT:-8000}
+HOST_URL=${HOST_URL:-http://127.0.0.1}
+
+if [ "$WORKERS" -le 1 ]; then
+    exec uvicorn main:app --port $PORT --host 0.0.0.0 --loop uvloop
+fi
+
+trap 'kill $(jobs -p) 2>/dev/null' INT TERM
+for i in $(seq 0 $((WORKERS - 1))); do
+    WORKER_PORT=$((PORT + i))
+    MATCH_REGISTRY_BACKEND=database WORKER_ADVERTISE_URL=$HOST_URL:$WORKER_PORT \
+        uvicorn main:app --port $WORKER_PORT --host 0.0.0.0 --loop uvloop &
+    if [ "$i" -eq 0 ]; then
+        # 第一个进程完成建表和默认数据初始化后再启动其余进程
+        until curl -sf http://127.0.0.1:$WORKER_PORT/health > /dev/null; do sleep 0.5; done
+    fi
+done
+wait
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+SSE 事件序列化
+
+- 使用 orjson 直接编码为 bytes（未安装时回退到标准库 json）
+- 每帧带 id / event 字段，便于客户端断线后按 Last-Event-ID 续传
+- 事件中顶层的 Pydantic 模型由 model_dump_json 一次编码后直接拼接进帧，
+  不再经过 model_dump -> dict -> json.dumps 的二次转换
+"""
+
+import json
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    """orjson / json 无法直接编码的类型"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(obj: Any) -> bytes:
+        """编码为 UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:  # pragma: no cover
+    def dumps(obj: Any) -> bytes:
+        """编码为 UTF-8 JSON bytes"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class RawJSON:
+    """已编码的 JSON 片段，序列化事件时原样拼接"""
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+
+def encode_event(event: dict) -> bytes:
+    """
+    将事件编码为 JSON bytes
+
+    顶层值为 Pydantic 模型或 RawJSON 时单独编码后拼接，其余字段由 dumps 统一编码
+    """
+    raw_fields = []
+    plain = {}
+    for key, value in event.items():
+        if isinstance(value, BaseModel):
+            raw_fields.append((key, value.model_dump_json().encode("utf-8")))
+        elif isinstance(value, RawJSON):
+            raw_fields.append((key, value.data))
+        else:
+            plain[key] = value
+    body = dumps(plain)
+    if not raw_fields:
+        return body
+    parts = [body[:-1]]
+    for key, data in raw_fields:
+        parts.append(b"," if len(parts) > 1 or plain else b"")
+        parts.append(dumps(key) + b":" + data)
+    parts.append(b"}")
+    return b"".join(parts)
+
+
+class SSEEncoder:
+    """单个 SSE 流的帧编码器（维护递增的事件 ID）"""
+
+    def __init__(self, start_id: int = 0):
+        self.last_id = start_id
+
+    def encode(self, event: dict, event_type: Optional[str] = None) -> bytes:
+        """编码为一帧: id / event / data"""
+        self.last_id += 1
+        event_type = event_type or event.get("type") or "message"
+        return b"".join((
+            b"id: ", str(self.last_id).encode(), b"\nevent: ", event_type.encode("utf-8"),
+            b"\ndata: ", encode_event(event), b"\n\n",
+        ))
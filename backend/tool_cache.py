@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+工具结果缓存 - 跨比赛共享
+
+两级缓存：进程内 LRU + 本地 SQLite 持久化存储
+缓存键为 sha256(工具名 + 规范化参数)，按工具配置 TTL
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .config import TOOL_CACHE_CONFIG
+from .log import logger
+
+# 搜索工具的失败结果不缓存
+_SEARCH_FAILURE_MARKERS = ("SERPER_API_KEY is not set", "Google search Timeout")
+
+
+def canonicalize_arguments(tool_name: str, arguments: Any) -> str:
+    """
+    规范化工具参数，保证语义相同的调用得到相同的缓存键
+
+    - 字典按键排序
+    - 字符串去除首尾空白，搜索查询合并连续空白
+    """
+    def normalize(value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [normalize(v) for v in value]
+        if isinstance(value, str):
+            value = value.strip()
+            if tool_name == "web_search":
+                value = " ".join(value.split())
+            return value
+        return value
+
+    return json.dumps(normalize(arguments), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+
+def make_cache_key(tool_name: str, arguments: Any) -> str:
+    """内容寻址的缓存键"""
+    payload = f"{tool_name}\n{canonicalize_arguments(tool_name, arguments)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(tool_name: str, result: Any) -> bool:
+    """判断工具结果是否可以缓存（错误结果不缓存）"""
+    if not isinstance(result, dict):
+        return False
+    if result.get("error") or result.get("success") is False:
+        return False
+    if tool_name == "web_search":
+        response = str(result.get("response", ""))
+        if any(marker in response for marker in _SEARCH_FAILURE_MARKERS):
+            return False
+    return True
+
+
+class ToolResultCache:
+    """
+    工具结果缓存
+
+    - 内存层: OrderedDict 实现的 LRU，存储序列化后的 JSON
+    - 磁盘层: SQLite 表 tool_cache，超过容量时按写入时间淘汰
+    - 每个工具独立 TTL，TTL <= 0 表示该工具不缓存
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        ttl: Dict[str, float],
+        memory_max_entries: int = 1024,
+        disk_max_entries: int = 50000,
+        max_value_bytes: int = 256 * 1024
+    ):
+        self.ttl = ttl
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_entries = disk_max_entries
+        self.max_value_bytes = max_value_bytes
+
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._per_tool: Dict[str, Dict[str, int]] = {}
+        self._writes_since_prune = 0
+
+        self._conn: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tool_cache ("
+                " key TEXT PRIMARY KEY,"
+                " tool_name TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tool_cache_created ON tool_cache (created_at)")
+            self._conn.commit()
+
+    def ttl_for(self, tool_name: str) -> float:
+        return float(self.ttl.get(tool_name, 0))
+
+    # ---------- 统计 ----------
+
+    def _record(self, tool_name: str, field: str):
+        self._stats[field] += 1
+        per_tool = self._per_tool.setdefault(tool_name, {"hits": 0, "misses": 0})
+        if field in ("memory_hits", "disk_hits"):
+            per_tool["hits"] += 1
+        elif field == "misses":
+            per_tool["misses"] += 1
+
+    def get_stats(self) -> dict:
+        """命中率等统计指标"""
+        with self._lock:
+            hits = self._stats["memory_hits"] + self._stats["disk_hits"]
+            lookups = hits + self._stats["misses"]
+            per_tool = {
+                name: {
+                    **counts,
+                    "hit_rate": round(counts["hits"] / (counts["hits"] + counts["misses"]), 4)
+                    if counts["hits"] + counts["misses"] else 0.0
+                }
+                for name, counts in self._per_tool.items()
+            }
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "per_tool": per_tool,
+            }
+
+    # ---------- 同步实现（在线程中执行磁盘 IO） ----------
+
+    def _get_sync(self, tool_name: str, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._record(tool_name, "memory_hits")
+                    return value
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM tool_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at > now:
+                        self._put_memory(key, expires_at, value)
+                        self._record(tool_name, "disk_hits")
+                        return value
+                    self._conn.execute("DELETE FROM tool_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+
+            self._record(tool_name, "misses")
+            return None
+
+    def _set_sync(self, tool_name: str, key: str, value: str, ttl: float):
+        now = time.time()
+        expires_at = now + ttl
+        with self._lock:
+            self._put_memory(key, expires_at, value)
+            self._stats["stores"] += 1
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tool_cache (key, tool_name, value, created_at, expires_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (key, tool_name, value, now, expires_at)
+                )
+                self._writes_since_prune += 1
+                if self._writes_since_prune >= 100:
+                    self._prune_disk(now)
+                self._conn.commit()
+
+    def _put_memory(self, key: str, expires_at: float, value: str):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _prune_disk(self, now: float):
+        """删除过期条目，并在超过容量时淘汰最旧的条目"""
+        self._writes_since_prune = 0
+        self._conn.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (now,))
+        count = self._conn.execute("SELECT COUNT(*) FROM tool_cache").fetchone()[0]
+        overflow = count - self.disk_max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM tool_cache WHERE key IN ("
+                " SELECT key FROM tool_cache ORDER BY created_at LIMIT ?)",
+                (overflow,)
+            )
+            self._stats["evictions"] += overflow
+
+    # ---------- 异步接口 ----------
+
+    async def get(self, tool_name: str, arguments: Any) -> Optional[Any]:
+        """查询缓存，未命中返回 None（每次返回独立的副本）"""
+        if self.ttl_for(tool_name) <= 0:
+            return None
+        key = make_cache_key(tool_name, arguments)
+        value = await asyncio.to_thread(self._get_sync, tool_name, key)
+        if value is None:
+            return None
+        logger.debug(f"工具缓存命中: {tool_name} ({key[:12]})")
+        return json.loads(value)
+
+    async def set(self, tool_name: str, arguments: Any, result: Any):
+        """写入缓存（错误结果、超大结果不缓存）"""
+        ttl = self.ttl_for(tool_name)
+        if ttl <= 0 or not is_cacheable(tool_name, result):
+            return
+        try:
+            value = json.dumps(result, ensure_ascii=False, default=str)
+        except (TypeError, ValueError):
+            return
+        if len(value.encode("utf-8")) > self.max_value_bytes:
+            return
+        key = make_cache_key(tool_name, arguments)
+        await asyncio.to_thread(self._set_sync, tool_name, key, value, ttl)
+
+
+_tool_cache: Optional[ToolResultCache] = None
+
+
+def get_tool_cache() -> Optional[ToolResultCache]:
+    """获取全局工具缓存（首次调用时创建），未启用时返回 None"""
+    global _tool_cache
+    if not TOOL_CACHE_CONFIG["enabled"]:
+        return None
+    if _tool_cache is None:
+        _tool_cache = ToolResultCache(
+            path=TOOL_CACHE_CONFIG["path"],
+            ttl=TOOL_CACHE_CONFIG["ttl"],
+            memory_max_entries=TOOL_CACHE_CONFIG["memory_max_entries"],
+            disk_max_entries=TOOL_CACHE_CONFIG["disk_max_entries"],
+            max_value_bytes=TOOL_CACHE_CONFIG["max_value_bytes"],
+        )
+        logger.info(f"工具结果缓存已启用: {TOOL_CACHE_CONFIG['path'] or '仅内存'}")
+    return _tool_cache
@@ -9,91 +9,214 @@ import asyncio
 import http.client
 import json
 import os
-import math
-from typing import Any, List, Union
+import sys
+from typing import Any, AsyncGenerator, List, Optional, Tuple, Union
 from datetime import datetime
 from loguru import logger
-from .config import SERPER_API_KEY
+from .config import DEBATE_CONFIG, SERPER_API_KEY
+from .tool_cache import get_tool_cache
+from .llm_recorder import get_llm_recorder, make_request_key
+from .calculator import compile_expression
+
+# 大数运算的计算超时（秒）
+CALCULATOR_TIMEOUT = 5
+
+# 项目根目录（子进程中导入 backend.calculator）
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def execute_tools_concurrently(
+    tool_calls: List[dict],
+    max_concurrency: int = 3,
+    timeout: float = 60.0
+) -> AsyncGenerator[Tuple[dict, Any, Optional[Exception]], None]:
+    """
+    并发执行同一轮发言中的多个工具调用
+
+    - 最多 max_concurrency 个工具同时执行
+    - 每个工具独立超时
+    - 按 tool_calls 的原始顺序产出结果，方便调用方按序推送事件
+
+    Yields:
+        (tool_call, result, error): 成功时 error 为 None，失败/超时时 result 为 None
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run_one(tc: dict) -> Any:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(execute_tool(tc), timeout=timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"工具执行超时 (超过 {timeout:g} 秒)")
+
+    tasks = [asyncio.create_task(run_one(tc)) for tc in tool_calls]
+    try:
+        for tc, task in zip(tool_calls, tasks):
+            try:
+                yield tc, await task, None
+            except Exception as e:
+                yield tc, None, e
+    finally:
+        # 调用方提前退出时，取消尚未完成的工具
+        for task in tasks:
+            if not task.done():
+                task.cancel()
 
 
 async def execute_tool(tool_call: dict) -> Any:
     """
     执行工具调用
+    
+    开启录制 / 回放时，工具结果与模型调用写入同一存档（llm_recorder），回放模式下不执行工具
     """
     tool_name = tool_call['function']['name']
     arguments = json.loads(tool_call['function']['arguments']) if isinstance(tool_call['function']['arguments'], str) else tool_call['function']['arguments']
     
     logger.debug(f"执行工具: {tool_name}, 参数: {arguments}")
     
+    recorder = get_llm_recorder()
+    if recorder is None:
+        return await _execute_tool_live(tool_name, arguments)
+    
+    request = {"tool": tool_name, "arguments": arguments}
+    key = make_request_key(request)
+    seq = recorder.next_seq(key)
+    
+    if recorder.mode == "replay":
+        events = await recorder.load(key, seq)
+        results = [(offset, event["result"]) for offset, event in events or [] if event.get("type") == "tool_result"]
+        if not results:
+            error_msg = f"回放存档中没有该工具调用 ({key[:12]})"
+            logger.warning(f"{error_msg} [{tool_name}]")
+            return {"error": error_msg}
+        offset, result = results[-1]
+        if recorder.speed > 0 and offset > 0:
+            await asyncio.sleep(offset / recorder.speed)
+        return result
+    
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    result = await _execute_tool_live(tool_name, arguments)
+    elapsed = loop.time() - started
+    await recorder.save(key, seq, f"tool:{tool_name}", request, [(elapsed, {"type": "tool_result", "result": result})], elapsed)
+    return result
+
+
+async def _execute_tool_live(tool_name: str, arguments: dict) -> Any:
+    # 跨比赛共享的结果缓存
+    cache = get_tool_cache()
+    if cache is not None:
+        cached = await cache.get(tool_name, arguments)
+        if cached is not None:
+            return cached
+    
     if tool_name == "python_interpreter":
-        r = await execute_python(arguments['code'])
+        r = await execute_python(arguments['code'], timeout=DEBATE_CONFIG['tool_timeout'])
     elif tool_name == "web_search":
         r = await execute_search(arguments['query'])
     elif tool_name == "calculator":
         r = await execute_calculator(arguments['expression'])
     else:
         r = {"error": f"Unknown tool: {tool_name}"}
+    
+    if cache is not None:
+        await cache.set(tool_name, arguments, r)
     # logger.debug(f"工具执行结果: {r}")
     return r
 
 
-async def execute_python(code: str, timeout: int = 30) -> dict:
+async def execute_python(code: str, timeout: float = DEBATE_CONFIG['tool_timeout']) -> dict:
     """
     执行 Python 代码 (沙盒)
+
+    在子进程中执行并捕获该进程的标准输出，超时或调用方取消时结束子进程，
+    死循环等代码不会占用服务进程的线程，也不会混入其他比赛的输出
     """
-    import io
-    import sys
     import time
-    import traceback
-    
-    old_stdout = sys.stdout
-    new_stdout = io.StringIO()
-    sys.stdout = new_stdout
-    
-    start_time = time.time()
+
     result = {
         'stdout': '',
         'stderr': '',
         'time': 0,
         'success': False
     }
-    
+    start_time = time.time()
     try:
-        # 受限命名空间
-        safe_namespace = {
-            '__builtins__': __builtins__,
-            'print': print,
-            'range': range,
-            'len': len,
-            'str': str,
-            'int': int,
-            'float': float,
-            'list': list,
-            'dict': dict,
-            'set': set,
-            'tuple': tuple,
-            'time': __import__('time'),
-            'math': __import__('math'),
-        }
-        
-        compiled_code = compile(code, '<string>', 'exec')
-        exec(compiled_code, safe_namespace)
-        
-        result['stdout'] = new_stdout.getvalue().strip()
-        result['success'] = True
-        
-    except Exception as e:
-        result['stderr'] = f"Error: {str(e)}\n{traceback.format_exc()}"
-        result['success'] = False
-    
+        returncode, stdout, stderr = await _run_subprocess(
+            [sys.executable, "-I", "-c", _PYTHON_RUNNER], code.encode("utf-8"), timeout
+        )
+        result['stdout'] = stdout.decode("utf-8", errors="replace").strip()
+        result['stderr'] = stderr.decode("utf-8", errors="replace")
+        result['success'] = returncode == 0
+    except asyncio.TimeoutError:
+        result['stderr'] = f"Error: 执行超时 (超过 {timeout:g} 秒)"
     finally:
-        sys.stdout = old_stdout
-        new_stdout.close()
         result['time'] = time.time() - start_time
     logger.debug(f"execute_python result: {result}, code: {code}")
     return result
 
 
+async def _run_subprocess(args: List[str], stdin: bytes, timeout: float) -> Tuple[int, bytes, bytes]:
+    """
+    运行子进程并读取输出，返回 (returncode, stdout, stderr)
+
+    超时（抛出 asyncio.TimeoutError）或调用方取消时结束子进程
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(stdin), timeout=timeout)
+        return proc.returncode, stdout, stderr
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+
+# 子进程中执行的代码：从标准输入读取代码，在受限命名空间中执行，异常写入标准错误
+_PYTHON_RUNNER = """
+import sys, traceback
+code = sys.stdin.read()
+safe_namespace = {
+    '__builtins__': __builtins__,
+    'print': print,
+    'range': range,
+    'len': len,
+    'str': str,
+    'int': int,
+    'float': float,
+    'list': list,
+    'dict': dict,
+    'set': set,
+    'tuple': tuple,
+    'time': __import__('time'),
+    'math': __import__('math'),
+}
+try:
+    exec(compile(code, '<string>', 'exec'), safe_namespace)
+except BaseException as e:
+    sys.stdout.flush()
+    sys.stderr.write(f"Error: {str(e)}\\n{traceback.format_exc()}")
+    sys.exit(1)
+"""
+
+
+# 子进程中计算大数表达式：从标准输入读取表达式，结果（或错误）以 JSON 写入标准输出
+_CALCULATOR_RUNNER = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+from backend.calculator import evaluate_expression
+try:
+    print(json.dumps({"result": evaluate_expression(sys.stdin.read())}))
+except Exception as e:
+    print(json.dumps({"error": str(e)}))
+"""
+
+
 async def execute_search(query: Union[str, List[str]]) -> dict:
     """
     执行网络搜索 (使用 Serper API)
@@ -175,15 +298,15 @@ async def execute_search(query: Union[str, List[str]]) -> dict:
         except:
             return f"No results found for '{q}'. Try with a more general query."
     
-    # 处理单个或多个查询
+    # 处理单个或多个查询（阻塞的 HTTP 请求放到线程中执行）
     if isinstance(query, str):
-        response = google_search_with_serp(query)
+        response = await asyncio.to_thread(google_search_with_serp, query)
     else:
-        # 批量查询（最多5个）
+        # 批量查询（最多5个），并发执行
         queries = query[:5]  # 限制最多5个
-        responses = []
-        for q in queries:
-            responses.append(google_search_with_serp(q))
+        responses = await asyncio.gather(
+            *[asyncio.to_thread(google_search_with_serp, q) for q in queries]
+        )
         response = "\n=======\n".join(responses)
     logger.debug(f"execute_search response: {response}, query: {query}")
     return {
@@ -197,7 +320,8 @@ async def execute_calculator(expression: str) -> dict:
     """
     执行精确数学计算
     
-    避免 LLM 的数学幻觉问题
+    避免 LLM 的数学幻觉问题。表达式经 AST 白名单编译（带缓存），
+    包含大数运算的表达式放到线程中执行，避免阻塞其他比赛
     """
     
     result = {
@@ -207,29 +331,22 @@ async def execute_calculator(expression: str) -> dict:
     }
     
     try:
-        # 安全的数学命名空间
-        safe_math_namespace = {
-            'abs': abs,
-            'round': round,
-            'min': min,
-            'max': max,
-            'sum': sum,
-            'pow': pow,
-            'sqrt': math.sqrt,
-            'sin': math.sin,
-            'cos': math.cos,
-            'tan': math.tan,
-            'log': math.log,
-            'log10': math.log10,
-            'exp': math.exp,
-            'pi': math.pi,
-            'e': math.e,
-            '__builtins__': {}  # 禁用内置函数
-        }
-        
-        # 计算表达式
-        result['result'] = eval(expression, safe_math_namespace)
+        compiled = compile_expression(expression)
+        if compiled.heavy:
+            # 大数运算持有 GIL，线程无法中止，放到子进程中执行，超时结束子进程
+            returncode, stdout, stderr = await _run_subprocess(
+                [sys.executable, "-I", "-c", _CALCULATOR_RUNNER, _PROJECT_ROOT],
+                expression.encode("utf-8"), CALCULATOR_TIMEOUT
+            )
+            output = json.loads(stdout) if returncode == 0 else {"error": stderr.decode("utf-8", errors="replace")}
+            if "error" in output:
+                raise ValueError(output["error"])
+            result['result'] = output["result"]
+        else:
+            result['result'] = compiled.evaluate()
         
+    except asyncio.TimeoutError:
+        result['error'] = f"计算错误: 计算超时 (超过 {CALCULATOR_TIMEOUT} 秒)"
     except Exception as e:
         result['error'] = f"计算错误: {str(e)}"
     logger.debug(f"execute_calculator result: {result}, expression: {expression}")
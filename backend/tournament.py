@@ -4,22 +4,30 @@
 @description: Tournament Manager - 辩论赛事编排
 """
 
-from typing import AsyncGenerator, List, Optional
+from typing import AsyncGenerator, Dict, List, Optional, Tuple
 from datetime import datetime
+import asyncio
 import json
 
 from .log import logger
 from .models import MatchSession, Turn, PersonalityType, DifficultyLevel
-from .llm_client import query_model_stream
-from .tools import get_debate_tools, execute_tool
-from .judge import judge_match_with_panel_stream
+from .llm_client import query_model, query_model_stream
+from .provider_router import ModelUnavailableError, get_provider_router
+from .tools import get_debate_tools, execute_tools_concurrently
+from .judge import judge_match_with_panel, judge_match_with_panel_stream
 from .elo import update_elo_ratings
-from .database import save_match, update_match_status
+from .persistence import get_write_buffer
+from .matchmaker import record_match_outcome
 from .utils import generate_id
+from .config import DEBATE_CONFIG
+from .sse import RawJSON
 
 # 比赛超时时间（秒）：15分钟
 MATCH_TIMEOUT_SECONDS = 15 * 60
 
+# 工具迭代达到上限后的最后一次调用
+_FINAL_STEP_PROMPT = "工具调用次数已达上限，请基于已有信息直接完成本轮发言，不要再调用工具。"
+
 
 async def run_tournament_match(
     topic: str,
@@ -33,11 +41,16 @@ async def run_tournament_match(
     enabled_tools: List[str] = None,
     same_model_battle: bool = False,
     user_id: Optional[int] = None,
-    timeout_seconds: int = MATCH_TIMEOUT_SECONDS
+    timeout_seconds: int = MATCH_TIMEOUT_SECONDS,
+    match_id: Optional[str] = None,
+    parallel_openings: Optional[bool] = None
 ) -> AsyncGenerator[dict, None]:
     """
     运行竞技赛，使用 WebSocket 流式推送
     
+    match_id: 预先分配的比赛 ID（调用方需在比赛开始前登记时使用），默认自动生成
+    parallel_openings: 第 1 轮双方同时开篇立论（两路发言事件交错推送），None 使用 DEBATE_CONFIG 配置（只有 1 轮时不生效）
+    
     Yields:
         dict: 事件流
     """
@@ -47,27 +60,32 @@ async def run_tournament_match(
         judges = ["gpt-4o", "gpt-4o-mini"]
     if enabled_tools is None:
         enabled_tools = []  # 默认为空，不启用任何工具
+    parallel_openings = _resolve_parallel_openings(parallel_openings, rounds)
     
-    # 处理性格：空字符串或None转换为默认rational
-    
-    prop_personality_enum = PersonalityType.RATIONAL
-    opp_personality_enum = PersonalityType.RATIONAL
+    # 辩手模型熔断中时不开始比赛，熔断的裁判替换为可用裁判（队列模式下由 worker 进程按自己的熔断状态检查）
+    try:
+        judges = get_provider_router().plan_match_models(prop_model_id, opp_model_id, judges)
+    except ModelUnavailableError as e:
+        logger.warning(f"比赛未开始: {e}")
+        yield {"type": "error", "content": str(e)}
+        return
     
-    if prop_personality and prop_personality in [e.value for e in PersonalityType]:
-        prop_personality_enum = PersonalityType(prop_personality)
-    if opp_personality and opp_personality in [e.value for e in PersonalityType]:
-        opp_personality_enum = PersonalityType(opp_personality)
+    prop_personality_enum = resolve_personality(prop_personality)
+    opp_personality_enum = resolve_personality(opp_personality)
     
     logger.info(f"开始新比赛: {topic}")
     logger.info(f"正方: {prop_model_id} ({prop_personality_enum}) | 反方: {opp_model_id} ({opp_personality_enum})")
     logger.info(f"轮次: {rounds} | 难度: {topic_difficulty} | 裁判: {judges} | 工具: {enabled_tools} | 超时: {timeout_seconds}秒")
     
-    # 记录比赛开始时间
-    match_start_time = datetime.utcnow()
+    # 比赛截止时间（event loop 时间）：辩论阶段为裁判评分预留时间，
+    # 截止时间传入发言、工具执行和裁判评分的流式调用，单个卡住的请求不会拖过比赛时限
+    loop = asyncio.get_running_loop()
+    match_deadline = loop.time() + timeout_seconds
+    debate_deadline = match_deadline - min(DEBATE_CONFIG['judge_time_budget'], timeout_seconds / 2)
     
     # 创建比赛会话
     match = MatchSession(
-        match_id=generate_id(),
+        match_id=match_id or generate_id(),
         topic=topic,
         topic_difficulty=topic_difficulty,
         proponent_model_id=prop_model_id,
@@ -79,39 +97,97 @@ async def run_tournament_match(
         user_id=user_id  # 传递用户ID
     )
     
-    # 立即 yield 初始事件，让前端获取 match_id（触发生成器执行）
-    yield {"type": "match_init", "match_id": match.match_id}
-    
-    await save_match(match)
-    logger.info(f"比赛会话已创建: {match.match_id}")
-    
-    yield {"type": "match_start", "data": match.model_dump(mode='json')}
-    
-    # 超时检查函数
-    def check_timeout() -> bool:
-        elapsed = (datetime.utcnow() - match_start_time).total_seconds()
-        return elapsed > timeout_seconds
-    
-    # 辩论上下文
-    context = []
-    is_timeout = False
-    
-    # === 正式辩论 ===
-    for r in range(1, rounds + 1):
-        # 检查超时
-        if check_timeout():
-            logger.warning(f"比赛超时 (已超过 {timeout_seconds} 秒)，终止辩论")
-            is_timeout = True
-            yield {"type": "timeout", "content": f"比赛超时（超过{timeout_seconds // 60}分钟），已显示当前已输出的辩论内容"}
-            break
+    try:
+        # 立即 yield 初始事件，让前端获取 match_id（触发生成器执行）
+        yield {"type": "match_init", "match_id": match.match_id}
+    
+        # 比赛状态由写缓冲异步落库，流式推送不等待数据库
+        write_buffer = get_write_buffer()
+        write_buffer.record(match)
+        logger.info(f"比赛会话已创建: {match.match_id}")
+    
+        # 比赛信息只编码一次，SSE 层原样拼接
+        yield {"type": "match_start", "data": RawJSON(match.model_dump_json().encode("utf-8"))}
+    
+        # 超时检查函数
+        def check_timeout() -> bool:
+            return loop.time() >= debate_deadline
+    
+        # 辩论上下文
+        context = []
+        is_timeout = False
+    
+        # === 正式辩论 ===
+        for r in range(1, rounds + 1):
+            # 检查超时
+            if check_timeout():
+                logger.warning(f"比赛超时 (已超过 {timeout_seconds} 秒)，终止辩论")
+                is_timeout = True
+                yield {"type": "timeout", "content": f"比赛超时（超过{timeout_seconds // 60}分钟），已显示当前已输出的辩论内容"}
+                break
         
-        logger.info(f"开始 Round {r}")
+            logger.info(f"开始 Round {r}")
         
-        # === 正方发言 (流式) ===
-        yield {"type": "status", "speaker": "proponent", "content": f"Round {r}: 正方正在思考..."}
+            # === 双方同时开篇立论 (流式，两路事件交错推送) ===
+            if r == 1 and parallel_openings:
+                yield {"type": "status", "speaker": "proponent", "content": "Round 1: 正方正在立论..."}
+                yield {"type": "status", "speaker": "opponent", "content": "Round 1: 反方正在立论..."}
+                
+                prop_done = False
+                held_turn = None  # 反方先完成时暂存，保证发言记录正方在前
+                openings = _merge_turn_streams({
+                    role: execute_turn_stream(
+                        role=role,
+                        model_id=model_id,
+                        personality=personality,
+                        topic=topic,
+                        topic_difficulty=topic_difficulty,
+                        round_num=1,
+                        context=[],
+                        is_opening=True,
+                        enabled_tools=enabled_tools,
+                        match_id=match.match_id,
+                        deadline=debate_deadline
+                    )
+                    for role, model_id, personality in (
+                        ("proponent", prop_model_id, prop_personality_enum),
+                        ("opponent", opp_model_id, opp_personality_enum),
+                    )
+                })
+                try:
+                    async for role, event in openings:
+                        if event["type"] == "turn_complete":
+                            turn = event["turn"]
+                            logger.info(f"{role} Round 1 立论完成，内容长度: {len(turn.content)}")
+                            if role == "opponent" and not prop_done:
+                                held_turn = turn
+                                continue
+                            prop_done = prop_done or role == "proponent"
+                            match.history.append(turn)
+                            context.append(turn)
+                            write_buffer.record(match)
+                        yield event
+                finally:
+                    await openings.aclose()
+                # 反方先完成（或正方发言失败）时，两路都结束后再推送反方立论
+                if held_turn is not None:
+                    match.history.append(held_turn)
+                    context.append(held_turn)
+                    write_buffer.record(match)
+                    yield {"type": "turn_complete", "turn": held_turn}
+                
+                # 开篇立论后检查超时
+                if check_timeout():
+                    logger.warning(f"比赛超时 (已超过 {timeout_seconds} 秒)，终止辩论")
+                    is_timeout = True
+                    yield {"type": "timeout", "content": f"比赛超时（超过{timeout_seconds // 60}分钟），已显示当前已输出的辩论内容"}
+                    break
+                continue
         
-        try:
-            async for event in execute_turn_stream(
+            # === 正方发言 (流式) ===
+            yield {"type": "status", "speaker": "proponent", "content": f"Round {r}: 正方正在思考..."}
+        
+            prop_stream = execute_turn_stream(
                 role="proponent",
                 model_id=prop_model_id,
                 personality=prop_personality_enum,
@@ -121,35 +197,39 @@ async def run_tournament_match(
                 context=context,
                 is_opening=(r==1),
                 enabled_tools=enabled_tools,  # 传递工具列表
-                match_id=match.match_id  # 传递match_id
-            ):
-                if event["type"] == "turn_complete":
-                    # turn_complete 事件中的 turn 是 dict，需要转换回 Turn 对象
-                    turn_dict = event["turn"]
-                    prop_turn = Turn(**turn_dict)
-                    match.history.append(prop_turn)
-                    context.append(prop_turn)
-                    logger.info(f"正方 Round {r} 完成，内容长度: {len(prop_turn.content)}")
-                    yield event
-                else:
-                    # 流式推送内容增量
-                    yield event
-        except Exception as e:
-            logger.error(f"正方发言失败: {e}", exc_info=True)
-            yield {"type": "error", "content": f"正方发言出错: {str(e)}"}
+                match_id=match.match_id,  # 传递match_id
+                deadline=debate_deadline
+            )
+            try:
+                async for event in prop_stream:
+                    if event["type"] == "turn_complete":
+                        # turn_complete 事件直接携带 Turn 对象，只在 SSE 层序列化一次
+                        prop_turn = event["turn"]
+                        match.history.append(prop_turn)
+                        context.append(prop_turn)
+                        write_buffer.record(match)
+                        logger.info(f"正方 Round {r} 完成，内容长度: {len(prop_turn.content)}")
+                        yield event
+                    else:
+                        # 流式推送内容增量
+                        yield event
+            except Exception as e:
+                logger.error(f"正方发言失败: {e}", exc_info=True)
+                yield {"type": "error", "content": f"正方发言出错: {str(e)}"}
+            finally:
+                await prop_stream.aclose()
         
-        # 正方发言后检查超时
-        if check_timeout():
-            logger.warning(f"比赛超时 (已超过 {timeout_seconds} 秒)，终止辩论")
-            is_timeout = True
-            yield {"type": "timeout", "content": f"比赛超时（超过{timeout_seconds // 60}分钟），已显示当前已输出的辩论内容"}
-            break
+            # 正方发言后检查超时
+            if check_timeout():
+                logger.warning(f"比赛超时 (已超过 {timeout_seconds} 秒)，终止辩论")
+                is_timeout = True
+                yield {"type": "timeout", "content": f"比赛超时（超过{timeout_seconds // 60}分钟），已显示当前已输出的辩论内容"}
+                break
         
-        # === 反方发言 (流式) ===
-        yield {"type": "status", "speaker": "opponent", "content": f"Round {r}: 反方正在反驳..."}
+            # === 反方发言 (流式) ===
+            yield {"type": "status", "speaker": "opponent", "content": f"Round {r}: 反方正在反驳..."}
         
-        try:
-            async for event in execute_turn_stream(
+            opp_stream = execute_turn_stream(
                 role="opponent",
                 model_id=opp_model_id,
                 personality=opp_personality_enum,
@@ -159,89 +239,229 @@ async def run_tournament_match(
                 context=context,
                 is_opening=False,
                 enabled_tools=enabled_tools,  # 传递工具列表
-                match_id=match.match_id  # 传递match_id
-            ):
-                if event["type"] == "turn_complete":
-                    # turn_complete 事件中的 turn 是 dict，需要转换回 Turn 对象
-                    turn_dict = event["turn"]
-                    opp_turn = Turn(**turn_dict)
-                    match.history.append(opp_turn)
-                    context.append(opp_turn)
-                    logger.info(f"反方 Round {r} 完成，内容长度: {len(opp_turn.content)}")
-                    yield event
-                else:
-                    yield event
-        except Exception as e:
-            logger.error(f"反方发言失败: {e}", exc_info=True)
-            yield {"type": "error", "content": f"反方发言出错: {str(e)}"}
-    
-    # === 裁判判决（仅在未超时时执行）===
-    elo_changes = None
-    if is_timeout:
-        logger.info("比赛超时，跳过裁判判决和ELO更新")
-        match.status = "TIMEOUT"
-        await save_match(match)
-        await update_match_status(match.match_id, "TIMEOUT")
-        yield {"type": "match_end", "match_id": match.match_id, "timeout": True}
-        return
+                match_id=match.match_id,  # 传递match_id
+                deadline=debate_deadline
+            )
+            try:
+                async for event in opp_stream:
+                    if event["type"] == "turn_complete":
+                        opp_turn = event["turn"]
+                        match.history.append(opp_turn)
+                        context.append(opp_turn)
+                        write_buffer.record(match)
+                        logger.info(f"反方 Round {r} 完成，内容长度: {len(opp_turn.content)}")
+                        yield event
+                    else:
+                        yield event
+            except Exception as e:
+                logger.error(f"反方发言失败: {e}", exc_info=True)
+                yield {"type": "error", "content": f"反方发言出错: {str(e)}"}
+            finally:
+                await opp_stream.aclose()
+    
+        # === 裁判判决（仅在未超时时执行）===
+        elo_changes = None
+        if is_timeout:
+            logger.info("比赛超时，跳过裁判判决和ELO更新")
+            match.status = "TIMEOUT"
+            await record_match_outcome(match)
+            write_buffer.record(match, flush=True)
+            yield {"type": "match_end", "match_id": match.match_id, "timeout": True}
+            return
     
-    # 正常流程：裁判判决
-    logger.info("开始裁判判决")
-    match.status = "JUDGING"
-    await update_match_status(match.match_id, "JUDGING")
+        # 正常流程：裁判判决
+        logger.info("开始裁判判决")
+        match.status = "JUDGING"
+        write_buffer.record(match)
     
-    yield {"type": "status", "content": "裁判团正在打分..."}
+        yield {"type": "status", "content": "裁判团正在打分..."}
     
-    try:
-        async for event in judge_match_with_panel_stream(match, judges):
-            if event["type"] == "judge_complete":
-                # result 是 dict，需要转换回 MatchResult 对象
-                result_dict = event["result"]
-                from .models import MatchResult
-                match.result = MatchResult(**result_dict)
-                logger.info(f"裁判判决完成，胜者: {match.result.winner}")
-            yield event
-    except Exception as e:
-        logger.error(f"裁判打分失败: {e}", exc_info=True)
-        yield {"type": "error", "content": f"裁判打分出错: {str(e)}"}
-    
-    # === 更新 ELO ===
-    if not same_model_battle:
-        logger.info("准备更新 ELO 排名")
+        judge_stream = judge_match_with_panel_stream(match, judges, deadline=match_deadline)
         try:
-            # 确保 result 存在才更新 ELO
-            if match.result is not None:
-                elo_changes = await update_elo_ratings(match)
+            async for event in judge_stream:
+                if event["type"] == "judge_complete":
+                    match.result = event["result"]
+                    logger.info(f"裁判判决完成，胜者: {match.result.winner}")
+                yield event
+        except Exception as e:
+            logger.error(f"裁判打分失败: {e}", exc_info=True)
+            yield {"type": "error", "content": f"裁判打分出错: {str(e)}"}
+        finally:
+            await judge_stream.aclose()
+    
+        # === 更新 ELO ===
+        if not same_model_battle:
+            logger.info("准备更新 ELO 排名")
+            try:
+                # 确保 result 存在才更新 ELO
+                if match.result is not None:
+                    elo_changes = await update_elo_ratings(match)
                 
-                # 检查是否跳过了 ELO 更新
-                if elo_changes.get('proponent', {}).get('skipped'):
-                    skip_reason = elo_changes['proponent'].get('reason', '未知原因')
-                    logger.warning(f"ELO 更新被跳过: {skip_reason}")
-                    yield {"type": "elo_update", "data": {"message": f"跳过ELO更新: {skip_reason}", "skip": True}}
+                    # 检查是否跳过了 ELO 更新
+                    if elo_changes.get('proponent', {}).get('skipped'):
+                        skip_reason = elo_changes['proponent'].get('reason', '未知原因')
+                        logger.warning(f"ELO 更新被跳过: {skip_reason}")
+                        yield {"type": "elo_update", "data": {"message": f"跳过ELO更新: {skip_reason}", "skip": True}}
+                    else:
+                        logger.info(f"ELO 更新完成: 正方 {elo_changes['proponent']['change']:+d}, 反方 {elo_changes['opponent']['change']:+d}")
+                        yield {"type": "elo_update", "data": elo_changes}
                 else:
-                    logger.info(f"ELO 更新完成: 正方 {elo_changes['proponent']['change']:+d}, 反方 {elo_changes['opponent']['change']:+d}")
-                    yield {"type": "elo_update", "data": elo_changes}
-            else:
-                logger.warning("比赛结果为空，跳过 ELO 更新")
-                yield {"type": "elo_update", "data": {"error": "比赛结果为空", "skip": True}}
-        except Exception as e:
-            logger.error(f"ELO 更新失败: {type(e).__name__} - {e}", exc_info=True)
-            yield {"type": "elo_update", "data": {"error": f"ELO更新失败: {str(e)}", "skip": True}}
-    else:
-        logger.info("同模型对战，跳过 ELO 更新")
-        yield {"type": "elo_update", "data": {"message": "同模型对战，不计ELO", "skip": True}}
+                    logger.warning("比赛结果为空，跳过 ELO 更新")
+                    yield {"type": "elo_update", "data": {"error": "比赛结果为空", "skip": True}}
+            except Exception as e:
+                logger.error(f"ELO 更新失败: {type(e).__name__} - {e}", exc_info=True)
+                yield {"type": "elo_update", "data": {"error": f"ELO更新失败: {str(e)}", "skip": True}}
+        else:
+            logger.info("同模型对战，跳过 ELO 更新")
+            yield {"type": "elo_update", "data": {"message": "同模型对战，不计ELO", "skip": True}}
+    
+        # 辩题使用统计和配对器
+        await record_match_outcome(match, elo_changes)
+    
+        # === 保存比赛 ===
+        match.status = "FINISHED"
+        # 状态和 ELO 变化一并写入，比赛结束时立即刷新
+        write_buffer.record(match, elo_changes=elo_changes, flush=True)
+    
+        logger.info(f"比赛结束: {match.match_id}")
+    
+        yield {"type": "match_end", "match_id": match.match_id}
+    except (asyncio.CancelledError, GeneratorExit):
+        # 客户端断开且策略为取消（或调用方提前关闭）：停止比赛并标记为 CANCELLED
+        if match.status not in ("FINISHED", "TIMEOUT"):
+            logger.warning(f"比赛已取消: {match.match_id}")
+            match.status = "CANCELLED"
+            get_write_buffer().record(match, flush=True)
+        raise
+
+
+def _resolve_parallel_openings(parallel_openings: Optional[bool], rounds: int) -> bool:
+    """并行开篇的实际取值（None 使用 DEBATE_CONFIG 配置）；只有 1 轮时双方都只做开篇、没有交锋，改为顺序发言"""
+    if parallel_openings is None:
+        parallel_openings = DEBATE_CONFIG['parallel_openings']
+    if parallel_openings and rounds < 2:
+        logger.warning("只有 1 轮时并行开篇会让反方无法反驳，改为顺序发言")
+        return False
+    return parallel_openings
+
+
+def resolve_personality(personality: Optional[str]) -> PersonalityType:
+    """性格参数转为枚举：空字符串、None 或未知值使用默认的 rational"""
+    if personality and personality in [e.value for e in PersonalityType]:
+        return PersonalityType(personality)
+    return PersonalityType.RATIONAL
+
+
+async def run_match_headless(
+    topic: str,
+    topic_difficulty: DifficultyLevel,
+    prop_model_id: str,
+    opp_model_id: str,
+    prop_personality: Optional[str],
+    opp_personality: Optional[str],
+    rounds: int = 3,
+    judges: List[str] = None,
+    enabled_tools: List[str] = None,
+    user_id: Optional[int] = None,
+    timeout_seconds: int = MATCH_TIMEOUT_SECONDS,
+    match_id: Optional[str] = None,
+    parallel_openings: Optional[bool] = None
+) -> Tuple[MatchSession, List[str]]:
+    """
+    运行一场比赛，不推送事件 (批量评测使用)
     
-    # === 保存比赛 ===
-    match.status = "FINISHED"
-    await save_match(match)
+    赛制、时限和计票与 run_tournament_match 相同；发言和裁判使用非流式调用，不构造任何事件，
+    比赛过程中不写库。ELO 更新和结果落库由调用方处理（见 batch_eval）
+    
+    Returns:
+        (match, errors): 比赛结束时 status 为 FINISHED 或 TIMEOUT，errors 为发言和裁判的错误描述
+    
+    Raises:
+        ModelUnavailableError: 辩手模型熔断中
+    """
+    if judges is None:
+        judges = ["gpt-4o", "gpt-4o-mini"]
+    parallel_openings = _resolve_parallel_openings(parallel_openings, rounds)
+    judges = get_provider_router().plan_match_models(prop_model_id, opp_model_id, judges)
     
-    # 更新状态和 ELO 变化
-    if elo_changes:
-        await update_match_status(match.match_id, "FINISHED", elo_changes)
+    sides = {
+        "proponent": (prop_model_id, resolve_personality(prop_personality)),
+        "opponent": (opp_model_id, resolve_personality(opp_personality)),
+    }
+    loop = asyncio.get_running_loop()
+    match_deadline = loop.time() + timeout_seconds
+    debate_deadline = match_deadline - min(DEBATE_CONFIG['judge_time_budget'], timeout_seconds / 2)
     
-    logger.info(f"比赛结束: {match.match_id}")
+    match = MatchSession(
+        match_id=match_id or generate_id(),
+        topic=topic,
+        topic_difficulty=topic_difficulty,
+        proponent_model_id=prop_model_id,
+        opponent_model_id=opp_model_id,
+        proponent_personality=sides["proponent"][1],
+        opponent_personality=sides["opponent"][1],
+        rounds_setting=rounds,
+        status="FIGHTING",
+        user_id=user_id
+    )
+    context: List[Turn] = []
+    errors: List[str] = []
     
-    yield {"type": "match_end", "match_id": match.match_id}
+    def take_turn(role: str, round_num: int, is_opening: bool, turn_context: List[Turn]):
+        model_id, personality = sides[role]
+        return execute_turn(
+            role=role,
+            model_id=model_id,
+            personality=personality,
+            topic=topic,
+            topic_difficulty=topic_difficulty,
+            round_num=round_num,
+            context=turn_context,
+            is_opening=is_opening,
+            enabled_tools=enabled_tools,
+            deadline=debate_deadline
+        )
+    
+    def add_turn(role: str, outcome):
+        if isinstance(outcome, Exception):
+            logger.error(f"{role} 发言失败: {outcome}")
+            errors.append(f"{'正方' if role == 'proponent' else '反方'}发言出错: {outcome}")
+        else:
+            match.history.append(outcome)
+            context.append(outcome)
+    
+    is_timeout = False
+    for r in range(1, rounds + 1):
+        if r == 1 and parallel_openings:
+            outcomes = await asyncio.gather(
+                take_turn("proponent", 1, True, []),
+                take_turn("opponent", 1, True, []),
+                return_exceptions=True
+            )
+            for role, outcome in zip(("proponent", "opponent"), outcomes):
+                add_turn(role, outcome)
+            # 与流式比赛相同，开篇立论后检查比赛时限
+            is_timeout = loop.time() >= debate_deadline
+        else:
+            for role in ("proponent", "opponent"):
+                # 与流式比赛相同，每次发言前检查比赛时限
+                is_timeout = loop.time() >= debate_deadline
+                if is_timeout:
+                    break
+                try:
+                    add_turn(role, await take_turn(role, r, role == "proponent" and r == 1, context))
+                except Exception as e:
+                    add_turn(role, e)
+        if is_timeout:
+            logger.warning(f"比赛超时 (已超过 {timeout_seconds} 秒)，终止辩论: {match.match_id}")
+            match.status = "TIMEOUT"
+            return match, errors
+    
+    match.status = "JUDGING"
+    match.result, failures = await judge_match_with_panel(match, judges, deadline=match_deadline)
+    errors.extend(f"裁判 {judge_model} 评分失败: {error}" for judge_model, error in failures.items())
+    match.status = "FINISHED"
+    return match, errors
 
 
 async def execute_turn_stream(
@@ -254,19 +474,293 @@ async def execute_turn_stream(
     context: List[Turn],
     is_opening: bool,
     enabled_tools: List[str] = None,
-    match_id: str = None
+    match_id: str = None,
+    deadline: Optional[float] = None
 ) -> AsyncGenerator[dict, None]:
     """
     执行单次辩论发言 (流式)
     
+    deadline: 比赛阶段截止时间（event loop 时间），与单次发言时间预算取较早者；
+    到期时截断发言（已输出的内容保留）
+    
     Yields:
         {"type": "turn_delta", "speaker": "proponent", "delta": "...", "round": 1}
-        {"type": "turn_tool_call", "speaker": "proponent", "tool_call": {...}}
+        {"type": "turn_tool_call", "speaker": "proponent", "tool_call": {...}, "step": 1}
+        {"type": "turn_tool_result", "speaker": "proponent", "tool_name": "...", "result": {...}, "step": 1}
         {"type": "turn_complete", "turn": Turn(...)}
     """
     
     logger.info(f"{role} Round {round_num} 开始思考 (模型: {model_id}, 性格: {personality})")
     
+    messages, tools = _build_turn_messages(
+        role, personality, topic, topic_difficulty, round_num, context, is_opening, enabled_tools
+    )
+    
+    # 工具调用循环：模型可多次调用工具，受迭代次数、时间预算和工具输出大小约束
+    loop = asyncio.get_running_loop()
+    turn_deadline = loop.time() + DEBATE_CONFIG['turn_time_budget']
+    deadline = turn_deadline if deadline is None else min(turn_deadline, deadline)
+    max_iterations = DEBATE_CONFIG['max_tool_iterations']
+    max_output_bytes = DEBATE_CONFIG['max_tool_output_bytes']
+    
+    content_parts = []
+    tool_calls = []
+    budget_exceeded = False
+    
+    for step in range(max_iterations + 1):
+        # 历史中有工具调用时仍需提供工具定义（部分服务拒绝没有工具定义的工具调用历史）；
+        # 达到迭代上限后提示模型直接给出最终回答，多余的工具调用忽略
+        final_step = step == max_iterations
+        if final_step and step > 0:
+            messages.append({"role": "user", "content": _FINAL_STEP_PROMPT})
+        step_content = ""
+        step_tool_calls = []
+        failed = False
+        
+        model_stream = _stream_with_deadline(
+            query_model_stream(
+                model_id=model_id,
+                messages=messages,
+                tools=tools or None,
+                temperature=0.7,
+                deadline=deadline
+            ),
+            deadline
+        )
+        try:
+            async for event in model_stream:
+                if event["type"] == "content":
+                    # 内容增量
+                    step_content += event["delta"]
+                    yield {
+                        "type": "turn_delta",
+                        "speaker": role,
+                        "delta": event["delta"],
+                        "round": round_num
+                    }
+                    
+                elif event["type"] == "tool_call":
+                    # 工具调用
+                    step_tool_calls.append(event["tool_call"])
+                    if final_step:
+                        continue
+                    logger.info(f"{role} 调用工具: {event['tool_call']['function']['name']}")
+                    yield {
+                        "type": "turn_tool_call",
+                        "speaker": role,
+                        "tool_call": event["tool_call"],
+                        "round": round_num,
+                        "step": step + 1
+                    }
+                    
+                elif event["type"] == "done":
+                    logger.debug(f"{role} 第 {step + 1} 次调用完成")
+                    break
+                    
+                elif event["type"] == "error":
+                    logger.error(f"{role} 第 {step + 1} 次调用失败: {event['error']}")
+                    yield {
+                        "type": "error",
+                        "content": f"{role} 调用失败: {event['error']}"
+                    }
+                    failed = True
+                    break
+        except TimeoutError:
+            budget_exceeded = True
+        finally:
+            await model_stream.aclose()
+        
+        if step_content:
+            content_parts.append(step_content)
+        
+        if failed:
+            # 之前各次调用（和本次已输出）的内容保留为发言，什么都没有输出时不产生发言
+            if not content_parts and not tool_calls:
+                return
+            break
+        if budget_exceeded or not step_tool_calls:
+            break
+        if final_step:
+            logger.warning(f"{role} 已达到工具迭代上限 ({max_iterations})，忽略多余的工具调用")
+            break
+        
+        logger.info(f"开始执行 {len(step_tool_calls)} 个工具 (第 {step + 1}/{max_iterations} 轮)")
+        
+        # 将本次的助手回复加入消息历史
+        assistant_message = {
+            'role': 'assistant',
+            'content': step_content,
+            'tool_calls': step_tool_calls
+        }
+        messages.append(assistant_message)
+        
+        # 并发执行工具（按原始顺序推送结果），并将结果加入消息历史
+        tool_stream = _stream_with_deadline(
+            execute_tools_concurrently(
+                step_tool_calls,
+                max_concurrency=DEBATE_CONFIG['max_parallel_tools'],
+                timeout=min(DEBATE_CONFIG['tool_timeout'], max(deadline - loop.time(), 0.001))
+            ),
+            deadline
+        )
+        try:
+            async for tc, result, error in tool_stream:
+                record, tool_message = _tool_result_entry(tc, result, error, max_output_bytes)
+                tool_calls.append(record)
+                messages.append(tool_message)
+                if error is None:
+                    # 推送工具执行结果
+                    yield {
+                        "type": "turn_tool_result",
+                        "speaker": role,
+                        "tool_name": tc['function']['name'],
+                        "result": result,
+                        "round": round_num,
+                        "step": step + 1
+                    }
+        except TimeoutError:
+            budget_exceeded = True
+            break
+        finally:
+            await tool_stream.aclose()
+        
+        logger.info(f"{role} 基于工具结果进行第 {step + 2} 次调用")
+    
+    if budget_exceeded:
+        logger.warning(f"{role} Round {round_num} 超出时间预算 (发言预算 {DEBATE_CONFIG['turn_time_budget']:g} 秒或比赛时限)，已截断")
+        yield {
+            "type": "status",
+            "speaker": role,
+            "content": f"Round {round_num}: 发言超出时间预算，已截断"
+        }
+    
+    # 合并各次调用的内容
+    accumulated_content = "\n\n".join(content_parts)
+    
+    # 创建 Turn 对象
+    turn = Turn(
+        round_number=round_num,
+        speaker_role=role,
+        model_id=model_id,
+        content=accumulated_content,
+        tool_calls=tool_calls,
+        timestamp=datetime.utcnow()
+    )
+    
+    logger.info(f"{role} Round {round_num} 完成，内容: {len(accumulated_content)} 字符，工具: {len(tool_calls)} 个")
+    
+    # 推送完成事件（直接携带 Turn 对象，由 SSE 层序列化）
+    yield {
+        "type": "turn_complete",
+        "turn": turn
+    }
+
+
+async def execute_turn(
+    role: str,
+    model_id: str,
+    personality: PersonalityType,
+    topic: str,
+    topic_difficulty: DifficultyLevel,
+    round_num: int,
+    context: List[Turn],
+    is_opening: bool,
+    enabled_tools: List[str] = None,
+    deadline: Optional[float] = None
+) -> Turn:
+    """
+    执行单次辩论发言 (非流式，批量评测使用)
+    
+    提示词、工具调用循环和时间预算与 execute_turn_stream 相同，模型使用非流式调用，不输出中间事件。
+    超出时间预算时本次调用的内容无法保留（非流式调用没有已输出的部分），已完成的调用内容保留
+    
+    Raises:
+        RuntimeError: 模型调用失败（之前没有已完成的调用时；否则保留已有内容作为发言）
+    """
+    messages, tools = _build_turn_messages(
+        role, personality, topic, topic_difficulty, round_num, context, is_opening, enabled_tools
+    )
+    
+    loop = asyncio.get_running_loop()
+    turn_deadline = loop.time() + DEBATE_CONFIG['turn_time_budget']
+    deadline = turn_deadline if deadline is None else min(turn_deadline, deadline)
+    max_iterations = DEBATE_CONFIG['max_tool_iterations']
+    max_output_bytes = DEBATE_CONFIG['max_tool_output_bytes']
+    
+    content_parts = []
+    tool_calls = []
+    budget_exceeded = False
+    
+    for step in range(max_iterations + 1):
+        final_step = step == max_iterations
+        if final_step and step > 0:
+            messages.append({"role": "user", "content": _FINAL_STEP_PROMPT})
+        try:
+            response = await asyncio.wait_for(
+                query_model(model_id, messages, temperature=0.7, tools=tools or None, deadline=deadline),
+                max(deadline - loop.time(), 0)
+            )
+        except asyncio.TimeoutError:
+            budget_exceeded = True
+            break
+        if "error_type" in response:
+            if not content_parts and not tool_calls:
+                raise RuntimeError(f"{role} 调用失败: {response['content']}")
+            # 之前各次调用的内容保留为发言
+            logger.error(f"{role} 第 {step + 1} 次调用失败: {response['content']}")
+            break
+        
+        step_content = response["content"]
+        step_tool_calls = response["tool_calls"]
+        if step_content:
+            content_parts.append(step_content)
+        if not step_tool_calls:
+            break
+        if final_step:
+            logger.warning(f"{role} 已达到工具迭代上限 ({max_iterations})，忽略多余的工具调用")
+            break
+        
+        messages.append({'role': 'assistant', 'content': step_content, 'tool_calls': step_tool_calls})
+        try:
+            async for tc, result, error in _stream_with_deadline(
+                execute_tools_concurrently(
+                    step_tool_calls,
+                    max_concurrency=DEBATE_CONFIG['max_parallel_tools'],
+                    timeout=min(DEBATE_CONFIG['tool_timeout'], max(deadline - loop.time(), 0.001))
+                ),
+                deadline
+            ):
+                record, tool_message = _tool_result_entry(tc, result, error, max_output_bytes)
+                tool_calls.append(record)
+                messages.append(tool_message)
+        except TimeoutError:
+            budget_exceeded = True
+            break
+    
+    if budget_exceeded:
+        logger.warning(f"{role} Round {round_num} 超出时间预算，已截断")
+    
+    return Turn(
+        round_number=round_num,
+        speaker_role=role,
+        model_id=model_id,
+        content="\n\n".join(content_parts),
+        tool_calls=tool_calls,
+        timestamp=datetime.utcnow()
+    )
+
+
+def _build_turn_messages(
+    role: str,
+    personality: PersonalityType,
+    topic: str,
+    topic_difficulty: DifficultyLevel,
+    round_num: int,
+    context: List[Turn],
+    is_opening: bool,
+    enabled_tools: Optional[List[str]]
+) -> Tuple[List[dict], List[dict]]:
+    """构建单次发言的消息列表（系统提示词 + 历史发言）和可用工具定义"""
     # 构建系统提示词，传递 enabled_tools
     system_prompt = build_debate_prompt(
         role=role,
@@ -296,184 +790,113 @@ async def execute_turn_stream(
         "content": f"轮到你了，这是 Round {round_num}。请发言。"
     })
     
-    # 根据 enabled_tools 过滤工具
-    if enabled_tools is None:
-        enabled_tools = []
-    
     # 获取所有工具定义并按 enabled_tools 过滤
-    all_tools = get_debate_tools()
     if enabled_tools:
-        tools = [t for t in all_tools if t['function']['name'] in enabled_tools]
+        tools = [t for t in get_debate_tools() if t['function']['name'] in enabled_tools]
         logger.debug(f"使用工具: {[t['function']['name'] for t in tools]}")
     else:
         tools = []
         logger.debug("未启用任何工具")
+    return messages, tools
+
+
+def _tool_result_entry(tc: dict, result, error, max_output_bytes: int) -> Tuple[dict, dict]:
+    """工具执行结果 -> (发言记录中的工具调用, 回传模型的工具消息)"""
+    if error is not None:
+        logger.error(f"工具执行失败: {tc['function']['name']}, 错误: {error}")
+        record = {
+            "tool_name": tc['function']['name'],
+            "arguments": tc['function']['arguments'],
+            "result": {"error": str(error)}
+        }
+        # 错误也要加入消息历史
+        return record, {'role': 'tool', 'content': f"工具执行失败: {str(error)}", 'tool_call_id': tc['id']}
     
-    # 第一次流式调用 LLM (可能产生工具调用)
-    accumulated_content = ""
-    accumulated_tool_calls = []
-    
-    async for event in query_model_stream(
-        model_id=model_id,
-        messages=messages,
-        tools=tools if tools else None,  # 如果没有工具，传 None
-        temperature=0.7
-    ):
-        if event["type"] == "content":
-            # 内容增量
-            accumulated_content += event["delta"]
-            yield {
-                "type": "turn_delta",
-                "speaker": role,
-                "delta": event["delta"],
-                "round": round_num
-            }
-            
-        elif event["type"] == "tool_call":
-            # 工具调用
-            accumulated_tool_calls.append(event["tool_call"])
-            logger.info(f"{role} 调用工具: {event['tool_call']['function']['name']}")
-            yield {
-                "type": "turn_tool_call",
-                "speaker": role,
-                "tool_call": event["tool_call"],
-                "round": round_num
-            }
-            
-        elif event["type"] == "done":
-            # 完成第一次调用
-            logger.debug(f"{role} 第一次调用完成")
-            break
-            
-        elif event["type"] == "error":
-            logger.error(f"{role} 调用失败: {event['error']}")
-            yield {
-                "type": "error",
-                "content": f"{role} 调用失败: {event['error']}"
-            }
-            return
+    # 格式化工具结果
+    if isinstance(result, dict):
+        tool_result_content = result.get('response') or result.get('stdout') or result.get('result') or json.dumps(result, ensure_ascii=False)
+    else:
+        tool_result_content = str(result)
+    logger.info(f"工具执行成功: {tc['function']['name']}")
+    record = {
+        "tool_name": tc['function']['name'],
+        "arguments": tc['function']['arguments'],
+        "result": result
+    }
+    # 将工具结果加入消息历史（截断过长的输出）
+    return record, {
+        'role': 'tool',
+        'content': _truncate_tool_output(str(tool_result_content), max_output_bytes),
+        'tool_call_id': tc['id']
+    }
+
+
+async def _merge_turn_streams(streams: Dict[str, AsyncGenerator]) -> AsyncGenerator[Tuple[str, dict], None]:
+    """
+    并发执行多路发言，按到达顺序输出 (role, event)
+
+    与裁判团并行评分相同，每路发言在独立任务中运行并通过队列汇总；单路出错时输出该方的 error 事件，
+    不影响另一方。调用方提前关闭时取消全部发言任务
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def pump(role: str, stream: AsyncGenerator):
+        try:
+            async for event in stream:
+                await queue.put((role, event))
+        except Exception as e:
+            logger.error(f"{role} 发言失败: {e}", exc_info=True)
+            speaker = "正方" if role == "proponent" else "反方"
+            await queue.put((role, {"type": "error", "content": f"{speaker}发言出错: {str(e)}"}))
+        finally:
+            await stream.aclose()
+            await queue.put((role, None))
+
+    tasks = [asyncio.create_task(pump(role, stream)) for role, stream in streams.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            role, event = await queue.get()
+            if event is None:
+                remaining -= 1
+            else:
+                yield role, event
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _stream_with_deadline(stream: AsyncGenerator, deadline: float) -> AsyncGenerator:
+    """
+    在截止时间内迭代异步流
     
-    # 处理工具调用
-    tool_calls = []
-    if accumulated_tool_calls:
-        logger.info(f"开始执行 {len(accumulated_tool_calls)} 个工具")
-        
-        # 将第一次的助手回复加入消息历史
-        assistant_message = {
-            'role': 'assistant',
-            'content': accumulated_content if accumulated_content else "",
-            'tool_calls': accumulated_tool_calls
-        }
-        messages.append(assistant_message)
-        
-        # 执行工具并将结果加入消息历史
-        for tc in accumulated_tool_calls:
+    超过 deadline (event loop 时间) 时取消当前等待、关闭底层流并抛出 TimeoutError
+    """
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise TimeoutError
             try:
-                logger.debug(f"执行工具: {tc['function']['name']}")
-                result = await execute_tool(tc)
-                
-                # 格式化工具结果
-                if isinstance(result, dict):
-                    tool_result_content = result.get('response') or result.get('stdout') or result.get('result') or json.dumps(result, ensure_ascii=False)
-                else:
-                    tool_result_content = str(result)
-                
-                tool_calls.append({
-                    "tool_name": tc['function']['name'],
-                    "arguments": tc['function']['arguments'],
-                    "result": result
-                })
-                logger.info(f"工具执行成功: {tc['function']['name']}")
-                
-                # 推送工具执行结果
-                yield {
-                    "type": "turn_tool_result",
-                    "speaker": role,
-                    "tool_name": tc['function']['name'],
-                    "result": result,
-                    "round": round_num
-                }
-                
-                # 将工具结果加入消息历史
-                tool_result_message = {
-                    'role': 'tool',
-                    'content': tool_result_content,
-                    'tool_call_id': tc['id']
-                }
-                messages.append(tool_result_message)
-                
-            except Exception as e:
-                logger.error(f"工具执行失败: {tc['function']['name']}, 错误: {e}")
-                error_msg = f"工具执行失败: {str(e)}"
-                tool_calls.append({
-                    "tool_name": tc['function']['name'],
-                    "arguments": tc['function']['arguments'],
-                    "result": {"error": str(e)}
-                })
-                
-                # 错误也要加入消息历史
-                messages.append({
-                    'role': 'tool',
-                    'content': error_msg,
-                    'tool_call_id': tc['id']
-                })
-        
-        # 第二次调用 LLM，让模型基于工具结果生成最终回答
-        logger.info(f"{role} 基于工具结果进行第二次调用")
-        
-        final_content = ""
-        async for event in query_model_stream(
-            model_id=model_id,
-            messages=messages,
-            tools=tools if tools else None,  # 如果没有工具，传 None
-            temperature=0.7
-        ):
-            if event["type"] == "content":
-                # 内容增量
-                final_content += event["delta"]
-                yield {
-                    "type": "turn_delta",
-                    "speaker": role,
-                    "delta": event["delta"],
-                    "round": round_num
-                }
-                
-            elif event["type"] == "done":
-                logger.debug(f"{role} 第二次调用完成 (基于工具结果)")
-                break
-                
-            elif event["type"] == "error":
-                logger.error(f"{role} 第二次调用失败: {event['error']}")
-                yield {
-                    "type": "error",
-                    "content": f"{role} 第二次调用失败: {event['error']}"
-                }
+                item = await asyncio.wait_for(stream.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
                 return
-        
-        # 合并内容：第一次的内容 + 工具结果说明 + 第二次的内容
-        if accumulated_content:
-            accumulated_content = accumulated_content + "\n\n" + final_content
-        else:
-            accumulated_content = final_content
-    
-    # 创建 Turn 对象
-    turn = Turn(
-        round_number=round_num,
-        speaker_role=role,
-        model_id=model_id,
-        content=accumulated_content,
-        tool_calls=tool_calls,
-        timestamp=datetime.utcnow()
-    )
-    
-    logger.info(f"{role} Round {round_num} 完成，内容: {len(accumulated_content)} 字符，工具: {len(tool_calls)} 个")
-    
-    # 推送完成事件 (将 Turn 对象转换为字典)
-    yield {
-        "type": "turn_complete",
-        "turn": turn.model_dump(mode='json')
-    }
+            except asyncio.TimeoutError:
+                raise TimeoutError
+            yield item
+    finally:
+        await stream.aclose()
+
 
+def _truncate_tool_output(content: str, max_bytes: int) -> str:
+    """按 UTF-8 字节数截断工具输出，避免撑爆上下文"""
+    encoded = content.encode('utf-8')
+    if len(encoded) <= max_bytes:
+        return content
+    truncated = encoded[:max_bytes].decode('utf-8', errors='ignore')
+    return f"{truncated}\n...[输出过长，已截断 {len(encoded) - max_bytes} 字节]"
 
 
 def build_debate_prompt(
@@ -515,6 +938,9 @@ def build_debate_prompt(
             strategy = "这是开篇立论。请清晰地阐述你的核心观点，并提供强有力的论据或数据支持。"
         else:
             strategy = "请反驳反方的观点，维护你的立论，并指出对方逻辑中的谬误或证据的不足。"
+    elif is_opening:
+        # 双方同时开篇时反方看不到正方立论，只做独立立论，反驳留到下一轮
+        strategy = "这是反方开篇立论。请清晰地阐述反方的核心观点，并提供强有力的论据或数据支持。"
     else:
         strategy = "请猛烈抨击正方的观点。寻找事实错误、逻辑漏洞或反例。提出更有说服力的替代观点。"
     
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+@author:XuMing(xuming624@qq.com)
+@description:
+已结束比赛发言记录的压缩存储
+
+- 比赛结束后发言记录（含工具结果）压缩为二进制存入 matches.transcript_blob
+- 使用 zlib 预设字典：字典由已有发言记录训练，存于 transcript_dictionaries 表，所有进程共享
+- 压缩数据格式: MAGIC(2B) + 字典 ID(4B, 0 表示不使用字典) + zlib 数据
+"""
+
+import json
+import re
+import struct
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+
+# 发言记录转为冷存储的比赛状态
+COLD_STATUSES = ("FINISHED", "TIMEOUT", "CANCELLED")
+
+MAGIC = b"T1"
+_HEADER = struct.Struct(">2sI")
+# zlib 的回溯窗口为 32KB，更大的字典没有意义
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+# 字典候选片段：JSON 键名，以及不含分隔符的连续文本
+_TOKEN_RE = re.compile(r'"[A-Za-z_]+":\s?|[^\s",:{}\[\]]{4,48}')
+
+# 已加载的字典: id -> 字典内容
+_dictionaries: Dict[int, bytes] = {}
+_current_dictionary_id = 0
+
+
+class TranscriptStoreError(ValueError):
+    """压缩数据损坏或缺少对应字典"""
+
+
+def register_dictionary(dictionary_id: int, data: bytes, current: bool = False):
+    """登记字典（current=True 时用于后续压缩）"""
+    global _current_dictionary_id
+    _dictionaries[dictionary_id] = data
+    if current:
+        _current_dictionary_id = dictionary_id
+
+
+def current_dictionary_id() -> int:
+    """当前用于压缩的字典 ID（0 表示尚未训练字典）"""
+    return _current_dictionary_id
+
+
+def has_dictionary(dictionary_id: int) -> bool:
+    return dictionary_id == 0 or dictionary_id in _dictionaries
+
+
+def blob_dictionary_id(blob: bytes) -> int:
+    """读取压缩数据使用的字典 ID"""
+    magic, dictionary_id = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise TranscriptStoreError("未知的发言记录压缩格式")
+    return dictionary_id
+
+
+def train_dictionary(samples: List[bytes], max_size: int = MAX_DICTIONARY_SIZE) -> bytes:
+    """
+    从样本中训练 zlib 预设字典
+
+    统计在多个样本中重复出现的片段，按 出现样本数 × 长度 排序选取；
+    zlib 对字典末尾的内容匹配距离更近，收益最高的片段放在最后
+    """
+    document_frequency = Counter()
+    for sample in samples:
+        document_frequency.update(set(_TOKEN_RE.findall(sample.decode("utf-8", errors="ignore"))))
+
+    candidates = sorted(
+        ((df * len(token.encode("utf-8")), token) for token, df in document_frequency.items() if df >= 2),
+        reverse=True
+    )
+    pieces = []
+    size = 0
+    for _, token in candidates:
+        encoded = token.encode("utf-8")
+        if size + len(encoded) > max_size:
+            continue
+        pieces.append(encoded)
+        size += len(encoded)
+    return b"".join(reversed(pieces))
+
+
+def serialize_transcript(transcript: list) -> bytes:
+    return json.dumps(transcript, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def compress_transcript(transcript: list, level: int = 6) -> bytes:
+    """使用当前字典压缩发言记录"""
+    dictionary_id = _current_dictionary_id
+    if dictionary_id:
+        compressor = zlib.compressobj(level, zdict=_dictionaries[dictionary_id])
+    else:
+        compressor = zlib.compressobj(level)
+    data = compressor.compress(serialize_transcript(transcript)) + compressor.flush()
+    return _HEADER.pack(MAGIC, dictionary_id) + data
+
+
+def decompress_transcript(blob: bytes) -> list:
+    """解压发言记录（调用方需保证对应字典已加载）"""
+    dictionary_id = blob_dictionary_id(blob)
+    if dictionary_id:
+        if dictionary_id not in _dictionaries:
+            raise TranscriptStoreError(f"缺少发言记录压缩字典: {dictionary_id}")
+        decompressor = zlib.decompressobj(zdict=_dictionaries[dictionary_id])
+    else:
+        decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(blob[_HEADER.size:]) + decompressor.flush()
+    except zlib.error as e:
+        raise TranscriptStoreError(f"发言记录解压失败: {e}")
+    return json.loads(data)
+
+
+def load_transcript(transcript: Optional[list], blob: Optional[bytes]) -> list:
+    """读取比赛发言记录（冷存储透明解压）"""
+    if blob:
+        return decompress_transcript(blob)
+    return transcript or []
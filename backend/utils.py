@@ -8,6 +8,7 @@ Utility functions for LLM applications
 import uuid
 import json
 import re
+from typing import Any, List, Optional, Tuple
 
 
 def generate_id() -> str:
@@ -23,57 +24,224 @@ async def generate_conversation_title(user_query: str) -> str:
         title = title[:17] + "..."
     return title
 
-def parse_json(content: str) -> dict:
+class JSONStreamError(ValueError):
+    """流式 JSON 解析失败（输出不是合法 JSON）"""
+
+
+_JSON_WHITESPACE = " \t\r\n"
+_NUMBER_CHARS = set("0123456789+-.eE")
+_LITERAL_CHARS = set("truefalsn")
+
+
+class IncrementalJSONParser:
     """
-    从 LLM 响应中解析 JSON
+    增量 JSON 对象解析器
+    
+    逐块喂入 LLM 输出，单遍扫描：
+    - 跳过 JSON 之前的说明文字或 ```json 代码块标记，从第一个 { 开始解析
+    - 每解析出一个标量值就记录到 new_values，可用于实时展示部分结果
+    - 一旦出现语法错误立即抛出 JSONStreamError，无需等待输出结束
     
-    尝试多种策略提取 JSON，总是返回 dict
+    如果某个 { 之后还没有解析出任何键就出错（例如说明文字中的花括号），
+    会从下一个 { 重新开始，而不是直接判定为失败。
     """
-    # 策略 1: 直接解析
-    try:
-        result = json.loads(content)
-        # 如果是 list，尝试取第一个元素（如果是 dict）
-        if isinstance(result, list):
-            if result and isinstance(result[0], dict):
-                return result[0]
+    
+    def __init__(self, max_prefix_chars: int = 4000):
+        self.max_prefix_chars = max_prefix_chars
+        self.text = ""
+        self.result: Optional[dict] = None
+        self.done = False
+        self.new_values: List[Tuple[tuple, Any]] = []
+        self._pos = 0
+        self._reset(-1)
+    
+    def _reset(self, start: int):
+        self._start = start
+        self._stack: List[dict] = []
+        self._token: Optional[str] = None
+        self._token_chars: List[str] = []
+        self._token_is_key = False
+        self._escape = False
+        self._progress = 0
+    
+    def feed(self, chunk: str) -> List[Tuple[tuple, Any]]:
+        """
+        喂入一段文本，返回本次新解析出的 (路径, 值) 列表
+        
+        Raises:
+            JSONStreamError: 输出已确定不是合法 JSON
+        """
+        self.new_values = []
+        if self.done or not chunk:
+            return self.new_values
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text) and not self.done:
+            try:
+                if self._step(text[self._pos]):
+                    self._pos += 1
+            except JSONStreamError:
+                if self._progress or self._start < 0:
+                    raise
+                # 候选对象尚未解析出任何键值，视为说明文字中的花括号，从下一个 { 重试
+                self._pos = self._start + 1
+                self._reset(-1)
+        return self.new_values
+    
+    def finish(self) -> dict:
+        """输出结束，返回解析结果"""
+        if not self.done:
+            raise JSONStreamError("JSON 不完整")
+        return self.result
+    
+    # ---------- 状态机 ----------
+    
+    def _error(self, message: str):
+        raise JSONStreamError(f"{message} (位置 {self._pos})")
+    
+    def _step(self, c: str) -> bool:
+        """处理一个字符，返回 False 表示需要重新处理当前字符"""
+        if self._token == 'string':
+            if self._escape:
+                self._escape = False
+            elif c == '\\':
+                self._escape = True
+            elif c == '"':
+                raw = ''.join(self._token_chars)
+                self._token = None
+                try:
+                    value = json.loads(f'"{raw}"')
+                except ValueError:
+                    self._error("非法字符串")
+                if self._token_is_key:
+                    frame = self._stack[-1]
+                    frame['key'] = value
+                    frame['expect'] = 'colon'
+                    self._progress += 1
+                else:
+                    self._add_value(value)
+                return True
+            self._token_chars.append(c)
+            return True
+        
+        if self._token is not None:
+            allowed = _NUMBER_CHARS if self._token == 'number' else _LITERAL_CHARS
+            if c in allowed:
+                self._token_chars.append(c)
+                return True
+            raw = ''.join(self._token_chars)
+            self._token = None
+            try:
+                value = json.loads(raw)
+            except ValueError:
+                self._error(f"非法值 {raw!r}")
+            self._add_value(value)
+            return False
+        
+        if not self._stack:
+            if c == '{':
+                self._reset(self._pos)
+                self._push({}, 'key_or_end')
+            elif self._pos >= self.max_prefix_chars:
+                self._error("未找到 JSON 对象")
+            return True
+        
+        if c in _JSON_WHITESPACE:
+            return True
+        
+        frame = self._stack[-1]
+        expect = frame['expect']
+        if expect in ('key_or_end', 'key'):
+            if c == '"':
+                self._start_token('string', is_key=True)
+            elif c == '}' and expect == 'key_or_end':
+                self._pop()
+            else:
+                self._error(f"期望键名，得到 {c!r}")
+        elif expect == 'colon':
+            if c != ':':
+                self._error(f"期望 ':'，得到 {c!r}")
+            frame['expect'] = 'value'
+        elif expect in ('value', 'value_or_end'):
+            if c == '{':
+                self._add_container({}, 'key_or_end')
+            elif c == '[':
+                self._add_container([], 'value_or_end')
+            elif c == '"':
+                self._start_token('string')
+            elif c == '-' or c.isdigit():
+                self._start_token('number', c)
+            elif c in 'tfn':
+                self._start_token('literal', c)
+            elif c == ']' and expect == 'value_or_end':
+                self._pop()
+            else:
+                self._error(f"期望值，得到 {c!r}")
+        else:  # comma_or_end
+            is_object = isinstance(frame['value'], dict)
+            if c == ',':
+                frame['expect'] = 'key' if is_object else 'value'
+            elif (c == '}' and is_object) or (c == ']' and not is_object):
+                self._pop()
             else:
-                return {}
-        elif isinstance(result, dict):
-            return result
+                self._error(f"期望 ',' 或结束符，得到 {c!r}")
+        return True
+    
+    def _start_token(self, kind: str, first: str = '', is_key: bool = False):
+        self._token = kind
+        self._token_chars = [first] if first else []
+        self._token_is_key = is_key
+        self._escape = False
+    
+    def _push(self, container, expect: str):
+        self._stack.append({'value': container, 'expect': expect, 'key': None})
+    
+    def _pop(self):
+        frame = self._stack.pop()
+        if not self._stack:
+            self.result = frame['value']
+            self.done = True
+    
+    def _path(self) -> tuple:
+        path = []
+        for frame in self._stack:
+            if isinstance(frame['value'], dict):
+                path.append(frame['key'])
+            else:
+                path.append(len(frame['value']) - 1)
+        return tuple(path)
+    
+    def _attach(self, value):
+        frame = self._stack[-1]
+        if isinstance(frame['value'], dict):
+            frame['value'][frame['key']] = value
         else:
-            return {}
-    except:
-        pass
+            frame['value'].append(value)
+        frame['expect'] = 'comma_or_end'
+        self._progress += 1
     
-    # 策略 2: 提取 JSON 代码块
-    json_pattern = r'```json\s*\n(.*?)\n```'
-    match = re.search(json_pattern, content, re.DOTALL)
-    if match:
-        try:
-            result = json.loads(match.group(1))
-            if isinstance(result, list):
-                if result and isinstance(result[0], dict):
-                    return result[0]
-                else:
-                    return {}
-            elif isinstance(result, dict):
-                return result
-        except:
-            pass
-    
-    # 策略 3: 查找第一个 { } 对
-    start = content.find('{')
-    end = content.rfind('}')
-    if start != -1 and end != -1:
-        try:
-            result = json.loads(content[start:end+1])
-            if isinstance(result, dict):
-                return result
-        except:
-            pass
-    
-    # 降级: 返回空字典
-    return {}
+    def _add_container(self, container, expect: str):
+        self._attach(container)
+        self._push(container, expect)
+    
+    def _add_value(self, value):
+        self._attach(value)
+        self.new_values.append((self._path(), value))
+
+
+def parse_json(content: str) -> dict:
+    """
+    从 LLM 响应中解析 JSON
+    
+    单遍扫描提取第一个完整的 JSON 对象（兼容代码块和前后说明文字），总是返回 dict
+    """
+    parser = IncrementalJSONParser(max_prefix_chars=len(content))
+    try:
+        parser.feed(content)
+        return parser.finish()
+    except JSONStreamError:
+        # 降级: 返回空字典
+        return {}
 
 def extract_confidence(content: str) -> float:
     """
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""测试公共夹具"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run_db(tmp_path, monkeypatch):
+    """
+    在临时 SQLite 数据库上运行协程：run_db(async_fn) 初始化数据库后执行 async_fn()，返回其结果
+
+    替换 backend.database 的引擎和会话工厂，不影响 DATABASE_URL 指向的数据库
+    """
+    from sqlalchemy import event
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+    from backend import database
+
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", connect_args={"timeout": 30})
+    event.listen(engine.sync_engine, "connect", database._apply_sqlite_pragmas)
+    monkeypatch.setattr(database, "engine", engine)
+    monkeypatch.setattr(database, "IS_SQLITE", True)
+    monkeypatch.setattr(database, "SessionLocal", async_sessionmaker(
+        engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+    ))
+
+    def run(async_fn):
+        async def main():
+            # 写锁绑定到当前事件循环
+            monkeypatch.setattr(database, "_sqlite_write_lock", asyncio.Lock())
+            await database.init_db()
+            try:
+                return await async_fn()
+            finally:
+                await engine.dispose()
+        return asyncio.run(main())
+
+    return run
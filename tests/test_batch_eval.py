@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""批量评测测试"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.batch_eval import load_requests
+from backend.judge import aggregate_judge_scores
+from backend.models import DifficultyLevel, JudgeScore, MatchSession, PersonalityType
+
+
+def test_load_requests_skips_comments_and_repeats():
+    lines = [
+        "# 注释",
+        '{"topic": "AI 是否应该开源", "proponent_model": "a", "opponent_model": "b"}',
+        "",
+        '{"topic": "远程办公", "topic_difficulty": "hard", "proponent_model": "b", "opponent_model": "c", "rounds": 1}',
+    ]
+    requests = load_requests(lines, repeat=2)
+    assert [r.proponent_model for r in requests] == ["a", "a", "b", "b"]
+    assert requests[2].topic_difficulty == DifficultyLevel.HARD
+    assert requests[2].rounds == 1
+
+
+def test_aggregate_judge_scores_uses_average_totals():
+    match = MatchSession(
+        match_id="m", topic="t", topic_difficulty=DifficultyLevel.MEDIUM,
+        proponent_model_id="a", opponent_model_id="b",
+        proponent_personality=PersonalityType.RATIONAL, opponent_personality=PersonalityType.RATIONAL,
+        rounds_setting=1,
+    )
+
+    def score(judge, prop, opp, winner):
+        return JudgeScore(
+            judge_model=judge, winner=winner, reasoning="",
+            scores={"proponent": dict(logic=prop, evidence=prop, persuasion=prop),
+                    "opponent": dict(logic=opp, evidence=opp, persuasion=opp)},
+        )
+
+    result = aggregate_judge_scores(match, [score("j1", 6, 7, "opponent"), score("j2", 9, 7, "proponent")])
+    assert result.final_scores == {"proponent": 22.5, "opponent": 21.0}
+    assert result.winner == "proponent"
+    assert len(result.judge_scores) == 2
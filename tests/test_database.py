@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""数据库查询测试"""
+
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, func, or_, select, text
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import database
+from backend.models import MatchModel
+
+
+async def _insert_matches(count: int):
+    rng = random.Random(7)
+    models = ["a", "b", "c"]
+    start = datetime(2026, 1, 1)
+    async with database.write_session() as db:
+        for i in range(count):
+            prop = rng.choice(models)
+            # 约 1/4 为同模型对战
+            opp = prop if i % 4 == 0 else rng.choice(models)
+            db.add(MatchModel(
+                match_id=f"m{i}", topic="t", proponent_model_id=prop, opponent_model_id=opp,
+                status=rng.choice(["FINISHED", "FINISHED", "TIMEOUT"]), user_id=rng.choice([1, 2]),
+                created_at=start + timedelta(minutes=i),
+                finished_at=start + timedelta(minutes=rng.random() * count),
+            ))
+        await db.commit()
+
+
+def _select_with_or(model_id: str, order_column, limit: int, *conditions):
+    """改写前的 OR 查询"""
+    return (
+        select(MatchModel)
+        .where(or_(MatchModel.proponent_model_id == model_id, MatchModel.opponent_model_id == model_id), *conditions)
+        .order_by(desc(order_column))
+        .limit(limit)
+    )
+
+
+def test_union_rewrite_matches_or_query(run_db):
+    cases = [
+        ("a", MatchModel.created_at, 10, ()),
+        ("b", MatchModel.created_at, 500, ()),
+        ("c", MatchModel.created_at, 7, (MatchModel.user_id == 2,)),
+        ("a", MatchModel.finished_at, 20, (MatchModel.status == "FINISHED",)),
+        ("b", MatchModel.finished_at, 3, (MatchModel.status == "FINISHED",)),
+        ("missing", MatchModel.created_at, 10, ()),
+    ]
+
+    async def scenario():
+        await _insert_matches(120)
+        results = []
+        async with database.SessionLocal() as db:
+            for model_id, order_column, limit, conditions in cases:
+                rewritten = (await db.scalars(database._select_model_matches(model_id, order_column, limit, *conditions))).all()
+                original = (await db.scalars(_select_with_or(model_id, order_column, limit, *conditions))).all()
+                results.append(([m.match_id for m in rewritten], [m.match_id for m in original]))
+            same_model = set((await db.scalars(
+                select(MatchModel.match_id).where(MatchModel.proponent_model_id == MatchModel.opponent_model_id)
+            )).all())
+        return results, same_model
+
+    results, same_model = run_db(scenario)
+    for rewritten, original in results:
+        assert rewritten == original
+        assert len(rewritten) == len(set(rewritten))
+    # 同模型对战出现在结果中且只返回一次
+    assert same_model & set(results[1][0])
+
+
+def test_sqlite_pragmas_applied_on_new_connections(run_db):
+    async def scenario():
+        values = []
+        # 每个新连接都应设置 PRAGMA（dispose 后重新建立连接）
+        for _ in range(2):
+            async with database.engine.connect() as conn:
+                values.append(tuple([
+                    (await conn.execute(text(f"PRAGMA {name}"))).scalar()
+                    for name in ("journal_mode", "busy_timeout", "synchronous")
+                ]))
+            await database.engine.dispose()
+        return values
+
+    # synchronous=NORMAL 对应 1
+    assert run_db(scenario) == [("wal", 30000, 1)] * 2
+
+
+def test_concurrent_write_sessions_do_not_hit_database_locked(run_db, tmp_path):
+    external_lock_held = threading.Event()
+
+    def hold_external_write_lock():
+        # 其他进程（如 worker）短暂持有写锁，写会话应等待而不是报 database is locked
+        conn = sqlite3.connect(str(tmp_path / "test.db"))
+        conn.execute("BEGIN IMMEDIATE")
+        external_lock_held.set()
+        threading.Event().wait(0.3)
+        conn.rollback()
+        conn.close()
+
+    async def write(i: int):
+        async with database.write_session() as db:
+            db.add(MatchModel(match_id=f"w{i}", topic="t", proponent_model_id="a", opponent_model_id="b",
+                              status="FINISHED", user_id=1))
+            await db.commit()
+
+    async def read():
+        async with database.SessionLocal() as db:
+            return (await db.execute(select(func.count()).select_from(MatchModel))).scalar()
+
+    async def scenario():
+        holder = threading.Thread(target=hold_external_write_lock)
+        holder.start()
+        await asyncio.to_thread(external_lock_held.wait)
+        await asyncio.gather(*(write(i) for i in range(20)), *(read() for _ in range(10)))
+        holder.join()
+        return await read()
+
+    assert run_db(scenario) == 20
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""裁判输出校验和修复测试"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import judge
+from backend.judge import JudgeError, validate_judge_result
+from backend.models import DifficultyLevel, MatchSession, PersonalityType
+
+VALID = {
+    "scores": {"proponent": {"logic": 8, "evidence": "7.5", "persuasion": 9},
+               "opponent": {"logic": 6, "evidence": 6, "persuasion": 7}},
+    "winner": "proponent",
+    "reasoning": "正方论证更完整",
+}
+
+
+def _match() -> MatchSession:
+    return MatchSession(
+        match_id="m", topic="t", topic_difficulty=DifficultyLevel.MEDIUM,
+        proponent_model_id="a", opponent_model_id="b",
+        proponent_personality=PersonalityType.RATIONAL, opponent_personality=PersonalityType.RATIONAL,
+        rounds_setting=1,
+    )
+
+
+def _with(**changes) -> dict:
+    return {**json.loads(json.dumps(VALID)), **changes}
+
+
+def test_validate_judge_result():
+    normalized, errors = validate_judge_result(VALID)
+    assert errors == []
+    assert normalized["scores"]["proponent"]["evidence"] == 7.5
+
+    assert validate_judge_result([VALID])[1] == ["顶层必须是 JSON 对象"]
+    assert "缺少 scores 对象" in validate_judge_result(_with(scores=None))[1]
+    assert "缺少 scores.opponent 对象" in validate_judge_result(_with(scores={"proponent": VALID["scores"]["proponent"]}))[1]
+
+    bad_scores = _with()
+    bad_scores["scores"]["proponent"]["logic"] = 11
+    bad_scores["scores"]["opponent"]["evidence"] = "很好"
+    bad_scores["scores"]["opponent"]["persuasion"] = True
+    errors = validate_judge_result(bad_scores)[1]
+    assert errors == [
+        "scores.proponent.logic 必须在 0-10 之间",
+        "scores.opponent.evidence 必须是数字",
+        "scores.opponent.persuasion 必须是数字",
+    ]
+    assert validate_judge_result(_with(winner="tie"))[1] == ["winner 必须是 proponent、opponent 或 draw"]
+
+
+def _fake_query_model(monkeypatch, responses):
+    """按顺序返回预设输出，记录每次调用的 (消息, response_format)"""
+    calls = []
+
+    async def fake_query_model(model_id, messages, response_format=None, **kwargs):
+        calls.append((messages, response_format))
+        return responses[len(calls) - 1]
+
+    monkeypatch.setattr(judge, "query_model", fake_query_model)
+    monkeypatch.setattr(judge, "_judge_stats", {})
+    return calls
+
+
+def test_repair_retry_succeeds_on_second_response(monkeypatch):
+    broken = _with(winner="平局")
+    calls = _fake_query_model(monkeypatch, [
+        {"content": json.dumps(broken, ensure_ascii=False)},
+        {"content": json.dumps(VALID, ensure_ascii=False)},
+    ])
+
+    score = asyncio.run(judge.judge_single(_match(), "plain-judge", stream=False))
+
+    assert score.winner == "proponent" and score.scores["proponent"]["evidence"] == 7.5
+    # 第二次请求是只包含错误和原始输出的修复提示
+    repair_prompt = calls[1][0][0]["content"]
+    assert "winner 必须是" in repair_prompt and "平局" in repair_prompt
+    stats = judge.get_judge_stats()["plain-judge"]
+    assert stats["responses"] == 1 and stats["parse_failures"] == 1
+    assert stats["repairs"] == 1 and stats["repaired"] == 1 and stats["failures"] == 0
+
+
+def test_repeated_invalid_output_raises(monkeypatch):
+    monkeypatch.setattr(judge, "JUDGE_MAX_RETRIES", 0)
+    _fake_query_model(monkeypatch, [{"content": "不是 JSON"}, {"content": "{\"scores\": null}"}])
+    try:
+        asyncio.run(judge.judge_single(_match(), "plain-judge", stream=False))
+    except JudgeError as e:
+        assert "缺少 scores 对象" in str(e)
+    else:
+        raise AssertionError("应当抛出 JudgeError")
+    assert judge.get_judge_stats()["plain-judge"]["failures"] == 1
+
+
+def test_structured_output_falls_back_on_bad_request(monkeypatch):
+    monkeypatch.setattr(judge, "JUDGE_STRUCTURED_OUTPUT_MODELS", ["schema-"])
+    monkeypatch.setattr(judge, "_structured_output_unsupported", {})
+    now = [1000.0]
+    monkeypatch.setattr(judge.time, "monotonic", lambda: now[0])
+    calls = _fake_query_model(monkeypatch, [
+        {"content": "response_format is not supported", "error_type": "bad_request"},
+        {"content": json.dumps(VALID)},
+        {"content": json.dumps(VALID)},
+        {"content": json.dumps(VALID)},
+    ])
+
+    asyncio.run(judge.judge_single(_match(), "schema-judge", stream=False))
+    assert calls[0][1] == judge.JUDGE_RESPONSE_FORMAT and calls[1][1] is None
+    assert set(judge._structured_output_unsupported) == {"schema-judge"}
+
+    # 有效期内直接使用普通输出
+    asyncio.run(judge.judge_single(_match(), "schema-judge", stream=False))
+    assert len(calls) == 3 and calls[2][1] is None
+
+    # 过期后重新尝试结构化输出
+    now[0] += judge.STRUCTURED_OUTPUT_RETRY_SECONDS
+    asyncio.run(judge.judge_single(_match(), "schema-judge", stream=False))
+    assert len(calls) == 4 and calls[3][1] == judge.JUDGE_RESPONSE_FORMAT
+    assert judge._structured_output_unsupported == {}
+
+
+def test_unrelated_bad_request_does_not_disable_structured_output(monkeypatch):
+    monkeypatch.setattr(judge, "JUDGE_STRUCTURED_OUTPUT_MODELS", ["schema-"])
+    monkeypatch.setattr(judge, "_structured_output_unsupported", {})
+    monkeypatch.setattr(judge, "JUDGE_MAX_RETRIES", 0)
+    calls = _fake_query_model(monkeypatch, [
+        {"content": "This model's maximum context length is 8192 tokens", "error_type": "bad_request"},
+    ])
+
+    try:
+        asyncio.run(judge.judge_single(_match(), "schema-judge", stream=False))
+    except JudgeError:
+        pass
+    else:
+        raise AssertionError("参数错误应当抛出")
+    assert len(calls) == 1 and judge._structured_output_unsupported == {}
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""模型客户端连接池测试（不访问模型服务）"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import llm_client
+
+
+def test_each_endpoint_gets_its_own_client_and_close_clients_closes_all(monkeypatch):
+    monkeypatch.setattr(llm_client, "_clients", {})
+    monkeypatch.setattr(llm_client, "LLM_TRANSPORT_OVERRIDES", {"http://b.local/v1": {"max_connections": 7}})
+
+    async def scenario():
+        a = llm_client.get_client("http://a.local/v1", api_key="k")
+        b = llm_client.get_client("http://b.local/v1", api_key="k")
+        # 同一端点复用客户端，不同端点各自持有连接池
+        assert llm_client.get_client("http://a.local/v1") is a
+        assert a is not b and a._client is not b._client
+        # 端点覆盖的连接池参数只作用于该端点的客户端
+        assert b._client._transport._pool._max_connections == 7
+        assert a._client._transport._pool._max_connections == llm_client.HTTP_TRANSPORT_CONFIG["max_connections"]
+
+        await llm_client.close_clients()
+        return a, b
+
+    a, b = asyncio.run(scenario())
+    assert a.is_closed() and b.is_closed()
+    assert llm_client._clients == {}
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""模型调用录制与回放测试"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.llm_recorder import LLMRecorder, make_request_key
+
+
+def test_replay_returns_recorded_events_in_occurrence_order(tmp_path):
+    path = str(tmp_path / "recordings.db")
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "stream": True}
+    key = make_request_key(request)
+    assert key == make_request_key(dict(reversed(list(request.items()))))
+
+    async def run():
+        recorder = LLMRecorder("record", path)
+        for answer in ("first", "second"):
+            events = [(0.01, {"type": "content", "delta": answer}), (0.02, {"type": "done", "content": answer})]
+            await recorder.save(key, recorder.next_seq(key), "m", request, events, 0.02)
+        recorder.close()
+
+        recorder = LLMRecorder("replay", path, speed=0)
+        replayed = []
+        for _ in range(3):
+            events = await recorder.load(key, recorder.next_seq(key))
+            replayed.append([e async for e in recorder.replay(events)][-1]["content"])
+        assert await recorder.load("missing", 0) is None
+        assert recorder.get_stats()["misses"] == 1
+        return replayed
+
+    # 超出录制次数时重复最后一次
+    assert asyncio.run(run()) == ["first", "second", "second"]
+
+
+def test_query_model_replay_never_calls_provider(tmp_path, monkeypatch):
+    from backend import llm_client
+
+    recorder = LLMRecorder("replay", str(tmp_path / "recordings.db"), speed=0)
+    monkeypatch.setattr(llm_client, "get_llm_recorder", lambda: recorder)
+
+    async def live_call(*args, **kwargs):
+        raise AssertionError("回放模式下不应调用模型服务")
+
+    monkeypatch.setattr(llm_client, "_query_model_live", live_call)
+    messages = [{"role": "user", "content": "hi"}]
+    key = make_request_key(llm_client._request_fingerprint("m", messages, 0.7, False, None, None))
+    answer = {"content": "hello", "tool_calls": []}
+
+    async def run():
+        await recorder.save(key, 0, "m", {}, [(0.5, {"type": "result", "result": answer})], 0.5)
+        # 存档中事件为空（损坏或未完成的录制）
+        await recorder.save(key, 1, "m", {}, [], 0.0)
+        replayed = await llm_client.query_model("m", messages)
+        empty = await llm_client.query_model("m", messages)
+        missing = await llm_client.query_model("other", messages)
+        return replayed, empty, missing
+
+    replayed, empty, missing = asyncio.run(run())
+    assert replayed == answer
+    assert empty["error_type"] == "replay_miss" and missing["error_type"] == "replay_miss"
+    recorder.close()
+
+
+def test_tool_results_are_recorded_and_replayed(tmp_path, monkeypatch):
+    from backend import tools
+
+    path = str(tmp_path / "recordings.db")
+    executed = []
+
+    async def live_tool(tool_name, arguments):
+        executed.append(arguments["query"])
+        return {"query": arguments["query"], "results": [f"result {len(executed)}"]}
+
+    monkeypatch.setattr(tools, "_execute_tool_live", live_tool)
+    tool_call = {"id": "c1", "type": "function", "function": {"name": "web_search", "arguments": '{"query": "q"}'}}
+
+    async def run(mode):
+        recorder = LLMRecorder(mode, path, speed=0)
+        monkeypatch.setattr(tools, "get_llm_recorder", lambda: recorder)
+        results = [await tools.execute_tool(tool_call) for _ in range(2)]
+        other = {**tool_call, "function": {"name": "web_search", "arguments": {"query": "other"}}}
+        if mode == "replay":
+            results.append(await tools.execute_tool(other))
+        recorder.close()
+        return results
+
+    recorded = asyncio.run(run("record"))
+    assert executed == ["q", "q"]
+    replayed = asyncio.run(run("replay"))
+    # 回放按出现顺序返回录制结果，不执行工具；没有录制的调用返回错误结果
+    assert executed == ["q", "q"]
+    assert replayed[:2] == recorded and replayed[0] != replayed[1]
+    assert "回放存档中没有该工具调用" in replayed[2]["error"]
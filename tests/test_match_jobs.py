@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""比赛任务队列（租约领取）测试"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import database
+
+
+def test_concurrent_leases_claim_each_job_once(run_db):
+    async def scenario():
+        await database.enqueue_match_job("m1", {"topic": "t1"})
+        await database.enqueue_match_job("m2", {"topic": "t2"})
+        leased = await asyncio.gather(*[database.lease_match_job(f"w{i}", 60, 3) for i in range(4)])
+        return [(job.match_id, job.worker_id, job.attempts) for job in leased if job is not None]
+
+    leased = run_db(scenario)
+    assert sorted(match_id for match_id, _, _ in leased) == ["m1", "m2"]
+    assert len({worker for _, worker, _ in leased}) == 2
+    assert all(attempts == 1 for _, _, attempts in leased)
+
+
+def test_renew_and_cancel(run_db):
+    async def scenario():
+        await database.enqueue_match_job("running", {})
+        await database.enqueue_match_job("queued", {})
+        job = await database.lease_match_job("w1", 60, 3)
+        expires_at = job.lease_expires_at
+
+        # 其他 worker 不能续约
+        assert await database.renew_match_job_leases("w2", [job.id], 600) == []
+        assert (await database.get_match_job("running")).lease_expires_at == expires_at
+        assert await database.renew_match_job_leases("w1", [job.id], 600) == []
+        renewed = (await database.get_match_job("running")).lease_expires_at
+
+        # 排队中的任务直接取消，运行中的任务在续约时通知 worker
+        await database.request_match_job_cancel("queued")
+        await database.request_match_job_cancel("running")
+        cancelled = await database.renew_match_job_leases("w1", [job.id], 600)
+        return job.id, expires_at, renewed, cancelled, await database.get_match_job("queued"), \
+            await database.lease_match_job("w2", 60, 3)
+
+    job_id, expires_at, renewed, cancelled, queued, next_job = run_db(scenario)
+    assert renewed > expires_at
+    assert cancelled == [job_id]
+    assert queued.status == "CANCELLED"
+    assert next_job is None
+
+
+def test_expired_lease_is_requeued_until_max_attempts(run_db):
+    async def scenario():
+        await database.enqueue_match_job("m1", {})
+        # 租约立即过期，模拟 worker 失联
+        first = await database.lease_match_job("w1", -1, 2)
+        second = await database.lease_match_job("w2", -1, 2)
+        # 失去租约的 worker 不能再结束任务
+        await database.finish_match_job(first.id, "w1", "DONE")
+        after_stale_finish = await database.get_match_job("m1")
+        third = await database.lease_match_job("w3", 60, 2)
+        return first, second, after_stale_finish, third, await database.get_match_job("m1")
+
+    first, second, after_stale_finish, third, final = run_db(scenario)
+    assert first.id == second.id and second.worker_id == "w2" and second.attempts == 2
+    assert after_stale_finish.status == "RUNNING"
+    # 达到最大执行次数：不再领取，标记为 FAILED
+    assert third is None
+    assert final.status == "FAILED" and final.attempts == 2
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""进行中比赛事件广播测试"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.match_registry import LiveMatch
+
+
+def _drain(queue) -> list:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_live_match_replays_from_last_event_id():
+    live = LiveMatch("m1")
+    live.publish({"type": "match_init", "match_id": "m1"})
+    live.publish({"type": "status", "content": "Round 1"})
+
+    initiator = live.subscribe()
+    spectator = live.subscribe(last_event_id=1)
+    assert live.subscriber_count == 2
+    live.publish({"type": "match_end", "match_id": "m1"})
+    live.close()
+
+    frames = _drain(initiator)
+    assert [f.split(b"\n", 1)[0] for f in frames[:-1]] == [b"id: 1", b"id: 2", b"id: 3"]
+    assert frames[-1] is None
+    assert _drain(spectator)[0].startswith(b"id: 2\n")
+
+    # 比赛结束后重连：补发剩余事件后立即结束
+    late = _drain(live.subscribe(last_event_id=2))
+    assert late[0].startswith(b"id: 3\n") and late[-1] is None
+    assert live.subscriber_count == 0
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""信息增益配对测试"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.matchmaker import Matchmaker, pair_information
+from backend.models import DebateTopic, DifficultyLevel, TopicCategory
+
+
+def _topic(topic_id, category, usage):
+    return DebateTopic(
+        id=topic_id, topic=f"辩题{topic_id}", difficulty=DifficultyLevel.MEDIUM, category=category,
+        has_objective_answer=False, expected_tools=[], usage_count=usage, avg_rating=0.0,
+    )
+
+
+def _elo(old_a, new_a, old_b, new_b):
+    return {
+        "proponent": {"old_rating": old_a, "new_rating": new_a, "change": new_a - old_a},
+        "opponent": {"old_rating": old_b, "new_rating": new_b, "change": new_b - old_b},
+    }
+
+
+def test_pair_information_prefers_close_and_uncertain_ratings():
+    assert pair_information(1200, 0, 1200, 0) == 1.0
+    assert pair_information(1200, 0, 1200, 0) > pair_information(1200, 0, 1500, 0)
+    assert pair_information(1200, 0, 1200, 0) > pair_information(1200, 50, 1200, 50)
+
+
+def test_next_match_reserves_pairs_and_rescores_after_results():
+    competitors = [("a", 1200, 30), ("b", 1210, 30), ("c", 1800, 30), ("d", 1205, 2)]
+    topics = [_topic(1, TopicCategory.TECH, 5), _topic(2, TopicCategory.TECH, 0), _topic(3, TopicCategory.SOCIAL, 1)]
+    mm = Matchmaker(competitors, topics, reservation_ttl=60)
+
+    # a/d、b/d 评分接近且 d 场数少
+    first, score = mm.next_match(rounds=1)
+    assert {first.proponent_model, first.opponent_model} in ({"a", "d"}, {"b", "d"})
+    assert first.rounds == 1
+    # 平均使用次数最少的是 SOCIAL 分类
+    assert first.topic == "辩题3"
+    second, _ = mm.next_match()
+    assert {second.proponent_model, second.opponent_model} != {first.proponent_model, first.opponent_model}
+    # SOCIAL 平均使用 2 次，仍少于 TECH 的 2.5 次
+    assert second.topic == "辩题3"
+
+    mm.record_result(first.proponent_model, first.opponent_model, first.topic)
+    assert mm.get_stats()["reserved"] == 1
+    mm.release(second.proponent_model, second.opponent_model)
+    assert mm.get_stats()["reserved"] == 0
+
+    available = {"a", "b", "c"}
+    third, _ = mm.next_match(available=lambda m: m in available)
+    assert {third.proponent_model, third.opponent_model} == {"a", "b"}
+    # SOCIAL 增至 3 次后选择 TECH 中使用最少的辩题
+    assert third.topic == "辩题2"
+
+
+def test_record_result_updates_ratings_and_sides_alternate():
+    mm = Matchmaker([("a", 1200, 0), ("b", 1200, 0), ("c", 1200, 10)], [_topic(1, TopicCategory.TECH, 0)])
+    request, score = mm.next_match()
+    assert {request.proponent_model, request.opponent_model} == {"a", "b"} and score == 1.0
+    mm.record_result(request.proponent_model, request.opponent_model, request.topic,
+                     _elo(1200, 1500, 1200, 900))
+    # a、b 评分拉开后 c 参与的配对更有信息量
+    following, _ = mm.next_match()
+    assert "c" in (following.proponent_model, following.opponent_model)
+    mm.release(following.proponent_model, following.opponent_model)
+
+    # 唯一的配对已预约时重复安排，正反方轮换
+    mm2 = Matchmaker([("a", 1200, 0), ("b", 1200, 0)], [_topic(1, TopicCategory.TECH, 0)])
+    requests = [mm2.next_match()[0] for _ in range(2)]
+    assert requests[0].proponent_model != requests[1].proponent_model
+    mm2.record_result(requests[0].proponent_model, requests[0].opponent_model, requests[0].topic)
+    assert mm2.get_stats()["reserved"] == 1
+    mm2.record_result(requests[1].proponent_model, requests[1].opponent_model, requests[1].topic)
+    stats = mm2.get_stats()
+    assert stats["reserved"] == 0 and stats["overbooked"] == 1
+    assert stats["category_usage"] == {"tech": 2}
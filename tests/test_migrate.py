@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""数据迁移测试（SQLite 到 SQLite，验证分页、检查点和校验和）"""
+
+import os
+import sqlite3
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import database
+from backend.migrate_sqlite_to_mysql import stream_migrate
+from backend.models import LiveMatchModel, SchemaVersionModel
+
+
+def _count(path: str, table: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_stream_migrate_database_created_by_init_db(run_db, tmp_path, capsys):
+    async def populate():
+        await database.enqueue_match_job("m1", {"topic": "t"})
+        await database.register_live_match("m1", "worker-1", None)
+        async with database.write_session() as db:
+            # 字符串主键的表跨多个批次
+            db.add_all([SchemaVersionModel(fingerprint=f"{i:064d}") for i in range(5)])
+            await db.commit()
+
+    run_db(populate)
+    source = str(tmp_path / "test.db")
+    target = str(tmp_path / "target.db")
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    stream_migrate(source, f"sqlite:///{target}", chunk_size=2, workers=2, checkpoint_path=checkpoint)
+    output = capsys.readouterr().out
+    assert "✓ 校验通过" in output
+    for table in ("competitors", "debate_topics", "match_jobs", "schema_versions"):
+        assert _count(target, table) == _count(source, table) > 0
+    # 运行时状态不迁移
+    assert _count(target, LiveMatchModel.__tablename__) == 0
+
+    # 重新执行时从检查点继续（已完成的表跳过）
+    stream_migrate(source, f"sqlite:///{target}", chunk_size=2, workers=2, checkpoint_path=checkpoint)
+    assert "已完成，跳过" in capsys.readouterr().out
+    assert _count(target, "schema_versions") == _count(source, "schema_versions")
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""比赛写缓冲测试"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import database, persistence
+from backend.models import DifficultyLevel, MatchSession, PersonalityType
+from backend.persistence import MatchWriteBuffer
+
+
+def _match(match_id: str, user_id: int = 1) -> MatchSession:
+    return MatchSession(
+        match_id=match_id, topic="t", topic_difficulty=DifficultyLevel.MEDIUM,
+        proponent_model_id="a", opponent_model_id="b",
+        proponent_personality=PersonalityType.RATIONAL, opponent_personality=PersonalityType.RATIONAL,
+        rounds_setting=1, user_id=user_id,
+    )
+
+
+def _buffer() -> MatchWriteBuffer:
+    # 不自动刷新，由测试显式调用 flush
+    return MatchWriteBuffer(flush_interval=3600, max_batch=1000)
+
+
+def test_record_coalesces_and_flush_writes_one_batch(run_db, monkeypatch):
+    batches = []
+    save = database.save_matches_bulk
+
+    async def counting_save(rows):
+        batches.append([row["match_id"] for row in rows])
+        await save(rows)
+
+    monkeypatch.setattr(persistence, "save_matches_bulk", counting_save)
+
+    async def scenario():
+        buffer = _buffer()
+        m1, m2 = _match("m1"), _match("m2")
+        buffer.record(m1, elo_changes={"proponent": {"change": 5}})
+        m1.status = "FINISHED"
+        buffer.record(m1)
+        buffer.record(m2)
+        assert buffer.get_stats()["pending"] == 2
+        await buffer.flush()
+        await buffer.close()
+        row = await database.get_match("m1")
+        return buffer.get_stats(), row.status, row.elo_changes
+
+    stats, status, elo_changes = run_db(scenario)
+    assert batches == [["m1", "m2"]]
+    assert stats["records"] == 3 and stats["rows_written"] == 2 and stats["pending"] == 0
+    # 合并后为最新状态，未传 elo_changes 的登记保留之前的值
+    assert status == "FINISHED" and elo_changes == {"proponent": {"change": 5}}
+
+
+def test_failed_flush_requeues_without_overwriting_newer_state(monkeypatch):
+    m1, m2 = _match("m1"), _match("m2")
+    newer = _match("m1")
+    newer.status = "FINISHED"
+    written = []
+
+    async def flaky_save(rows):
+        if not written:
+            written.append(None)
+            # 写入期间比赛登记了新状态
+            buffer.record(newer)
+            raise RuntimeError("database is locked")
+        written.append([row["match_id"] for row in rows])
+
+    monkeypatch.setattr(persistence, "save_matches_bulk", flaky_save)
+    buffer = _buffer()
+
+    async def scenario():
+        buffer.record(m1)
+        buffer.record(m2)
+        await buffer.flush()
+        pending = dict(buffer._pending)
+        await buffer.flush()
+        await buffer.close()
+        return pending
+
+    pending = asyncio.run(scenario())
+    assert pending["m1"][0] is newer and pending["m2"][0] is m2
+    assert sorted(written[1]) == ["m1", "m2"]
+    assert buffer.get_stats()["failures"] == 1
+
+
+def test_discard_and_delete_skip_later_records(run_db, monkeypatch):
+    async def scenario():
+        buffer = _buffer()
+        live = _match("live", user_id=1)
+        buffer.record(live)
+        buffer.record(_match("gone"))
+        buffer.discard("gone")
+        assert set(buffer._pending) == {"live"}
+
+        # 归属校验失败：不删除，也不影响该比赛后续写入
+        assert not await buffer.delete("live", user_id=2)
+        live.status = "Round 2"
+        buffer.record(live)
+        assert "live" in buffer._pending
+
+        # 进行中（尚未落库）的比赛：先写入再按归属删除，之后的登记和刷新都跳过
+        assert await buffer.delete("live", user_id=1)
+        live.status = "FINISHED"
+        buffer.record(live, flush=True)
+        buffer.record(_match("gone"))
+        await buffer.flush()
+        await buffer.close()
+        return await database.get_match("live"), await database.get_match("gone"), buffer.get_stats()
+
+    live_row, gone_row, stats = run_db(scenario)
+    assert live_row is None and gone_row is None
+    assert stats["pending"] == 0
+
+
+def test_deleted_markers_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(persistence.time, "monotonic", lambda: now[0])
+    buffer = MatchWriteBuffer(flush_interval=3600, max_batch=1000, deleted_ttl=60)
+    buffer.discard("old")
+    now[0] += 30
+    buffer.discard("recent")
+    assert buffer._is_deleted("old") and buffer._is_deleted("recent")
+
+    # 过期标记不再拦截登记，并在下次删除时被清理
+    now[0] += 40
+    assert not buffer._is_deleted("old") and buffer._is_deleted("recent")
+    buffer.discard("newest")
+    assert list(buffer._deleted) == ["recent", "newest"]
+    assert buffer.get_stats()["deleted"] == 2
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""模型服务选路与熔断测试"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pytest
+
+from backend.provider_router import CircuitBreaker, ModelUnavailableError, ProviderRouter
+
+
+def test_breaker_opens_and_probes_after_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, error_rate=1.0, min_samples=10, cooldown=0, window=10)
+    assert breaker.record_failure() is False
+    assert breaker.record_failure() is True
+    # 冷却结束：只放行一个探测请求
+    assert breaker.current_state() == CircuitBreaker.HALF_OPEN
+    breaker.cooldown = 60
+    breaker.opened_at -= 60
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+    breaker.record_success()
+    assert breaker.current_state() == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_route_prefers_fast_healthy_endpoints():
+    router = ProviderRouter.from_config([
+        {"name": "slow", "base_url": "http://slow/v1"},
+        {"name": "fast", "base_url": "http://fast/v1", "model_map": {"gpt-4o": "openai/gpt-4o"}},
+        {"name": "mini", "base_url": "http://mini/v1", "models": ["gpt-4o-mini"]},
+    ])
+    slow, fast, _ = router.endpoints
+    router.record_success(slow, 2.0)
+    router.record_success(fast, 0.3)
+    assert [e.name for e in router.route("gpt-4o")] == ["fast", "slow"]
+    assert fast.resolve_model("gpt-4o") == "openai/gpt-4o"
+
+    # 请求参数错误不计入端点故障
+    router.record_failure(fast, "bad_request")
+    assert fast.breaker.consecutive_failures == 0
+    for _ in range(fast.breaker.failure_threshold):
+        router.record_failure(fast, "connection")
+    assert [e.name for e in router.route("gpt-4o")] == ["slow"]
+
+
+def test_plan_match_models_rejects_or_reroutes():
+    router = ProviderRouter.from_config([{"name": "default", "base_url": "http://default/v1"}])
+    for _ in range(router.model_breaker("judge-x").failure_threshold):
+        router.record_model_result("judge-x", "connection")
+    # JUDGE_PANEL 默认为 gpt-4o、gpt-4o-mini
+    assert router.plan_match_models("a", "b", ["gpt-4o-mini", "judge-x"]) == ["gpt-4o-mini", "gpt-4o"]
+
+    with pytest.raises(ModelUnavailableError) as exc:
+        router.plan_match_models("judge-x", "b", ["gpt-4o", "gpt-4o-mini"])
+    assert exc.value.models == ["judge-x"] and exc.value.retry_after > 0
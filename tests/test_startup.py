@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+"""启动导入预算测试"""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from backend.benchmark_startup import LAZY_MODULES
+
+
+def test_heavy_modules_are_lazy():
+    env = dict(os.environ, OPENROUTER_API_KEY=os.getenv("OPENROUTER_API_KEY", "test"), DEBATE_LOG_LEVEL="WARNING")
+    result = subprocess.run(
+        [sys.executable, "-c", f"import sys, backend.main; print([m for m in {LAZY_MODULES!r} if m in sys.modules])"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip().splitlines()[-1] == "[]"
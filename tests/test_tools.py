@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""工具执行模块测试"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import tools
+
+
+def _tool_call(name: str, call_id: str, **arguments) -> dict:
+    return {"id": call_id, "type": "function", "function": {"name": name, "arguments": arguments}}
+
+
+async def _collect(tool_calls, **kwargs):
+    return [item async for item in tools.execute_tools_concurrently(tool_calls, **kwargs)]
+
+
+def test_execute_tools_concurrently_keeps_order(monkeypatch):
+    delays = {"a": 0.3, "b": 0.1, "c": 0.2}
+
+    async def fake_execute_tool(tc):
+        await asyncio.sleep(delays[tc["id"]])
+        return {"id": tc["id"]}
+
+    monkeypatch.setattr(tools, "execute_tool", fake_execute_tool)
+    calls = [_tool_call("web_search", k, query=k) for k in delays]
+
+    start = time.monotonic()
+    results = asyncio.run(_collect(calls, max_concurrency=3, timeout=5))
+    elapsed = time.monotonic() - start
+
+    assert [r[1]["id"] for r in results] == ["a", "b", "c"]
+    assert all(r[2] is None for r in results)
+    assert elapsed < sum(delays.values())
+
+
+def test_execute_tools_concurrently_timeout(monkeypatch):
+    async def fake_execute_tool(tc):
+        await asyncio.sleep(1 if tc["id"] == "slow" else 0)
+        return {"id": tc["id"]}
+
+    monkeypatch.setattr(tools, "execute_tool", fake_execute_tool)
+    calls = [_tool_call("web_search", "slow", query="x"), _tool_call("web_search", "fast", query="y")]
+
+    results = asyncio.run(_collect(calls, max_concurrency=2, timeout=0.1))
+
+    assert results[0][1] is None and isinstance(results[0][2], TimeoutError)
+    assert results[1][1] == {"id": "fast"} and results[1][2] is None
+
+
+def test_tool_result_cache_memory_and_disk(tmp_path):
+    from backend.tool_cache import ToolResultCache
+
+    path = str(tmp_path / "cache.db")
+    ttl = {"calculator": 60, "python_interpreter": 0}
+    cache = ToolResultCache(path=path, ttl=ttl)
+
+    async def scenario():
+        assert await cache.get("calculator", {"expression": "1+1"}) is None
+        await cache.set("calculator", {"expression": "1+1"}, {"expression": "1+1", "result": 2, "error": None})
+        assert (await cache.get("calculator", {"expression": " 1+1 "}))["result"] == 2
+        # 错误结果和 TTL 为 0 的工具不缓存
+        await cache.set("calculator", {"expression": "1/0"}, {"result": None, "error": "division by zero"})
+        assert await cache.get("calculator", {"expression": "1/0"}) is None
+        await cache.set("python_interpreter", {"code": "print(1)"}, {"stdout": "1", "success": True})
+        assert await cache.get("python_interpreter", {"code": "print(1)"}) is None
+
+        # 新实例从磁盘读取
+        fresh = ToolResultCache(path=path, ttl=ttl)
+        assert (await fresh.get("calculator", {"expression": "1+1"}))["result"] == 2
+        return fresh.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["disk_hits"] == 1
+    assert cache.get_stats()["memory_hits"] == 1
+
+
+def test_calculator_supports_function_set():
+    async def run(expr):
+        return await tools.execute_calculator(expr)
+
+    assert asyncio.run(run("2 + 3 * 4"))["result"] == 14
+    assert asyncio.run(run("sqrt(16) + max([1, 5, 3])"))["result"] == 9
+    assert abs(asyncio.run(run("sin(pi / 2)"))["result"] - 1.0) < 1e-9
+    assert asyncio.run(run("round(log10(1000), 2)"))["result"] == 3.0
+
+
+def test_calculator_rejects_unsafe_and_oversized():
+    async def run(expr):
+        return await tools.execute_calculator(expr)
+
+    start = time.monotonic()
+    assert asyncio.run(run("pow(10, 10**9)"))["error"]
+    assert asyncio.run(run("10 ** 10 ** 9"))["error"]
+    assert asyncio.run(run("9" * 800 + " * " + "9" * 800))["error"]
+    assert time.monotonic() - start < 1
+
+    assert asyncio.run(run("__import__('os').system('true')"))["error"]
+    assert asyncio.run(run("(1).__class__"))["error"]
+    assert asyncio.run(run("1 / 0"))["error"]
+    assert asyncio.run(run("+".join(["1"] * 900)))["error"]
+
+
+def test_calculator_bounds_round_and_runs_big_ints_in_subprocess(monkeypatch):
+    async def run(expr):
+        return await tools.execute_calculator(expr)
+
+    start = time.monotonic()
+    assert "round" in asyncio.run(run("round(5, -100000000)"))["error"]
+    assert asyncio.run(run("round(5, 2.5)"))["error"]
+    assert time.monotonic() - start < 1
+    assert asyncio.run(run("round(1234.5678, -2)"))["result"] == 1200.0
+
+    # 大数运算在子进程中计算，结果和错误原样返回
+    assert asyncio.run(run("2 ** 100 + 1"))["result"] == 2 ** 100 + 1
+    assert "过大" in asyncio.run(run("pow(7, 5000)"))["error"]
+    # 超时结束子进程
+    monkeypatch.setattr(tools, "CALCULATOR_TIMEOUT", 0.001)
+    assert "超时" in asyncio.run(run("2 ** 100"))["error"]
+
+
+def test_execute_python_runs_in_killable_subprocess():
+    async def scenario():
+        ok = await tools.execute_python("print(sum(range(10)))", timeout=10)
+        failed = await tools.execute_python("print('partial')\nraise ValueError('bad')", timeout=10)
+        start = time.monotonic()
+        hung = await tools.execute_python("while True:\n    pass", timeout=0.5)
+        hung_elapsed = time.monotonic() - start
+        # 超时的代码不影响后续调用
+        after = await tools.execute_python("print('next')", timeout=10)
+        return ok, failed, hung, hung_elapsed, after
+
+    ok, failed, hung, hung_elapsed, after = asyncio.run(scenario())
+    assert ok["success"] and ok["stdout"] == "45"
+    assert not failed["success"] and failed["stdout"] == "partial" and "ValueError: bad" in failed["stderr"]
+    assert not hung["success"] and "超时" in hung["stderr"] and hung_elapsed < 5
+    assert after["success"] and after["stdout"] == "next"
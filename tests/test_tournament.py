@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+"""比赛编排测试（模型调用和工具使用替身，不访问模型服务和数据库）"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import tools, tournament
+from backend.models import DifficultyLevel, Turn
+
+
+class _RecordingBuffer:
+    """记录每次登记时的比赛状态"""
+
+    def __init__(self):
+        self.statuses = []
+        self.matches = []
+
+    def record(self, match, elo_changes=None, flush=False):
+        self.statuses.append(match.status)
+        self.matches.append(match)
+
+
+class _Router:
+    def plan_match_models(self, prop_model_id, opp_model_id, judges):
+        return judges
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    buffer = _RecordingBuffer()
+    monkeypatch.setattr(tournament, "get_write_buffer", lambda: buffer)
+    monkeypatch.setattr(tournament, "get_provider_router", lambda: _Router())
+    return buffer
+
+
+def _start(**kwargs):
+    params = dict(
+        topic="t", topic_difficulty=DifficultyLevel.MEDIUM, prop_model_id="prop", opp_model_id="opp",
+        prop_personality=None, opp_personality=None, rounds=1, judges=["j"],
+    )
+    params.update(kwargs)
+    return tournament.run_tournament_match(**params)
+
+
+def test_closing_match_cancels_model_and_tool_streams(buffer, monkeypatch):
+    closed = []
+    tool_started = asyncio.Event()
+
+    async def fake_stream(model_id, messages, tools=None, **kwargs):
+        try:
+            if tools:
+                yield {"type": "tool_call", "tool_call": {
+                    "id": "c1", "type": "function", "function": {"name": "web_search", "arguments": {"query": "q"}}
+                }}
+                yield {"type": "done"}
+                return
+            while True:
+                yield {"type": "content", "delta": "论点"}
+                await asyncio.sleep(0.01)
+        finally:
+            closed.append(("model", bool(tools)))
+
+    async def hanging_tool(tool_call):
+        tool_started.set()
+        try:
+            await asyncio.sleep(3600)
+        finally:
+            closed.append(("tool", tool_call["id"]))
+
+    monkeypatch.setattr(tournament, "query_model_stream", fake_stream)
+    monkeypatch.setattr(tools, "execute_tool", hanging_tool)
+
+    async def consume(match):
+        async for _ in match:
+            pass
+
+    async def scenario():
+        # 客户端断开（任务取消）时工具正在执行
+        task = asyncio.create_task(consume(_start(enabled_tools=["web_search"])))
+        await asyncio.wait_for(tool_started.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        cancelled_during_tool = (buffer.statuses[-1], list(closed))
+
+        # 调用方在发言流式输出过程中关闭生成器
+        closed.clear()
+        match = _start()
+        async for event in match:
+            if event["type"] == "turn_delta":
+                break
+        await match.aclose()
+        return cancelled_during_tool, (buffer.statuses[-1], list(closed))
+
+    during_tool, during_stream = asyncio.run(scenario())
+    assert during_tool == ("CANCELLED", [("model", True), ("tool", "c1")])
+    assert during_stream == ("CANCELLED", [("model", False)])
+
+
+def test_stream_with_deadline_raises_and_closes_stream():
+    closed = []
+
+    async def slow_stream():
+        try:
+            yield 1
+            await asyncio.sleep(3600)
+            yield 2
+        finally:
+            closed.append(True)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        items = []
+        start = loop.time()
+        with pytest.raises(TimeoutError):
+            async for item in tournament._stream_with_deadline(slow_stream(), loop.time() + 0.1):
+                items.append(item)
+        return items, loop.time() - start
+
+    items, elapsed = asyncio.run(scenario())
+    assert items == [1] and closed == [True]
+    assert elapsed < 1
+
+
+def _opening_events(match):
+    """收集第 1 轮的事件，第 2 轮或裁判开始前关闭比赛"""
+    async def collect():
+        events = []
+        async for event in match:
+            if event["type"] == "status" and ("裁判" in event["content"] or event["content"].startswith("Round 2")):
+                break
+            events.append(event)
+        await match.aclose()
+        return events
+    return asyncio.run(collect())
+
+
+def test_parallel_openings_interleave_and_keep_proponent_first(buffer, monkeypatch):
+    # 反方输出更快，先完成立论
+    scripts = {"prop": (5, 0.02), "opp": (3, 0.01)}
+
+    async def fake_stream(model_id, messages, tools=None, **kwargs):
+        chunks, delay = scripts[model_id]
+        for i in range(chunks):
+            await asyncio.sleep(delay)
+            yield {"type": "content", "delta": f"{model_id}{i}"}
+        yield {"type": "done"}
+
+    monkeypatch.setattr(tournament, "query_model_stream", fake_stream)
+    events = _opening_events(_start(rounds=2, parallel_openings=True))
+
+    speakers = [e["speaker"] for e in events if e["type"] == "turn_delta"]
+    assert speakers.count("proponent") == 5 and speakers.count("opponent") == 3
+    # 两路增量交错推送，反方的最后一个增量早于正方
+    assert speakers != sorted(speakers, reverse=True)
+    assert max(i for i, s in enumerate(speakers) if s == "opponent") < max(i for i, s in enumerate(speakers) if s == "proponent")
+
+    completed = [e["turn"] for e in events if e["type"] == "turn_complete"]
+    assert [t.speaker_role for t in completed] == ["proponent", "opponent"]
+    assert completed[1].content == "opp0opp1opp2"
+    history = buffer.matches[-1].history
+    assert [t.speaker_role for t in history] == ["proponent", "opponent"]
+
+
+def test_parallel_openings_failed_side_still_yields_other_turn(buffer, monkeypatch):
+    async def fake_stream(model_id, messages, tools=None, **kwargs):
+        await asyncio.sleep(0.01)
+        yield {"type": "content", "delta": f"{model_id}0"}
+        if model_id == "prop":
+            await asyncio.sleep(0.02)
+            raise RuntimeError("connection reset")
+        yield {"type": "done"}
+
+    monkeypatch.setattr(tournament, "query_model_stream", fake_stream)
+    events = _opening_events(_start(rounds=2, parallel_openings=True))
+
+    errors = [e for e in events if e["type"] == "error"]
+    assert len(errors) == 1 and "正方发言出错" in errors[0]["content"]
+    completed = [e["turn"] for e in events if e["type"] == "turn_complete"]
+    assert [t.speaker_role for t in completed] == ["opponent"]
+    # 暂存的反方立论在两路结束后推送
+    assert events.index(errors[0]) < events.index(next(e for e in events if e["type"] == "turn_complete"))
+    assert [t.speaker_role for t in buffer.matches[-1].history] == ["opponent"]
+
+
+def test_single_round_match_ignores_parallel_openings(buffer, monkeypatch):
+    seen = []
+
+    async def fake_stream(model_id, messages, tools=None, **kwargs):
+        seen.append((model_id, " ".join(str(m.get("content")) for m in messages)))
+        yield {"type": "content", "delta": f"{model_id}-argument"}
+        yield {"type": "done"}
+
+    monkeypatch.setattr(tournament, "query_model_stream", fake_stream)
+    events = _opening_events(_start(rounds=1, parallel_openings=True))
+
+    # 只有 1 轮时顺序发言，反方能看到正方的立论
+    assert [e["speaker"] for e in events if e["type"] == "status"] == ["proponent", "opponent"]
+    assert [model_id for model_id, _ in seen] == ["prop", "opp"]
+    assert "prop-argument" in seen[1][1]
+
+
+def test_parallel_openings_check_timeout_before_next_round(buffer, monkeypatch):
+    async def slow_stream(model_id, messages, tools=None, **kwargs):
+        yield {"type": "content", "delta": model_id}
+        await asyncio.sleep(0.3)
+        yield {"type": "done"}
+
+    async def no_outcome(match, elo_changes=None):
+        pass
+
+    monkeypatch.setattr(tournament, "query_model_stream", slow_stream)
+    monkeypatch.setattr(tournament, "record_match_outcome", no_outcome)
+    # 辩论阶段截止时间为 0.2 秒，开篇立论结束时已超时
+    events = _opening_events(_start(rounds=3, parallel_openings=True, timeout_seconds=0.4))
+    assert [e["type"] for e in events[-2:]] == ["timeout", "match_end"] and events[-1]["timeout"]
+    assert not any(e["type"] == "status" and e["content"].startswith("Round 2") for e in events)
+    assert buffer.statuses[-1] == "TIMEOUT"
+
+    async def slow_turn(role, model_id, round_num, **kwargs):
+        await asyncio.sleep(0.3)
+        return Turn(round_number=round_num, speaker_role=role, model_id=model_id, content=role)
+
+    monkeypatch.setattr(tournament, "execute_turn", slow_turn)
+    match, errors = asyncio.run(tournament.run_match_headless(
+        topic="t", topic_difficulty=DifficultyLevel.MEDIUM, prop_model_id="prop", opp_model_id="opp",
+        prop_personality=None, opp_personality=None, rounds=3, judges=["j"],
+        timeout_seconds=0.4, parallel_openings=True,
+    ))
+    assert match.status == "TIMEOUT" and len(match.history) == 2 and errors == []
+
+
+def _turn_events(monkeypatch, script, **config):
+    """
+    用脚本化的模型调用驱动 execute_turn_stream
+
+    script(call_index, messages) 返回该次调用的事件列表，事件为 "sleep" 时一直等待
+    """
+    calls = []
+
+    async def fake_stream(model_id, messages, tools=None, **kwargs):
+        calls.append({"messages": list(messages), "tools": tools})
+        for event in script(len(calls) - 1, messages):
+            if event == "sleep":
+                await asyncio.sleep(3600)
+            yield event
+
+    async def fake_tool(tool_call):
+        return {"expression": "x", "result": "9" * 100, "error": None}
+
+    monkeypatch.setattr(tournament, "query_model_stream", fake_stream)
+    monkeypatch.setattr(tools, "execute_tool", fake_tool)
+    for key, value in config.items():
+        monkeypatch.setitem(tournament.DEBATE_CONFIG, key, value)
+
+    async def collect():
+        return [e async for e in tournament.execute_turn_stream(
+            role="proponent", model_id="prop", personality=tournament.PersonalityType.RATIONAL, topic="t",
+            topic_difficulty=DifficultyLevel.MEDIUM, round_num=1, context=[], is_opening=True,
+            enabled_tools=["calculator"],
+        )]
+    return asyncio.run(collect()), calls
+
+
+def _tool_call_event(call_id: str) -> dict:
+    return {"type": "tool_call", "tool_call": {
+        "id": call_id, "type": "function", "function": {"name": "calculator", "arguments": {"expression": "1+1"}}
+    }}
+
+
+def test_turn_tool_iteration_cap_keeps_tools_and_truncates_output(monkeypatch):
+    def always_calls_tools(index, messages):
+        return [{"type": "content", "delta": f"step{index}"}, _tool_call_event(f"c{index}"), {"type": "done"}]
+
+    events, calls = _turn_events(monkeypatch, always_calls_tools, max_tool_iterations=2, max_tool_output_bytes=10)
+
+    # 上限 2 次工具迭代：共 3 次模型调用，每次都带工具定义，最后一次提示直接作答
+    assert len(calls) == 3 and all(call["tools"] for call in calls)
+    assert calls[2]["messages"][-1]["content"] == tournament._FINAL_STEP_PROMPT
+    assert [e["step"] for e in events if e["type"] == "turn_tool_call"] == [1, 2]
+    turn = events[-1]["turn"]
+    assert turn.content == "step0\n\nstep1\n\nstep2" and len(turn.tool_calls) == 2
+    # 回传模型的工具输出按字节截断
+    tool_message = next(m for m in calls[1]["messages"] if m["role"] == "tool")
+    assert tool_message["content"].startswith("9" * 10) and "已截断 90 字节" in tool_message["content"]
+
+
+def test_turn_error_after_tool_step_keeps_earlier_content(monkeypatch):
+    def fails_on_second_call(index, messages):
+        if index == 0:
+            return [{"type": "content", "delta": "evidence"}, _tool_call_event("c0"), {"type": "done"}]
+        return [{"type": "content", "delta": "partial"}, {"type": "error", "error": "upstream 500"}]
+
+    events, _ = _turn_events(monkeypatch, fails_on_second_call, max_tool_iterations=3)
+    assert [e["type"] for e in events[-2:]] == ["error", "turn_complete"]
+    turn = events[-1]["turn"]
+    assert turn.content == "evidence\n\npartial" and len(turn.tool_calls) == 1
+
+    # 没有任何输出时不产生发言
+    events, _ = _turn_events(monkeypatch, lambda index, messages: [{"type": "error", "error": "down"}])
+    assert [e["type"] for e in events] == ["error"]
+
+
+def test_turn_time_budget_truncates_and_keeps_streamed_content(monkeypatch):
+    def stalls(index, messages):
+        return [{"type": "content", "delta": "opening"}, "sleep"]
+
+    start = time.monotonic()
+    events, _ = _turn_events(monkeypatch, stalls, turn_time_budget=0.2)
+    assert time.monotonic() - start < 2
+    assert "超出时间预算" in events[-2]["content"]
+    assert events[-1]["turn"].content == "opening"
+
+
+def test_truncate_tool_output_respects_utf8_boundaries():
+    assert tournament._truncate_tool_output("short", 10) == "short"
+    truncated = tournament._truncate_tool_output("数据" * 10, 7)
+    assert truncated.startswith("数据\n") and "已截断 53 字节" in truncated
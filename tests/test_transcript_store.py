@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""发言记录压缩存储测试"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend import transcript_store
+from backend.transcript_store import TranscriptStoreError
+
+
+def _transcript(i: int) -> list:
+    return [
+        {"round_number": r, "speaker_role": "proponent", "model_id": "gpt-4o",
+         "content": f"我方认为第 {r} 轮的论点成立，理由如下 {i}", "tool_calls": []}
+        for r in range(1, 4)
+    ]
+
+
+def test_roundtrip_with_trained_dictionary():
+    samples = [transcript_store.serialize_transcript(_transcript(i)) for i in range(20)]
+    dictionary = transcript_store.train_dictionary(samples)
+    assert 0 < len(dictionary) <= transcript_store.MAX_DICTIONARY_SIZE
+
+    plain = transcript_store.compress_transcript(_transcript(99))
+    transcript_store.register_dictionary(9001, dictionary, current=True)
+    try:
+        blob = transcript_store.compress_transcript(_transcript(99))
+        assert transcript_store.blob_dictionary_id(blob) == 9001
+        assert len(blob) < len(plain)
+        assert transcript_store.load_transcript(None, blob) == _transcript(99)
+        # 旧数据（不使用字典或未压缩）仍可读取
+        assert transcript_store.load_transcript(None, plain) == _transcript(99)
+        assert transcript_store.load_transcript(_transcript(1), None) == _transcript(1)
+    finally:
+        transcript_store.register_dictionary(0, b"", current=True)
+
+
+def test_missing_dictionary_is_reported():
+    blob = transcript_store._HEADER.pack(transcript_store.MAGIC, 424242) + b"\x00"
+    assert not transcript_store.has_dictionary(424242)
+    with pytest.raises(TranscriptStoreError):
+        transcript_store.decompress_transcript(blob)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""工具函数测试"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.utils import IncrementalJSONParser, JSONStreamError, parse_json
+
+
+def test_parse_json_strategies():
+    assert parse_json('{"a": 1, "b": [1, 2.5, {"c": "x\\"y"}], "d": true}') == {"a": 1, "b": [1, 2.5, {"c": 'x"y'}], "d": True}
+    assert parse_json('评分如下 {注意}\n```json\n{"winner": "draw"}\n```') == {"winner": "draw"}
+    assert parse_json('[{"x": -1e3}]') == {"x": -1000.0}
+    assert parse_json("no json here") == {}
+    assert parse_json('{"a": 1,, }') == {}
+
+
+def test_incremental_parser_reports_partial_values():
+    src = '```json\n{"scores": {"proponent": {"logic": 8.5, "evidence": 9}}, "winner": "opponent"}\n```'
+    parser = IncrementalJSONParser()
+    seen = []
+    for i in range(0, len(src), 5):
+        seen.extend(parser.feed(src[i:i + 5]))
+
+    assert seen == [
+        (("scores", "proponent", "logic"), 8.5),
+        (("scores", "proponent", "evidence"), 9),
+        (("winner",), "opponent"),
+    ]
+    assert parser.finish()["winner"] == "opponent"
+
+
+def test_incremental_parser_fails_early():
+    parser = IncrementalJSONParser()
+    with pytest.raises(JSONStreamError):
+        parser.feed('{"scores": {"proponent": {"logic": 8.5 "evidence"')
+
+    parser = IncrementalJSONParser()
+    with pytest.raises(JSONStreamError):
+        parser.feed('{"scores": oops')
+
+    parser = IncrementalJSONParser()
+    parser.feed('{"winner": "pro')
+    with pytest.raises(JSONStreamError):
+        parser.finish()
+
+
+def test_sse_encoder_splices_models_and_raw_json():
+    import json
+    from backend.models import JudgeScore
+    from backend.sse import RawJSON, SSEEncoder
+
+    score = JudgeScore(judge_model="gpt-4o", scores={"proponent": {"logic": 8}}, winner="draw", reasoning="平局")
+    encoder = SSEEncoder()
+    frame = encoder.encode({"type": "judge", "score": score, "data": RawJSON(b'{"a":[1]}'), "n": 1})
+    second = encoder.encode({"data": RawJSON(b"[]")}, event_type="raw")
+
+    head, data = frame.decode("utf-8").split("data: ")
+    assert head == "id: 1\nevent: judge\n"
+    assert json.loads(data) == {"type": "judge", "n": 1, "score": score.model_dump(mode="json"), "data": {"a": [1]}}
+    assert second == b'id: 2\nevent: raw\ndata: {"data":[]}\n\n'
+
+
+def test_turn_complete_event_serializes_turn_once(monkeypatch):
+    import json
+    from backend.models import Turn
+    from backend.sse import SSEEncoder
+
+    turn = Turn(round_number=1, speaker_role="proponent", model_id="gpt-4o", content="论点",
+                tool_calls=[{"id": "c1", "function": {"name": "calculator"}}])
+    calls = {"model_dump_json": 0, "model_dump": 0}
+    dump_json, dump = Turn.model_dump_json, Turn.model_dump
+
+    def counting_dump_json(self, *args, **kwargs):
+        calls["model_dump_json"] += 1
+        return dump_json(self, *args, **kwargs)
+
+    def counting_dump(self, *args, **kwargs):
+        calls["model_dump"] += 1
+        return dump(self, *args, **kwargs)
+
+    monkeypatch.setattr(Turn, "model_dump_json", counting_dump_json)
+    monkeypatch.setattr(Turn, "model_dump", counting_dump)
+    frame = SSEEncoder().encode({"type": "turn_complete", "turn": turn})
+
+    # Turn 只经 model_dump_json 编码一次，不经过 dict 中转
+    assert calls == {"model_dump_json": 1, "model_dump": 0}
+    data = json.loads(frame.decode("utf-8").split("data: ", 1)[1])
+    assert data["type"] == "turn_complete"
+    assert data["turn"] == json.loads(dump_json(turn))